@@ -0,0 +1,188 @@
+import asyncio
+import math
+import re
+import time
+from collections import deque
+from typing import Deque, Dict, List, Optional
+
+import orjson
+
+from .config import settings
+from .metrics import admission_rejected, admission_wait
+
+# 准入控制与过载降级：业务路由按优先级分为 critical（开方、发药、挂号、接诊状态变更、开方联想）、
+# normal（未列出的其余接口）与 bulk（列表、导出、流水、批量操作）。
+# - 进程内总并发上限 ADMISSION_MAX_CONCURRENCY（应小于连接池与线程池容量），各级另有并发上限，
+#   normal + bulk 的上限之和小于总上限，其差额只留给 critical；
+# - 占满时请求进入本级的有界等待队列，空出名额时先放行高优先级的排队请求；
+# - 队列已满或排队超过本级期限的请求立即返回 503 并带 Retry-After，不再占用连接与线程。
+# 过载时 bulk 最先被拒，开方与发药仍按接近空载的延迟完成。未开启 ADMISSION_CONTROL 时不做任何限制。
+
+CRITICAL, NORMAL, BULK = "critical", "normal", "bulk"
+PRIORITY = (CRITICAL, NORMAL, BULK)
+
+# (方法, 路由模板) -> 优先级；未列出的 /api 路由为 normal
+ROUTE_CLASSES = {
+    ("POST", "/api/prescriptions"): CRITICAL,
+    ("POST", "/api/prescriptions/{rxid}/dispense"): CRITICAL,
+    ("POST", "/api/patients"): CRITICAL,
+    ("PATCH", "/api/patients/{pid}"): CRITICAL,
+    ("GET", "/api/medications/suggest"): CRITICAL,
+    ("GET", "/api/patients"): BULK,
+    ("GET", "/api/prescriptions"): BULK,
+    ("GET", "/api/export/{entity}"): BULK,
+    ("GET", "/api/inventory/ledger"): BULK,
+    ("GET", "/api/inventory/consumption"): BULK,
+    ("POST", "/api/medications/bulk-adjust"): BULK,
+    ("POST", "/api/prescriptions/bulk-dispense"): BULK,
+}
+# 不受限制的路径：推送长连接；另外 OPTIONS 预检与非 /api 路径（文档、/metrics）也直接放行
+EXEMPT_PATHS = {"/api/events"}
+
+_exact = {k: v for k, v in ROUTE_CLASSES.items() if "{" not in k[1]}
+_patterns = [(method, re.compile("^" + re.sub(r"\{[^}]+\}", "[^/]+", path) + "$"), cls)
+             for (method, path), cls in ROUTE_CLASSES.items() if "{" in path]
+
+
+def classify(method: str, path: str) -> Optional[str]:
+    """返回请求的优先级；None 表示不做准入控制"""
+    if method == "OPTIONS" or not path.startswith("/api/") or path in EXEMPT_PATHS:
+        return None
+    cls = _exact.get((method, path))
+    if cls:
+        return cls
+    for m, pattern, c in _patterns:
+        if m == method and pattern.match(path):
+            return c
+    return NORMAL
+
+
+class Lane:
+    """一个优先级：并发上限、等待队列长度、最长排队秒数"""
+
+    def __init__(self, name: str, limit: int, queue_size: int, wait_seconds: float):
+        self.name = name
+        self.limit = limit
+        self.queue_size = queue_size
+        self.wait_seconds = wait_seconds
+        self.retry_after = str(max(1, math.ceil(wait_seconds)))
+        self.active = 0
+        self.waiters: Deque[asyncio.Future] = deque()
+
+
+def parse_lanes(spec: str) -> Dict[str, Lane]:
+    """解析 ADMISSION_CLASSES，如 critical=24/256/5,normal=16/128/2,bulk=6/32/1"""
+    lanes = {}
+    for part in spec.split(","):
+        name, _, values = part.strip().partition("=")
+        limit, queue_size, wait = values.split("/")
+        lanes[name] = Lane(name, int(limit), int(queue_size), float(wait))
+    missing = set(PRIORITY) - set(lanes)
+    if missing:
+        raise ValueError(f"ADMISSION_CLASSES missing: {', '.join(sorted(missing))}")
+    return lanes
+
+
+class AdmissionController:
+    """单个事件循环内使用，无需加锁"""
+
+    def __init__(self, max_concurrency: int, lanes: Dict[str, Lane]):
+        self.max_concurrency = max_concurrency
+        self.lanes = lanes
+        self.order: List[Lane] = [lanes[name] for name in PRIORITY]
+        self.active = 0
+
+    def _has_room(self, lane: Lane) -> bool:
+        return self.active < self.max_concurrency and lane.active < lane.limit
+
+    def _admit(self, lane: Lane):
+        lane.active += 1
+        self.active += 1
+
+    async def acquire(self, lane: Lane) -> Optional[str]:
+        """取得名额返回 None；被拒时返回原因 queue_full / timeout"""
+        # 同级或更高优先级有可放行的排队请求时不插队
+        ahead = self.order[:self.order.index(lane) + 1]
+        if self._has_room(lane) and not any(l.waiters and l.active < l.limit for l in ahead):
+            self._admit(lane)
+            return None
+        if len(lane.waiters) >= lane.queue_size:
+            return "queue_full"
+
+        loop = asyncio.get_running_loop()
+        fut = loop.create_future()
+        lane.waiters.append(fut)
+        timer = loop.call_later(lane.wait_seconds, self._expire, lane, fut)
+        start = time.perf_counter()
+        try:
+            admitted = await fut
+        except asyncio.CancelledError:
+            # 排队期间客户端断开：已被放行则归还名额
+            if fut.done() and not fut.cancelled() and fut.result():
+                self.release(lane)
+            elif not fut.done():
+                fut.cancel()
+                lane.waiters.remove(fut)
+            raise
+        finally:
+            timer.cancel()
+        admission_wait.observe((lane.name,), time.perf_counter() - start)
+        return None if admitted else "timeout"
+
+    def _expire(self, lane: Lane, fut: asyncio.Future):
+        if not fut.done():
+            fut.set_result(False)
+            lane.waiters.remove(fut)
+
+    def release(self, lane: Lane):
+        lane.active -= 1
+        self.active -= 1
+        self._dispatch()
+
+    def _dispatch(self):
+        """按优先级把空出的名额交给排队请求"""
+        for lane in self.order:
+            while lane.waiters and self._has_room(lane):
+                fut = lane.waiters.popleft()
+                if fut.done():
+                    continue
+                self._admit(lane)
+                fut.set_result(True)
+
+
+class AdmissionMiddleware:
+    """纯 ASGI 中间件；名额在整个响应（含流式导出）发送完毕后归还"""
+
+    def __init__(self, app):
+        self.app = app
+        self.enabled = settings.ADMISSION_CONTROL
+        if self.enabled:
+            self.controller = AdmissionController(settings.ADMISSION_MAX_CONCURRENCY,
+                                                  parse_lanes(settings.ADMISSION_CLASSES))
+
+    async def __call__(self, scope, receive, send):
+        cls = classify(scope["method"], scope["path"]) if self.enabled and scope["type"] == "http" else None
+        if cls is None:
+            return await self.app(scope, receive, send)
+
+        lane = self.controller.lanes[cls]
+        reason = await self.controller.acquire(lane)
+        if reason:
+            admission_rejected.inc((cls, reason))
+            return await _reject(send, lane)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.controller.release(lane)
+
+
+_BUSY = orjson.dumps({"detail": "Server busy, retry later"})
+
+
+async def _reject(send, lane: Lane):
+    await send({"type": "http.response.start", "status": 503, "headers": [
+        (b"content-type", b"application/json"),
+        (b"content-length", str(len(_BUSY)).encode()),
+        (b"retry-after", lane.retry_after.encode()),
+    ]})
+    await send({"type": "http.response.body", "body": _BUSY})
@@ -0,0 +1,119 @@
+import argparse
+from datetime import datetime, timedelta
+from typing import List, Optional
+
+from sqlalchemy import exists, func, literal, or_, select
+from sqlalchemy.orm import Session
+
+from .config import settings
+from .models import (PatientDB, PrescriptionDB, PrescriptionItemDB, TombstoneDB,
+                     PatientArchiveDB, PrescriptionArchiveDB, PrescriptionItemArchiveDB)
+from .sync import next_version
+
+# 冷热分层：已完成且处方均已发药、挂号早于 ARCHIVE_AFTER_DAYS 天的就诊，连同其处方与明细整体迁入归档表，
+# 在线表及其索引只保留近期与未结束的数据。按患者 ID 的历史查询（GET /api/patients/{id}、
+# 带 patient_id 的处方列表）与报表导出透明合并归档表；看板汇总表按天计数，不受归档影响。
+# 归档的患者写入墓碑，检索索引与增量同步客户端据此移除；处方不写墓碑（客户端只持有当日处方）。
+#
+#     python -m backend.archive                 # 按配置的天数归档
+#     python -m backend.archive --days 365 --dry-run
+
+ARCHIVED_PATIENT = "已完成"
+ARCHIVED_PRESCRIPTION = "已发药"
+
+_pt, _px, _item = PatientDB.__table__, PrescriptionDB.__table__, PrescriptionItemDB.__table__
+
+
+def _columns(table) -> List[str]:
+    return [c.name for c in table.columns]
+
+
+def _closed(cutoff: datetime):
+    """可归档患者的条件：已完成、挂号早于截止时间、名下没有未发药或截止后开立的处方"""
+    still_open = exists().where(
+        PrescriptionDB.patient_id == PatientDB.id,
+        or_(PrescriptionDB.status.is_(None), PrescriptionDB.status != ARCHIVED_PRESCRIPTION,
+            PrescriptionDB.created_at >= cutoff),
+    )
+    return (PatientDB.status == ARCHIVED_PATIENT, PatientDB.register_time < cutoff, ~still_open)
+
+
+def candidates(db: Session, cutoff: datetime, limit: int) -> List[str]:
+    # 走 (status, register_time, id) 索引，按挂号时间从旧到新
+    return db.execute(
+        select(PatientDB.id).where(*_closed(cutoff)).order_by(PatientDB.register_time, PatientDB.id).limit(limit)
+    ).scalars().all()
+
+
+def archive_batch(db: Session, cutoff: datetime, limit: int) -> Optional[int]:
+    """迁移一批就诊（不提交），返回迁移的患者数；None 表示已无可归档数据
+
+    本批患者在复核时全部被跳过返回 0，其后可能仍有可归档数据，调用方应提交后继续下一批。
+    """
+    ids = candidates(db, cutoff, limit)
+    if not ids:
+        return None
+    # 锁定患者行后复核条件：挑选与迁移之间被改回未完成、或新开了处方的患者本批跳过
+    db.execute(_pt.update().where(_pt.c.id.in_(ids)).values(status=_pt.c.status))
+    ids = db.execute(select(PatientDB.id).where(PatientDB.id.in_(ids), *_closed(cutoff))).scalars().all()
+    if not ids:
+        return 0
+
+    now = literal(datetime.now(), PatientArchiveDB.archived_at.type)
+    rx_ids = select(_px.c.id).where(_px.c.patient_id.in_(ids)).scalar_subquery()
+    for archive, table, where in (
+        (PatientArchiveDB, _pt, _pt.c.id.in_(ids)),
+        (PrescriptionArchiveDB, _px, _px.c.patient_id.in_(ids)),
+        (PrescriptionItemArchiveDB, _item, _item.c.prescription_id.in_(rx_ids)),
+    ):
+        names, cols = _columns(table), list(table.c)
+        if "archived_at" in archive.__table__.c:
+            names, cols = names + ["archived_at"], cols + [now]
+        db.execute(archive.__table__.insert().from_select(names, select(*cols).where(where)))
+    # 先删明细、再删主单、最后删患者（外键顺序）
+    db.execute(_item.delete().where(_item.c.prescription_id.in_(rx_ids)))
+    db.execute(_px.delete().where(_px.c.patient_id.in_(ids)))
+    db.execute(_pt.delete().where(_pt.c.id.in_(ids)))
+
+    v = next_version(db)
+    db.execute(TombstoneDB.__table__.insert(), [
+        {"entity": "patient", "entity_id": pid, "version": v, "deleted_at": datetime.now()} for pid in ids
+    ])
+    return len(ids)
+
+
+def count_archivable(db: Session, days: int) -> int:
+    cutoff = datetime.now() - timedelta(days=days)
+    return db.execute(select(func.count()).select_from(PatientDB).where(*_closed(cutoff))).scalar()
+
+
+def run(session_factory, days: int, batch: int) -> int:
+    """分批迁移直到没有可归档数据，每批一个事务；返回迁移的患者总数"""
+    cutoff = datetime.now() - timedelta(days=days)
+    total = 0
+    with session_factory() as db:
+        while True:
+            n = archive_batch(db, cutoff, batch)
+            db.commit()
+            if n is None:
+                return total
+            if not n:
+                # 整批复核未通过（被改回未完成或新开了处方）；提交后重新挑选，下一批不再包含这些患者
+                continue
+            total += n
+            print(f"archived {total} visits (registered before {cutoff:%Y-%m-%d})", flush=True)
+
+
+if __name__ == "__main__":
+    from .database import SessionLocal
+
+    parser = argparse.ArgumentParser(description="将已结束的历史就诊迁入归档表")
+    parser.add_argument("--days", type=int, default=settings.ARCHIVE_AFTER_DAYS, help="归档挂号早于该天数的就诊")
+    parser.add_argument("--batch", type=int, default=settings.ARCHIVE_BATCH_SIZE, help="每个事务迁移的患者数")
+    parser.add_argument("--dry-run", action="store_true", help="只统计可归档的患者数")
+    args = parser.parse_args()
+    if args.dry_run:
+        with SessionLocal() as session:
+            print(f"archivable: {count_archivable(session, args.days)} visits")
+    else:
+        print(f"archived: {run(SessionLocal, args.days, args.batch)} visits")
@@ -0,0 +1,181 @@
+from datetime import date, datetime
+from typing import List, Optional
+
+import orjson
+from fastapi import APIRouter, HTTPException, Depends, Body, Query, Request
+from fastapi.responses import StreamingResponse
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .config import settings
+from .database import get_async_db, get_async_read_db, AsyncSessionLocal
+from .models import PatientDB, MedicationDB
+from .schemas import (PatientSchema, MedicationSchema, PrescriptionRead, PrescriptionCreate, InventoryTxnRead,
+                      StockAtRead, ConsumptionRead, BulkResultRead, StatsRead)
+from .pagination import cut_page
+from .serializers import (RawJSONResponse, MEDICATION_FIELDS, parse_fields, patient_rows_json, prescription_rows_json,
+                          ledger_rows_json, page_response)
+from .cache import medication_cache, conditional_json
+from .search import index_patient, search_patients
+from .crud import (PatientFilters, PrescriptionFilters, patient_page_stmt, prescription_page_stmt,
+                   prescription_items_stmt, get_patient, dispense_prescription, adjust_medication_stock)
+from .stats import stats_json
+from .registration import registration_batcher, register_patients, registered
+from .prescribing import prescribe
+from .export import ExportQuery, aiter_export, export_response
+from .inventory import LedgerFilters, ledger_page_stmt, stock_at_json, consumption_json
+from .bulk import (BULK_ADJUST_DOC, BULK_DISPENSE_DOC, read_adjust_lines, read_prescription_ids, run_chunked,
+                   number_lines, adjust_chunk, adjust_key, run_dispense)
+
+# DB_ASYNC 开启时由 main.py 挂载，替换同路径的同步路由；路径、参数与响应保持一致
+router = APIRouter()
+
+# --- 患者管理 ---
+
+@router.get("/api/patients", response_model=List[PatientSchema], tags=["患者管理"], summary="分页查询患者列表")
+async def list_patients(f: PatientFilters = Depends(), db: AsyncSession = Depends(get_async_read_db)):
+    rows = (await db.execute(patient_page_stmt(f))).all()
+    rows, next_cursor = cut_page(rows, f.limit, lambda r: (r.register_time, r.id))
+    return page_response(patient_rows_json(rows, f.fields), next_cursor)
+
+@router.post("/api/patients", tags=["患者管理"], summary="新增患者挂号")
+async def create_patient(p: PatientSchema, db: AsyncSession = Depends(get_async_db)):
+    if settings.REGISTRATION_GROUP_COMMIT:
+        return await registration_batcher.register(p)
+    pt = (await db.run_sync(register_patients, [p], False))[0]
+    await db.commit()
+    index_patient(pt)
+    return registered(pt)
+
+@router.get("/api/patients/search", response_model=List[PatientSchema], tags=["患者管理"], summary="按姓名 / 电话尾号 / 拼音首字母检索患者")
+async def search(q: str = Query(..., min_length=1, max_length=50), limit: int = Query(20, ge=1, le=100),
+                 db: AsyncSession = Depends(get_async_db)):
+    return RawJSONResponse(await db.run_sync(search_patients, q, limit))
+
+@router.get("/api/patients/{pid}", response_model=PatientSchema, tags=["患者管理"], summary="按 ID 查询患者（含已归档）")
+async def get_patient_by_id(pid: str, db: AsyncSession = Depends(get_async_db)):
+    patient = await db.run_sync(get_patient, pid)
+    if patient is None: raise HTTPException(404, "Patient not found")
+    return RawJSONResponse(orjson.dumps(patient))
+
+@router.patch("/api/patients/{pid}", tags=["患者管理"], summary="更新患者信息")
+async def update_patient(pid: str, updates: dict = Body(...), db: AsyncSession = Depends(get_async_db)):
+    db_p = await db.get(PatientDB, pid)
+    if not db_p: raise HTTPException(404, "Patient not found")
+    for k, v in updates.items():
+        if hasattr(db_p, k): setattr(db_p, k, v)
+    await db.commit()
+    if "name" in updates or "phone" in updates:
+        index_patient(db_p)
+    return {"status": "updated"}
+
+# --- 药品与库存 ---
+
+@router.get("/api/medications", response_model=List[MedicationSchema], tags=["药品管理"], summary="获取药品字典")
+async def list_meds(request: Request, db: AsyncSession = Depends(get_async_read_db),
+                    fields: Optional[str] = Query(None, description="只返回这些字段，逗号分隔，如 id,name,stock")):
+    etag, body = await db.run_sync(medication_cache.load, parse_fields(fields, MEDICATION_FIELDS))
+    return conditional_json(request, etag, body)
+
+@router.patch("/api/medications/{mid}", response_model=MedicationSchema, tags=["药品管理"], summary="调整药品库存")
+async def adjust_stock(mid: str, payload: dict = Body(..., example={"change": 50, "kind": "receipt", "note": "供应商到货"}),
+                       db: AsyncSession = Depends(get_async_db)):
+    await db.run_sync(adjust_medication_stock, mid, payload)
+    await db.commit()
+    return await db.get(MedicationDB, mid)
+
+@router.post("/api/medications/bulk-adjust", response_model=BulkResultRead, tags=["药品管理"],
+             summary="批量入库 / 库存调整（JSON 或 CSV）", openapi_extra=BULK_ADJUST_DOC)
+async def bulk_adjust(request: Request, db: AsyncSession = Depends(get_async_db)):
+    lines = number_lines(read_adjust_lines(request.headers.get("content-type", ""), await request.body()))
+    result = await db.run_sync(run_chunked, lines, adjust_chunk, adjust_key)
+    return RawJSONResponse(orjson.dumps(result))
+
+# --- 库存流水与报表 ---
+
+@router.get("/api/inventory/ledger", response_model=List[InventoryTxnRead], tags=["库存流水"], summary="分页查询库存流水")
+async def list_ledger(f: LedgerFilters = Depends(), db: AsyncSession = Depends(get_async_db)):
+    rows = (await db.execute(ledger_page_stmt(f))).all()
+    rows, next_cursor = cut_page(rows, f.limit, lambda r: (r.created_at, r.id))
+    return page_response(ledger_rows_json(rows), next_cursor)
+
+@router.get("/api/inventory/stock-at", response_model=List[StockAtRead], tags=["库存流水"], summary="查询历史时点库存")
+async def get_stock_at(at: datetime = Query(..., description="时点，如 2024-05-01T00:00:00"),
+                       medication_id: Optional[List[str]] = Query(None, description="不传则返回全部药品"),
+                       db: AsyncSession = Depends(get_async_db)):
+    return RawJSONResponse(await db.run_sync(stock_at_json, at, medication_id))
+
+@router.get("/api/inventory/consumption", response_model=List[ConsumptionRead], tags=["库存流水"], summary="区间出入库统计")
+async def get_consumption(date_from: datetime = Query(..., description="起始时间（含）"),
+                          date_to: datetime = Query(..., description="截止时间（不含）"),
+                          db: AsyncSession = Depends(get_async_db)):
+    return RawJSONResponse(await db.run_sync(consumption_json, date_from, date_to))
+
+# --- 统计看板 ---
+
+@router.get("/api/stats", response_model=StatsRead, tags=["统计看板"], summary="挂号 / 处方 / 发药汇总与低库存计数")
+async def get_stats(date_from: Optional[date] = Query(None, description="起始日期（含），默认当天"),
+                    date_to: Optional[date] = Query(None, description="截止日期（含），默认当天"),
+                    top: int = Query(10, ge=1, le=100, description="按金额返回前若干种药品"),
+                    db: AsyncSession = Depends(get_async_db)):
+    # 只读按天汇总表，不扫描患者 / 处方明细
+    today = date.today()
+    return RawJSONResponse(await db.run_sync(stats_json, date_from or today, date_to or today, top))
+
+# --- 处方业务 ---
+
+@router.get("/api/prescriptions", response_model=List[PrescriptionRead], tags=["处方管理"], summary="分页查询处方列表")
+async def list_prescriptions(f: PrescriptionFilters = Depends(), db: AsyncSession = Depends(get_async_read_db)):
+    headers = (await db.execute(prescription_page_stmt(f))).all()
+    headers, next_cursor = cut_page(headers, f.limit, lambda r: (r.created_at, r.id))
+    ids = [h.id for h in headers] if f.with_items else []
+    items = (await db.execute(prescription_items_stmt(ids, archived=bool(f.patient_id)))).all() if ids else []
+    return page_response(prescription_rows_json(headers, items, f.fields), next_cursor)
+
+@router.post("/api/prescriptions", tags=["处方管理"], summary="开立新处方",
+             responses={404: {"description": "患者不存在"},
+                        409: {"description": "处方号已存在；或库存不足、药品不存在、存在禁忌配伍，detail 为校验结果"},
+                        503: {"description": "药物相互作用表不可用"}})
+async def save_prescription(data: PrescriptionCreate, dry_run: bool = Query(False, description="只校验库存与配伍，不写入"),
+                            db: AsyncSession = Depends(get_async_db)):
+    try:
+        res = await db.run_sync(prescribe, data, dry_run)
+        if not dry_run:
+            await db.commit()
+        return res
+    except HTTPException:
+        await db.rollback()
+        raise
+    except Exception as e:
+        await db.rollback()
+        raise HTTPException(500, detail=str(e))
+
+@router.post("/api/prescriptions/{rxid}/dispense", tags=["处方管理"], summary="确认发药",
+             responses={404: {"description": "处方不存在"}, 409: {"description": "库存不足"}})
+async def dispense(rxid: str, db: AsyncSession = Depends(get_async_db)):
+    try:
+        # 发药事务逻辑与同步模式共用，run_sync 在异步驱动上执行，不阻塞事件循环
+        res = await db.run_sync(dispense_prescription, rxid)
+        await db.commit()
+        return res
+    except HTTPException:
+        await db.rollback()
+        raise
+    except SQLAlchemyError as e:
+        await db.rollback()
+        raise HTTPException(500, detail=str(e))
+
+@router.post("/api/prescriptions/bulk-dispense", response_model=BulkResultRead, tags=["处方管理"],
+             summary="批量确认发药", openapi_extra=BULK_DISPENSE_DOC)
+async def bulk_dispense(request: Request, db: AsyncSession = Depends(get_async_db)):
+    ids = read_prescription_ids(await request.body())
+    result = await db.run_sync(run_dispense, ids)
+    return RawJSONResponse(orjson.dumps(result))
+
+# --- 报表导出 ---
+
+@router.get("/api/export/{entity}", tags=["报表导出"], summary="按日期范围流式导出 patients / prescriptions / prescription-items",
+            response_class=StreamingResponse)
+async def export(q: ExportQuery = Depends()):
+    # 生成器自行管理会话与服务端游标，分批编码写出，内存占用与导出范围无关
+    return export_response(aiter_export(AsyncSessionLocal, q), q)
@@ -0,0 +1,153 @@
+import bisect
+import logging
+import threading
+from typing import Dict, List, Optional, Tuple
+
+import orjson
+from sqlalchemy import and_, or_, select
+from sqlalchemy.orm import Session
+
+from .config import settings
+from .events import hub
+from .models import MedicationDB, TombstoneDB
+from .search import name_initials
+from .sync import current_version
+
+logger = logging.getLogger("his.autocomplete")
+
+# 参与前缀匹配的字段，按排序优先级：药名 > 拼音首字母 > 分类 > 规格
+FIELD_NAME, FIELD_ABBR, FIELD_CATEGORY, FIELD_SPEC = range(4)
+# 单次查询最多检查的前缀命中数（单字母等宽泛前缀时生效）
+SCAN_LIMIT = 2000
+MED_FIELDS = ("id", "name", "spec", "stock", "unit", "price", "category")
+
+
+class MedicationAutocomplete:
+    """药品联想输入的前缀索引
+
+    有序数组保存 (键, 字段优先级, 药品 ID)，查询用二分定位前缀区间，不访问数据库。
+    库存随发药 / 库存调整提交后的 medication.stock 事件原地更新；新增药品、改名以及其他
+    worker 的写入由后台线程按版本号增量同步（间隔 MEDICATION_REFRESH_SECONDS）。
+    """
+
+    def __init__(self):
+        self._keys: List[Tuple[str, int, str]] = []
+        self._meds: Dict[str, dict] = {}
+        self._lock = threading.Lock()
+        self._cursor: Tuple[int, str] = (-1, "")
+        self._tomb_version = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.ready = False
+
+    @staticmethod
+    def _entries(med: dict):
+        mid = med["id"]
+        for field, value in ((FIELD_NAME, med["name"]), (FIELD_ABBR, name_initials(med["name"])),
+                             (FIELD_CATEGORY, med["category"]), (FIELD_SPEC, med["spec"])):
+            if value:
+                yield value.lower(), field, mid
+
+    def _apply(self, changed: List[dict], removed: List[str]):
+        """合并一批新增 / 修改 / 删除；只有名称等键字段变化时才重排数组"""
+        with self._lock:
+            rekey = False
+            for pid in removed:
+                rekey |= self._meds.pop(pid, None) is not None
+            for med in changed:
+                old = self._meds.get(med["id"])
+                if old is None or any(old[f] != med[f] for f in ("name", "category", "spec")):
+                    rekey = True
+                self._meds[med["id"]] = med
+            if rekey:
+                # 整体替换引用，查询线程读到的总是完整的旧数组或新数组
+                self._keys = sorted(e for m in self._meds.values() for e in self._entries(m))
+
+    def set_stock(self, mid: str, stock: int):
+        med = self._meds.get(mid)
+        if med is not None:
+            med["stock"] = stock
+
+    def refresh(self, db: Session) -> int:
+        changed = []
+        top = current_version(db)  # 游标只推进到安全高水位，见 sync.current_version
+        while True:
+            v, last_id = self._cursor
+            rows = db.execute(
+                select(*(getattr(MedicationDB, f) for f in MED_FIELDS), MedicationDB.version)
+                .where(or_(MedicationDB.version > v, and_(MedicationDB.version == v, MedicationDB.id > last_id)),
+                       MedicationDB.version <= top)
+                .order_by(MedicationDB.version, MedicationDB.id)
+                .limit(5000)
+            ).all()
+            changed += [{f: getattr(r, f) for f in MED_FIELDS} for r in rows]
+            if rows:
+                self._cursor = (rows[-1].version or 0, rows[-1].id)
+            if len(rows) < 5000:
+                break
+        removed = []
+        for mid, version in db.execute(
+            select(TombstoneDB.entity_id, TombstoneDB.version)
+            .where(TombstoneDB.entity == "medication", TombstoneDB.version > self._tomb_version,
+                   TombstoneDB.version <= top)
+            .order_by(TombstoneDB.version)
+        ):
+            removed.append(mid)
+            self._tomb_version = version
+        if changed or removed:
+            self._apply(changed, removed)
+        self.ready = True
+        return len(changed) + len(removed)
+
+    # --- 后台同步 ---
+
+    def start(self, session_factory):
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, args=(session_factory,),
+                                            name="medication-autocomplete", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self, session_factory):
+        while not self._stop.is_set():
+            try:
+                with session_factory() as db:
+                    self.refresh(db)
+            except Exception:
+                logger.exception("medication autocomplete refresh failed")
+            self._stop.wait(settings.MEDICATION_REFRESH_SECONDS)
+
+    def _on_event(self, message: dict):
+        if message["topic"] == "medication.stock":
+            self.set_stock(message["id"], message["stock"])
+
+    # --- 查询 ---
+
+    def suggest(self, q: str, limit: int) -> List[dict]:
+        q = q.strip().lower()
+        if not q:
+            return []
+        keys, meds = self._keys, self._meds
+        best: Dict[str, Tuple[int, int]] = {}
+        i = bisect.bisect_left(keys, (q,))
+        for key, field, mid in keys[i:i + SCAN_LIMIT]:
+            if not key.startswith(q):
+                break
+            rank = (field, 0 if key == q else 1)
+            if mid not in best or rank < best[mid]:
+                best[mid] = rank
+        # 同等匹配时有货优先，再按名称长度（越短越接近用户输入）
+        ranked = sorted((mid for mid in best if mid in meds),
+                        key=lambda mid: (best[mid], meds[mid]["stock"] <= 0, len(meds[mid]["name"]), meds[mid]["name"]))
+        return [dict(meds[mid]) for mid in ranked[:limit]]
+
+    def suggest_json(self, q: str, limit: int) -> bytes:
+        return orjson.dumps(self.suggest(q, limit))
+
+
+medication_index = MedicationAutocomplete()
+hub.add_listener(medication_index._on_event)
@@ -0,0 +1,269 @@
+import csv
+import io
+from collections import Counter, defaultdict
+from typing import Callable, Dict, List
+
+import orjson
+from fastapi import HTTPException
+from sqlalchemy import case, func, select
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+
+from .config import settings
+from .models import MedicationDB, PrescriptionDB, PrescriptionItemDB, DailyPrescriptionStatDB
+from .sync import stamp
+from .events import queue_event
+from .inventory import DISPENSE, append_txns
+from .crud import parse_adjustment
+from .stats import bump_status, record_dispense
+
+# 批量入库 / 调整与批量发药：请求按 BULK_CHUNK_SIZE 分块，每块一个事务；
+# 块内一次加锁读取、一条 CASE UPDATE 更新库存计数器、一条多行 INSERT 写流水，逐行返回结果。
+# 单行失败（药品不存在、库存不足等）只影响该行；整块 SQL 出错时回滚该块并标记块内各行失败，其余块照常提交。
+
+_med = MedicationDB.__table__
+_px = PrescriptionDB.__table__
+_item = PrescriptionItemDB.__table__
+
+DISPENSED = "已发药"
+
+# 两个接口直接读取原始请求体（以支持 CSV），请求体示例通过 openapi_extra 写入文档
+BULK_ADJUST_DOC = {"requestBody": {"content": {
+    "application/json": {"example": [{"medicationId": "M001", "change": 200, "kind": "receipt", "note": "供应商到货"}]},
+    "text/csv": {"example": "medication_id,change,kind,note\nM001,200,receipt,供应商到货\n"},
+}}}
+BULK_DISPENSE_DOC = {"requestBody": {"content": {"application/json": {"example": {"ids": ["RX001", "RX002"]}}}}}
+
+
+# --- 请求解析 ---
+
+def _int(value):
+    # CSV 单元格为字符串；JSON 中的整数原样保留，其余类型交给 parse_adjustment 报错
+    if isinstance(value, str):
+        try:
+            return int(value.strip())
+        except ValueError:
+            return value
+    return value
+
+
+def read_adjust_lines(content_type: str, body: bytes) -> List[dict]:
+    """解析批量调整请求体，返回 [{"medicationId", "change", "kind", "note"}]
+
+    application/json：行数组，或 {"lines": [...]}；
+    text/csv：首行为表头 medication_id,change,kind,note（kind、note 可省略，兼容 medicationId 写法）。
+    """
+    if "csv" in content_type:
+        try:
+            reader = csv.DictReader(io.StringIO(body.decode("utf-8-sig")))
+            rows = list(reader)
+        except (UnicodeDecodeError, csv.Error) as e:
+            raise HTTPException(400, f"invalid CSV: {e}")
+        if not reader.fieldnames or not {"medication_id", "medicationId"} & set(reader.fieldnames):
+            raise HTTPException(400, "CSV header must include medication_id and change")
+        return [{"medicationId": (r.get("medication_id") or r.get("medicationId") or "").strip(),
+                 "change": _int(r.get("change")), "kind": (r.get("kind") or "").strip() or None,
+                 "note": r.get("note")} for r in rows]
+    try:
+        data = orjson.loads(body)
+    except orjson.JSONDecodeError as e:
+        raise HTTPException(400, f"invalid JSON: {e}")
+    if isinstance(data, dict):
+        data = data.get("lines")
+    if not isinstance(data, list) or not all(isinstance(r, dict) for r in data):
+        raise HTTPException(400, 'body must be a list of lines or {"lines": [...]}')
+    return data
+
+
+def read_prescription_ids(body: bytes) -> List[str]:
+    """解析批量发药请求体：处方 ID 数组，或 {"ids": [...]}"""
+    try:
+        data = orjson.loads(body)
+    except orjson.JSONDecodeError as e:
+        raise HTTPException(400, f"invalid JSON: {e}")
+    if isinstance(data, dict):
+        data = data.get("ids")
+    if not isinstance(data, list) or not all(isinstance(i, str) for i in data):
+        raise HTTPException(400, 'body must be a list of prescription ids or {"ids": [...]}')
+    return data
+
+
+# --- 分块执行 ---
+
+def run_chunked(db: Session, items: List[dict], handler: Callable[[Session, List[dict]], List[dict]],
+                key: Callable[[dict], dict]) -> dict:
+    """按块调用 handler 并逐块提交，汇总逐行结果；异步模式下通过 AsyncSession.run_sync 复用"""
+    results: List[dict] = []
+    size = settings.BULK_CHUNK_SIZE
+    for start in range(0, len(items), size):
+        chunk = items[start:start + size]
+        try:
+            results += handler(db, chunk)
+            db.commit()
+        except SQLAlchemyError as e:
+            db.rollback()
+            error = str(e.orig if getattr(e, "orig", None) is not None else e)
+            results += [{**key(item), "ok": False, "error": error} for item in chunk]
+    return _summary(results)
+
+
+def _summary(results: List[dict]) -> dict:
+    succeeded = sum(1 for r in results if r["ok"])
+    return {"total": len(results), "succeeded": succeeded, "failed": len(results) - succeeded, "results": results}
+
+
+def _lock_medications(db: Session, mids: List[str]) -> Dict[str, tuple]:
+    """对一组药品行加写锁后读取 (库存, 名称)；不存在的药品不在结果中"""
+    if not mids:
+        return {}
+    db.execute(_med.update().where(_med.c.id.in_(mids)).values(stock=_med.c.stock))
+    return {mid: (stock, name) for mid, stock, name in
+            db.execute(select(_med.c.id, _med.c.stock, _med.c.name).where(_med.c.id.in_(mids)))}
+
+
+def _apply_stock(db: Session, start: Dict[str, int], stocks: Dict[str, int], touched, txns: List[dict]) -> int:
+    """一条 CASE UPDATE 写入各药品净变化并追加流水，返回本事务版本号"""
+    touched = sorted(touched)
+    delta = {mid: stocks[mid] - start[mid] for mid in touched}
+    db.execute(_med.update().where(_med.c.id.in_(touched))
+               .values(stock=_med.c.stock + case(delta, value=_med.c.id, else_=0)))
+    append_txns(db, txns)
+    v = stamp(db, MedicationDB, touched)
+    for mid in touched:
+        queue_event(db, "medication.stock", id=mid, stock=stocks[mid], version=v)
+    return v
+
+
+# --- 批量入库 / 调整 ---
+
+def adjust_key(line: dict) -> dict:
+    return {"line": line["line"], "medicationId": line.get("medicationId")}
+
+
+def number_lines(lines: List[dict]) -> List[dict]:
+    # 结果中的 line 为请求中的行序号（从 1 开始，CSV 不含表头）
+    return [{**line, "line": i} for i, line in enumerate(lines, 1)]
+
+
+def adjust_chunk(db: Session, lines: List[dict]) -> List[dict]:
+    """一块库存调整（不提交）；同一药品多行按顺序累计，扣减超过现有库存时截为 0，与单条接口一致"""
+    results = []
+    valid = []
+    for line in lines:
+        try:
+            change, kind, note = parse_adjustment(line)
+            if not isinstance(line.get("medicationId"), str) or not line["medicationId"]:
+                raise ValueError("medicationId is required")
+        except ValueError as e:
+            results.append({**adjust_key(line), "ok": False, "error": str(e)})
+            continue
+        valid.append((line, change, kind, note))
+
+    current = _lock_medications(db, sorted({line["medicationId"] for line, *_ in valid}))
+    stocks = {mid: stock for mid, (stock, _) in current.items()}
+    start = dict(stocks)
+    txns, touched = [], set()
+    for line, change, kind, note in valid:
+        mid = line["medicationId"]
+        if mid not in stocks:
+            results.append({**adjust_key(line), "ok": False, "error": "medication not found"})
+            continue
+        applied = max(-stocks[mid], change)
+        stocks[mid] += applied
+        if applied:
+            touched.add(mid)
+            txns.append({"medication_id": mid, "kind": kind, "quantity": applied,
+                         "balance_after": stocks[mid], "note": note})
+        results.append({**adjust_key(line), "ok": True, "applied": applied, "stock": stocks[mid]})
+    if touched:
+        _apply_stock(db, start, stocks, touched, txns)
+    results.sort(key=lambda r: r["line"])
+    return results
+
+
+# --- 批量发药 ---
+
+def dispense_key(item: dict) -> dict:
+    return {"id": item["id"]}
+
+
+def run_dispense(db: Session, ids: List[str]) -> dict:
+    """批量发药入口：同一处方 ID 在请求中出现多次时只在首次出现处执行，其余位置报告为重复（计入失败）"""
+    unique = list(dict.fromkeys(ids))
+    executed = iter(run_chunked(db, [{"id": rx} for rx in unique], dispense_chunk, dispense_key)["results"])
+    seen, results = set(), []
+    for rx in ids:
+        if rx in seen:
+            results.append({"id": rx, "ok": False, "error": "duplicate id in request"})
+        else:
+            seen.add(rx)
+            results.append(next(executed))
+    return _summary(results)
+
+
+def dispense_chunk(db: Session, items: List[dict]) -> List[dict]:
+    """一块处方发药（不提交），与单条发药语义一致：已发药的处方幂等返回，库存不足的处方整单不发
+
+    加锁顺序同单条发药：先处方行、再药品行（IN 更新按主键顺序加锁），最后取版本号。
+    """
+    ids = [item["id"] for item in items]  # run_dispense 已去重
+    db.execute(_px.update().where(_px.c.id.in_(ids)).values(status=_px.c.status))
+    found = {rx: (st, created) for rx, st, created in
+             db.execute(select(_px.c.id, _px.c.status, _px.c.created_at).where(_px.c.id.in_(ids)))}
+    status = {rx: st for rx, (st, _) in found.items()}
+    pending = [rx for rx in ids if rx in status and status[rx] != DISPENSED]
+
+    lines = defaultdict(list)
+    if pending:
+        for rx, mid, qty in db.execute(
+            select(_item.c.prescription_id, _item.c.medication_id, func.sum(_item.c.quantity))
+            .where(_item.c.prescription_id.in_(pending))
+            .group_by(_item.c.prescription_id, _item.c.medication_id)
+            .order_by(_item.c.prescription_id, _item.c.medication_id)
+        ):
+            lines[rx].append((mid, qty))
+
+    current = _lock_medications(db, sorted({mid for rx_lines in lines.values() for mid, _ in rx_lines}))
+    stocks = {mid: stock for mid, (stock, _) in current.items()}
+    start = dict(stocks)
+    outcome: Dict[str, dict] = {}
+    done, txns, touched = [], [], set()
+    for rx in ids:
+        if rx not in status:
+            outcome[rx] = {"id": rx, "ok": False, "error": "Prescription not found"}
+            continue
+        if status[rx] == DISPENSED:
+            outcome[rx] = {"id": rx, "ok": True, "status": "dispensed", "repeated": True}
+            continue
+        # 字典中已不存在的药品沿用单条发药的逻辑跳过
+        need = [(mid, qty) for mid, qty in lines[rx] if mid in stocks]
+        short = next((mid for mid, qty in need if stocks[mid] < qty), None)
+        if short is not None:
+            outcome[rx] = {"id": rx, "ok": False, "error": f"{current[short][1]} 库存不足"}
+            continue
+        for mid, qty in need:
+            stocks[mid] -= qty
+            touched.add(mid)
+            txns.append({"medication_id": mid, "kind": DISPENSE, "quantity": -qty,
+                         "balance_after": stocks[mid], "prescription_id": rx})
+        done.append(rx)
+        outcome[rx] = {"id": rx, "ok": True, "status": "dispensed"}
+
+    if done:
+        db.execute(_px.update().where(_px.c.id.in_(done)).values(status=DISPENSED))
+        if touched:
+            _apply_stock(db, start, stocks, touched, txns)
+        v = stamp(db, PrescriptionDB, done)
+        for rx in done:
+            queue_event(db, "prescription.dispensed", id=rx, version=v)
+        moves = Counter()
+        for rx in done:
+            created = found[rx][1]
+            if created is None:
+                continue  # 没有开立时间的旧处方不计入状态汇总，与 stats.rebuild 一致
+            day = created.date()
+            moves[day, status[rx]] -= 1
+            moves[day, DISPENSED] += 1
+        bump_status(db, DailyPrescriptionStatDB.__table__, moves)
+        record_dispense(db, ((t["medication_id"], -t["quantity"]) for t in txns))
+    return [outcome[item["id"]] for item in items]
@@ -0,0 +1,80 @@
+import threading
+from typing import Dict, Optional, Sequence, Tuple
+
+from fastapi import Request, Response
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from .compression import note_representation
+from .models import MedicationDB, TombstoneDB
+from .serializers import MEDICATION_COLUMNS, MEDICATION_FIELDS, medication_rows_json, projected_columns
+
+# 每个版本最多缓存的字段投影组合数（?fields= 由客户端决定，需设上限）
+MAX_PROJECTIONS = 16
+
+
+class MedicationCache:
+    """药品字典的进程内序列化缓存
+
+    缓存键取自数据库：药品行与药品墓碑的最大变更版本号（均为索引上的 MAX，单次探测很轻）。
+    发药、库存调整等写操作经 sync.stamp 提升版本号，任何 worker 的写入都会让所有 worker
+    在下一次请求时发现版本变化并重建缓存，无需进程间通知。
+    完整字典与各 ?fields= 投影分别缓存，键为字段元组（完整字典为空元组），版本变化时一并作废。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version: Optional[int] = None
+        self._bodies: Dict[tuple, bytes] = {}
+
+    @staticmethod
+    def probe(db: Session) -> int:
+        med_v = db.execute(select(func.max(MedicationDB.version))).scalar() or 0
+        del_v = db.execute(
+            select(func.max(TombstoneDB.version)).where(TombstoneDB.entity == "medication")
+        ).scalar() or 0
+        return max(med_v, del_v)
+
+    @staticmethod
+    def etag(version: int, fields: tuple) -> str:
+        return f'"med-{version}-{"+".join(fields)}"' if fields else f'"med-{version}"'
+
+    @staticmethod
+    def build(db: Session, fields: tuple) -> bytes:
+        # 按列取行直接编码，与列表接口共用序列化，不构造 ORM 实体与 Pydantic 模型
+        cols = projected_columns(MEDICATION_FIELDS, fields) if fields else MEDICATION_COLUMNS
+        return medication_rows_json(db.execute(select(*cols)).all(), fields)
+
+    def load(self, db: Session, fields: Optional[Sequence[str]] = None) -> Tuple[str, bytes]:
+        """返回 (ETag, JSON 字节)；版本未变时直接复用已序列化的响应体"""
+        key = tuple(fields or ())
+        # 先取版本再读行：期间若有新提交，缓存的行只会更新不会更旧，下次探测会再重建
+        version = self.probe(db)
+        with self._lock:
+            body = self._bodies.get(key)
+            if body is not None and version == self._version:
+                return self.etag(version, key), body
+            # 从复制滞后的只读副本探测到旧版本时，直接返回已缓存的较新版本
+            if body is not None and version < self._version:
+                return self.etag(self._version, key), body
+
+        body = self.build(db, key)
+        with self._lock:
+            if self._version is None or version > self._version:
+                self._version, self._bodies = version, {}
+            if version == self._version and len(self._bodies) < MAX_PROJECTIONS:
+                self._bodies[key] = body
+        return self.etag(version, key), body
+
+
+medication_cache = MedicationCache()
+
+
+def conditional_json(request: Request, etag: str, body: bytes) -> Response:
+    """按 If-None-Match 返回 304 或完整 JSON"""
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    match = request.headers.get("if-none-match")
+    if match and (match.strip() == "*" or etag in [t.strip().removeprefix("W/") for t in match.split(",")]):
+        note_representation(request, "application/json", len(body))
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
@@ -0,0 +1,149 @@
+import zlib
+from typing import Optional
+
+from starlette.datastructures import Headers, MutableHeaders
+
+from .config import settings
+
+try:
+    import brotli
+except ImportError:  # 未安装 brotli 时只协商 gzip
+    brotli = None
+
+# 响应压缩：按 Accept-Encoding 协商 br / gzip，响应体不小于 COMPRESS_MIN_BYTES 时压缩。
+# 一次性响应整体压缩并给出 Content-Length；流式响应（导出）逐块压缩并立即刷出，不缓冲整个响应体。
+# SSE 推送、已编码的响应、304 / 204 与 HEAD 原样透传。实际压缩的响应 ETag 改为弱校验，未压缩的保持强校验；
+# 304 没有响应体，由 conditional_json 经 note_representation 记下对应 200 的类型与长度，按同一规则决定，
+# 同一表示的 200 与 304 给出相同的 ETag。conditional_json 比较时忽略 W/ 前缀，客户端带回的弱 ETag 仍可得到 304。
+
+COMPRESSIBLE = ("application/json", "application/x-ndjson", "text/plain", "text/csv", "text/html")
+GZIP_LEVEL = 5
+# 动态响应取较低质量档，压缩率接近 gzip 9 而耗时更短
+BROTLI_QUALITY = 4
+
+
+def choose_encoding(accept: str) -> Optional[str]:
+    """按 Accept-Encoding 选择编码，优先 br；q=0 视为拒绝"""
+    offered = {}
+    for part in accept.lower().split(","):
+        name, _, params = part.strip().partition(";")
+        q = 1.0
+        if params.strip().startswith("q="):
+            try:
+                q = float(params.strip()[2:])
+            except ValueError:
+                q = 0.0
+        offered[name.strip()] = q
+    for name in (("br", "gzip") if brotli is not None else ("gzip",)):
+        if offered.get(name, offered.get("*", 0)) > 0:
+            return name
+    return None
+
+
+class _Gzip:
+    def __init__(self):
+        self._z = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+
+    def chunk(self, data: bytes) -> bytes:
+        return self._z.compress(data) + self._z.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self, data: bytes = b"") -> bytes:
+        return self._z.compress(data) + self._z.flush()
+
+
+class _Brotli:
+    def __init__(self):
+        self._c = brotli.Compressor(quality=BROTLI_QUALITY)
+
+    def chunk(self, data: bytes) -> bytes:
+        return self._c.process(data) + self._c.flush()
+
+    def finish(self, data: bytes = b"") -> bytes:
+        return self._c.process(data) + self._c.finish()
+
+
+COMPRESSORS = {"gzip": _Gzip, "br": _Brotli}
+
+
+# scope["state"] 中记录 304 所对应表示的键（与 request.state 共用同一字典）
+REPRESENTATION = "compression_representation"
+
+
+def note_representation(request, media_type: str, length: int):
+    """返回 304 前调用：记下完整响应的类型与长度，供压缩层判断 200 是否会被压缩"""
+    request.scope.setdefault("state", {})[REPRESENTATION] = (media_type, length)
+
+
+def _compressible(start: dict) -> bool:
+    if start["status"] < 200 or start["status"] in (204, 304):
+        return False
+    headers = Headers(raw=start["headers"])
+    return "content-encoding" not in headers and headers.get("content-type", "").startswith(COMPRESSIBLE)
+
+
+def _would_compress(scope, min_bytes: int) -> bool:
+    """304 对应的 200 是否会被压缩；未记录表示时按不压缩处理"""
+    media_type, length = (scope.get("state") or {}).get(REPRESENTATION, ("", 0))
+    return media_type.startswith(COMPRESSIBLE) and length >= min_bytes
+
+
+def _weak_etag(start: dict) -> list:
+    headers = MutableHeaders(raw=list(start["headers"]))
+    etag = headers.get("etag")
+    if etag and not etag.startswith("W/"):
+        headers["ETag"] = "W/" + etag
+    return headers.raw
+
+
+class CompressionMiddleware:
+    """纯 ASGI 中间件；响应头延后到第一块响应体到达、确定是否压缩后再发出"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        min_bytes = settings.COMPRESS_MIN_BYTES
+        if scope["type"] != "http" or not min_bytes or scope["method"] == "HEAD":
+            return await self.app(scope, receive, send)
+        encoding = choose_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            return await self.app(scope, receive, send)
+
+        start: Optional[dict] = None
+        compressor = None
+        passthrough = False
+
+        async def send_wrapper(message):
+            nonlocal start, compressor, passthrough
+            if passthrough:
+                return await send(message)
+            if message["type"] == "http.response.start":
+                start = message
+                return
+            if message["type"] != "http.response.body":
+                return await send(message)
+
+            body, more = message.get("body", b""), message.get("more_body", False)
+            if compressor is None:
+                if not _compressible(start) or (not more and len(body) < min_bytes):
+                    passthrough = True
+                    # 304 与同一表示的 200 给出相同的 ETag：只有 200 会被压缩时才改为弱校验
+                    if start["status"] == 304 and _would_compress(scope, min_bytes):
+                        start = {**start, "headers": _weak_etag(start)}
+                    await send(start)
+                    return await send(message)
+                compressor = COMPRESSORS[encoding]()
+                headers = MutableHeaders(raw=_weak_etag(start))
+                headers["Content-Encoding"] = encoding
+                headers.add_vary_header("Accept-Encoding")
+                del headers["Content-Length"]
+                if not more:
+                    body = compressor.finish(body)
+                    headers["Content-Length"] = str(len(body))
+                    await send({**start, "headers": headers.raw})
+                    return await send({"type": "http.response.body", "body": body})
+                await send({**start, "headers": headers.raw})
+            data = compressor.chunk(body) if more else compressor.finish(body)
+            await send({"type": "http.response.body", "body": data, "more_body": more})
+
+        await self.app(scope, receive, send_wrapper)
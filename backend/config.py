@@ -1,7 +1,17 @@
 
 import os
+from typing import List, Tuple
 from pydantic_settings import BaseSettings
 
+
+def to_async_url(url: str) -> str:
+    """将同步驱动替换为对应的异步驱动"""
+    for sync_prefix, async_prefix in (("mysql+pymysql://", "mysql+aiomysql://"), ("sqlite://", "sqlite+aiosqlite://")):
+        if url.startswith(sync_prefix):
+            return async_prefix + url[len(sync_prefix):]
+    return url
+
+
 class Settings(BaseSettings):
     # API 元数据配置
     API_TITLE: str = "Smart-HIS Pro 接口文档"
@@ -15,11 +25,107 @@ class Settings(BaseSettings):
     DB_PORT: str = os.getenv("DB_PORT", "3306")
     DB_NAME: str = os.getenv("DB_NAME", "his_db")
 
+    # 完整连接串，设置后覆盖上面的分项配置（如压测时使用 sqlite:///./bench.db）
+    DATABASE_URL: str = os.getenv("DATABASE_URL", "")
+
     @property
     def database_url(self) -> str:
         """动态构建 SQLAlchemy 连接字符串"""
+        if self.DATABASE_URL:
+            return self.DATABASE_URL
         return f"mysql+pymysql://{self.DB_USER}:{self.DB_PASSWORD}@{self.DB_HOST}:{self.DB_PORT}/{self.DB_NAME}"
 
+    # 异步模式：路由使用 AsyncSession（aiomysql / aiosqlite 驱动），不再占用线程池线程
+    DB_ASYNC: bool = os.getenv("DB_ASYNC", "False").lower() == "true"
+
+    @property
+    def async_database_url(self) -> str:
+        return to_async_url(self.database_url)
+
+    # 连接池：DB_CONNECTION_BUDGET 为本服务在每个数据库实例（主库、每个副本）上可占用的连接总数，应小于 MySQL
+    # max_connections 减去其他客户端的用量；按 WEB_CONCURRENCY（uvicorn worker 进程数，uvicorn 同样读取该变量）
+    # 均分到各进程，再均分到进程内连接同一实例的各个池（异步模式下同步、异步引擎各一个），其中 1/3 常驻、其余为溢出。
+    # 未设置预算时每个池沿用 10 常驻 + 20 溢出；DB_POOL_SIZE / DB_MAX_OVERFLOW 显式设置时优先
+    WEB_CONCURRENCY: int = int(os.getenv("WEB_CONCURRENCY", "1"))
+    DB_CONNECTION_BUDGET: int = int(os.getenv("DB_CONNECTION_BUDGET", "0"))
+    DB_POOL_SIZE: int = int(os.getenv("DB_POOL_SIZE", "0"))
+    DB_MAX_OVERFLOW: int = int(os.getenv("DB_MAX_OVERFLOW", "-1"))
+    # 取连接最长等待秒数，超时抛出错误
+    DB_POOL_TIMEOUT: float = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+    # 连接建立超过该秒数后在下次取出时重建（应小于 MySQL wait_timeout 与中间代理的空闲超时），
+    # 代替每次取连接前的 ping；-1 表示不重建
+    DB_POOL_RECYCLE: int = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+    DB_POOL_PRE_PING: bool = os.getenv("DB_POOL_PRE_PING", "False").lower() == "true"
+
+    def pool_limits(self, pools_per_worker: int = 1) -> Tuple[int, int]:
+        """单个连接池的 (pool_size, max_overflow)"""
+        if self.DB_CONNECTION_BUDGET > 0:
+            share = max(1, self.DB_CONNECTION_BUDGET // (max(1, self.WEB_CONCURRENCY) * pools_per_worker))
+            size, overflow = max(1, share // 3), share - max(1, share // 3)
+        else:
+            size, overflow = 10, 20
+        return (self.DB_POOL_SIZE or size,
+                self.DB_MAX_OVERFLOW if self.DB_MAX_OVERFLOW >= 0 else overflow)
+
+    # 变更版本号在独立的短事务中分配（见 sync 模块），使用单独的小连接池，不计入上面的预算均分；
+    # 分配后超过 SYNC_PENDING_TIMEOUT 秒仍未结束的版本（进程崩溃遗留）在读取同步高水位时清理
+    DB_VERSION_POOL_SIZE: int = int(os.getenv("DB_VERSION_POOL_SIZE", "4"))
+    SYNC_PENDING_TIMEOUT: float = float(os.getenv("SYNC_PENDING_TIMEOUT", "60"))
+
+    # 只读副本连接串，逗号分隔（如 sqlite:///./replica.db）；留空则所有查询走主库
+    READ_REPLICA_URLS: str = os.getenv("READ_REPLICA_URLS", "")
+    # 读己之写：客户端写请求成功后多少秒内的读请求仍走主库，应大于副本的复制延迟
+    REPLICA_STICKY_SECONDS: float = float(os.getenv("REPLICA_STICKY_SECONDS", "5.0"))
+    # 副本健康检查间隔（秒），探测失败的副本摘除、恢复后重新加入
+    REPLICA_HEALTH_SECONDS: float = float(os.getenv("REPLICA_HEALTH_SECONDS", "2.0"))
+
+    @property
+    def replica_urls(self) -> List[str]:
+        return [u.strip() for u in self.READ_REPLICA_URLS.split(",") if u.strip()]
+
+    # 慢请求日志阈值（毫秒），超过时在 his.slow 日志中输出该请求执行的 SQL；0 表示关闭
+    SLOW_REQUEST_MS: int = int(os.getenv("SLOW_REQUEST_MS", "0"))
+
+    # 患者检索索引：快照文件（重启时免全表扫描，留空则不落盘）与跨进程变更的同步间隔（秒）
+    SEARCH_SNAPSHOT_PATH: str = os.getenv("SEARCH_SNAPSHOT_PATH", "patient_search.snapshot")
+    SEARCH_REFRESH_SECONDS: float = float(os.getenv("SEARCH_REFRESH_SECONDS", "1.0"))
+
+    # 药品联想索引从数据库同步新增药品与其他进程库存变更的间隔（秒）
+    MEDICATION_REFRESH_SECONDS: float = float(os.getenv("MEDICATION_REFRESH_SECONDS", "5.0"))
+
+    # 批量入库 / 批量发药每个事务处理的行数
+    BULK_CHUNK_SIZE: int = int(os.getenv("BULK_CHUNK_SIZE", "500"))
+
+    # 挂号合并提交：开启后 POST /api/patients 进入进程内队列，由写线程每 GROUP_COMMIT_WAIT_MS 毫秒或凑满
+    # GROUP_COMMIT_MAX_ROWS 条合并为一个事务写入，并由服务端分配患者 ID（忽略客户端传入的 id）
+    REGISTRATION_GROUP_COMMIT: bool = os.getenv("REGISTRATION_GROUP_COMMIT", "False").lower() == "true"
+    GROUP_COMMIT_WAIT_MS: float = float(os.getenv("GROUP_COMMIT_WAIT_MS", "5"))
+    GROUP_COMMIT_MAX_ROWS: int = int(os.getenv("GROUP_COMMIT_MAX_ROWS", "200"))
+
+    # 准入控制：按路由优先级限制并发，过载时排队超时或队列已满的请求直接返回 503 + Retry-After（见 admission 模块）。
+    # ADMISSION_CLASSES 为各级 并发上限/队列长度/最长排队秒数；总上限应小于单进程连接池容量（见 pool_limits）
+    ADMISSION_CONTROL: bool = os.getenv("ADMISSION_CONTROL", "False").lower() == "true"
+    ADMISSION_MAX_CONCURRENCY: int = int(os.getenv("ADMISSION_MAX_CONCURRENCY", "24"))
+    ADMISSION_CLASSES: str = os.getenv("ADMISSION_CLASSES", "critical=24/256/5,normal=16/128/2,bulk=6/32/1")
+
+    # 响应压缩：响应体不小于该字节数时按 Accept-Encoding 使用 br（需安装 brotli）或 gzip；0 表示关闭
+    COMPRESS_MIN_BYTES: int = int(os.getenv("COMPRESS_MIN_BYTES", "1024"))
+
+    # 开方校验：多少小时内开立且未发药的处方计入库存占用（0 表示只比较当前库存）；相互作用表重载探测间隔（秒）
+    PRESCRIPTION_RESERVE_HOURS: float = float(os.getenv("PRESCRIPTION_RESERVE_HOURS", "24"))
+    INTERACTION_REFRESH_SECONDS: float = float(os.getenv("INTERACTION_REFRESH_SECONDS", "30"))
+
+    # 流式导出每批从服务端游标取回并编码的行数
+    EXPORT_BATCH_SIZE: int = int(os.getenv("EXPORT_BATCH_SIZE", "2000"))
+
+    # 冷热分层：挂号早于该天数且已结束的就诊由 python -m backend.archive 迁入归档表；每个事务迁移的患者数
+    ARCHIVE_AFTER_DAYS: int = int(os.getenv("ARCHIVE_AFTER_DAYS", "180"))
+    ARCHIVE_BATCH_SIZE: int = int(os.getenv("ARCHIVE_BATCH_SIZE", "1000"))
+
+    # 看板低库存阈值，与药库页面的 预警 / 急缺 划分一致
+    LOW_STOCK_WARNING: int = int(os.getenv("LOW_STOCK_WARNING", "100"))
+    LOW_STOCK_CRITICAL: int = int(os.getenv("LOW_STOCK_CRITICAL", "50"))
+
     # 其他系统配置
     DEBUG_MODE: bool = os.getenv("DEBUG_MODE", "True").lower() == "true"
 
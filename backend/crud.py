@@ -0,0 +1,221 @@
+from datetime import date, datetime, time, timedelta
+from typing import List, Optional
+
+from fastapi import HTTPException, Query
+from sqlalchemy import func, select, union_all
+from sqlalchemy.orm import Session
+
+from .models import (PatientDB, MedicationDB, PrescriptionDB, PrescriptionItemDB, DailyPrescriptionStatDB,
+                     PatientArchiveDB, PrescriptionArchiveDB, PrescriptionItemArchiveDB)
+from .pagination import keyset_before
+from .serializers import (PATIENT_COLUMNS, PRESCRIPTION_COLUMNS, PRESCRIPTION_ITEM_COLUMNS, PATIENT_FIELDS,
+                          PRESCRIPTION_FIELDS, patient_row_out, parse_fields, projected_columns)
+from .sync import stamp
+from .events import queue_event
+from .inventory import RECEIPT, ADJUSTMENT, DISPENSE, adjust, append_txns, deduct
+from .stats import bump_status, record_dispense
+
+# 同步路由与异步路由共用的查询构造与事务逻辑，保证两种模式行为一致
+
+
+def day_start(d: date) -> datetime:
+    return datetime.combine(d, time.min)
+
+
+class PatientFilters:
+    """患者列表查询参数"""
+
+    def __init__(
+        self,
+        status: Optional[List[str]] = Query(None, description="仅返回这些状态，可重复传入"),
+        exclude_status: Optional[List[str]] = Query(None, description="排除这些状态，如医生候诊队列排除 已完成"),
+        date_from: Optional[date] = Query(None, description="挂号日期起（含）"),
+        date_to: Optional[date] = Query(None, description="挂号日期止（含）"),
+        department: Optional[str] = Query(None, description="挂号科室"),
+        cursor: Optional[str] = Query(None, description="上一页响应头 X-Next-Cursor 的值"),
+        limit: int = Query(50, ge=1, le=500),
+        fields: Optional[str] = Query(None, description="只返回这些字段，逗号分隔，如候诊队列 id,name,status,queueNo"),
+    ):
+        self.status = status
+        self.exclude_status = exclude_status
+        self.date_from = date_from
+        self.date_to = date_to
+        self.department = department
+        self.cursor = cursor
+        self.limit = limit
+        self.fields = parse_fields(fields, PATIENT_FIELDS)
+
+
+class PrescriptionFilters:
+    """处方列表查询参数"""
+
+    def __init__(
+        self,
+        status: Optional[List[str]] = Query(None, description="仅返回这些状态，如发药台传 已开立"),
+        patient_id: Optional[str] = Query(None),
+        doctor_id: Optional[str] = Query(None),
+        date_from: Optional[date] = Query(None, description="开立日期起（含）"),
+        date_to: Optional[date] = Query(None, description="开立日期止（含）"),
+        cursor: Optional[str] = Query(None, description="上一页响应头 X-Next-Cursor 的值"),
+        limit: int = Query(50, ge=1, le=500),
+        fields: Optional[str] = Query(None, description="只返回这些字段，逗号分隔；不含 medications 时不查询明细"),
+    ):
+        self.status = status
+        self.patient_id = patient_id
+        self.doctor_id = doctor_id
+        self.date_from = date_from
+        self.date_to = date_to
+        self.cursor = cursor
+        self.limit = limit
+        self.fields = parse_fields(fields, PRESCRIPTION_FIELDS)
+
+    @property
+    def with_items(self) -> bool:
+        return not self.fields or "medications" in self.fields
+
+
+def patient_page_stmt(f: PatientFilters):
+    cols = projected_columns(PATIENT_FIELDS, f.fields, (PatientDB.register_time, PatientDB.id)) if f.fields \
+        else PATIENT_COLUMNS
+    stmt = select(*cols)
+    if f.status:
+        stmt = stmt.where(PatientDB.status.in_(f.status))
+    if f.exclude_status:
+        stmt = stmt.where(PatientDB.status.notin_(f.exclude_status))
+    if f.date_from:
+        stmt = stmt.where(PatientDB.register_time >= day_start(f.date_from))
+    if f.date_to:
+        stmt = stmt.where(PatientDB.register_time < day_start(f.date_to + timedelta(days=1)))
+    if f.department:
+        stmt = stmt.where(PatientDB.department == f.department)
+    if f.cursor:
+        stmt = stmt.where(keyset_before(PatientDB.register_time, PatientDB.id, f.cursor))
+    # 多取一行用于判断是否还有下一页
+    return stmt.order_by(PatientDB.register_time.desc(), PatientDB.id.desc()).limit(f.limit + 1)
+
+
+def _prescription_select(model, f: PrescriptionFilters):
+    """按筛选条件查询在线表或归档表（两表列名一致）"""
+    cols = projected_columns(PRESCRIPTION_FIELDS, f.fields, (PrescriptionDB.created_at, PrescriptionDB.id)) \
+        if f.fields else PRESCRIPTION_COLUMNS
+    stmt = select(*(getattr(model, c.key) for c in cols))
+    if f.status:
+        stmt = stmt.where(model.status.in_(f.status))
+    if f.patient_id:
+        stmt = stmt.where(model.patient_id == f.patient_id)
+    if f.doctor_id:
+        stmt = stmt.where(model.doctor_id == f.doctor_id)
+    if f.date_from:
+        stmt = stmt.where(model.created_at >= day_start(f.date_from))
+    if f.date_to:
+        stmt = stmt.where(model.created_at < day_start(f.date_to + timedelta(days=1)))
+    if f.cursor:
+        stmt = stmt.where(keyset_before(model.created_at, model.id, f.cursor))
+    return stmt.order_by(model.created_at.desc(), model.id.desc()).limit(f.limit + 1)
+
+
+def prescription_page_stmt(f: PrescriptionFilters):
+    if not f.patient_id:
+        return _prescription_select(PrescriptionDB, f)
+    # 按患者查询历史时透明合并归档表：两侧各取一页后再整体排序截断
+    # 各自包一层子查询：SQLite 不支持 UNION 分支内直接带 ORDER BY / LIMIT
+    parts = (_prescription_select(m, f).subquery() for m in (PrescriptionDB, PrescriptionArchiveDB))
+    merged = union_all(*(select(*p.c) for p in parts)).subquery()
+    return select(*merged.c).order_by(merged.c.created_at.desc(), merged.c.id.desc()).limit(f.limit + 1)
+
+
+def prescription_items_stmt(rx_ids: List[str], archived: bool = False):
+    # 整页明细用一条 IN 查询批量取回，避免逐单加载的 N+1；archived 时同时查归档明细
+    stmt = select(*PRESCRIPTION_ITEM_COLUMNS).where(PrescriptionItemDB.prescription_id.in_(rx_ids))
+    if not archived:
+        return stmt.order_by(PrescriptionItemDB.id)
+    cols = (getattr(PrescriptionItemArchiveDB, c.key) for c in (*PRESCRIPTION_ITEM_COLUMNS, PrescriptionItemDB.id))
+    merged = union_all(stmt.add_columns(PrescriptionItemDB.id),
+                       select(*cols).where(PrescriptionItemArchiveDB.prescription_id.in_(rx_ids))).subquery()
+    return select(*list(merged.c)[:-1]).order_by(merged.c.id)
+
+
+def get_patient(db: Session, pid: str) -> Optional[dict]:
+    """按 ID 查患者，在线表没有时查归档表"""
+    for model in (PatientDB, PatientArchiveDB):
+        row = db.execute(select(*(getattr(model, c.key) for c in PATIENT_COLUMNS)).where(model.id == pid)).first()
+        if row is not None:
+            return patient_row_out(row)
+    return None
+
+
+def parse_adjustment(payload: dict):
+    """校验一条库存调整，返回 (change, kind, note)；不合法时抛出 ValueError（批量导入逐行复用）"""
+    change = payload.get("change", 0)
+    if not isinstance(change, int) or isinstance(change, bool):
+        raise ValueError("change must be an integer")
+    kind = payload.get("kind") or (RECEIPT if change > 0 else ADJUSTMENT)
+    if kind not in (RECEIPT, ADJUSTMENT):
+        raise ValueError("kind must be receipt or adjustment")
+    return change, kind, payload.get("note") or None
+
+
+def adjust_medication_stock(db: Session, mid: str, payload: dict) -> int:
+    """库存调整事务主体（不提交）：{"change": 50, "kind": "receipt", "note": "..."}
+
+    kind 缺省时增加库存记为入库、减少记为盘点调整；返回调整后的库存。
+    """
+    try:
+        change, kind, note = parse_adjustment(payload)
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+    stock = adjust(db, mid, change, kind, note)
+    if stock is None:
+        raise HTTPException(404)
+    return stock
+
+
+def dispense_prescription(db: Session, rxid: str) -> dict:
+    """发药事务主体（不提交）；异步模式下通过 AsyncSession.run_sync 复用"""
+    px_table = PrescriptionDB.__table__
+
+    # 1. 先锁定处方行再读状态：同一处方的并发/重复发药在此行锁上排队，后到者读到已发药直接幂等返回
+    db.execute(px_table.update().where(px_table.c.id == rxid).values(status=px_table.c.status))
+    px = db.execute(select(px_table.c.status, px_table.c.created_at).where(px_table.c.id == rxid)).first()
+    if px is None:
+        raise HTTPException(404, "Prescription not found")
+    if px.status == "已发药":
+        return {"status": "dispensed", "repeated": True}
+    db.execute(px_table.update().where(px_table.c.id == rxid).values(status="已发药"))
+
+    # 2. 同一药品合并数量，并按药品 ID 排序扣减，所有发药事务以相同顺序加行锁，避免交叉死锁
+    lines = db.execute(
+        select(PrescriptionItemDB.medication_id, func.sum(PrescriptionItemDB.quantity))
+        .where(PrescriptionItemDB.prescription_id == rxid)
+        .group_by(PrescriptionItemDB.medication_id)
+        .order_by(PrescriptionItemDB.medication_id)
+    ).all()
+    deducted = {}
+    for mid, qty in lines:
+        # 单条条件 UPDATE 完成"检查 + 扣减"，不存在读改写的丢失更新
+        if deduct(db, mid, qty):
+            deducted[mid] = qty
+            continue
+        name = db.execute(select(MedicationDB.name).where(MedicationDB.id == mid)).scalar()
+        if name is not None:
+            raise HTTPException(409, f"{name} 库存不足")
+        # 字典中已不存在的药品沿用原逻辑跳过
+
+    # 3. 记库存流水（扣减后的库存行已被本事务锁定，读到的即为本条流水后的结存）
+    stocks = dict(db.execute(
+        select(MedicationDB.id, MedicationDB.stock).where(MedicationDB.id.in_(list(deducted)))
+    ).all()) if deducted else {}
+    append_txns(db, [{"medication_id": mid, "kind": DISPENSE, "quantity": -qty, "balance_after": stocks[mid],
+                      "prescription_id": rxid} for mid, qty in deducted.items()])
+
+    # 4. 业务行写完后再分配版本号并登记推送事件，最后更新看板汇总
+    v = stamp(db, PrescriptionDB, [rxid])
+    stamp(db, MedicationDB, list(deducted))
+    queue_event(db, "prescription.dispensed", id=rxid, version=v)
+    for mid, stock in stocks.items():
+        queue_event(db, "medication.stock", id=mid, stock=stock, version=v)
+    if px.created_at is not None:  # 没有开立时间的旧处方不计入状态汇总，与 stats.rebuild 一致
+        day = px.created_at.date()
+        bump_status(db, DailyPrescriptionStatDB.__table__, {(day, px.status): -1, (day, "已发药"): 1})
+    record_dispense(db, deducted.items())
+    return {"status": "dispensed"}
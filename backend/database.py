@@ -1,20 +1,52 @@
 
-from sqlalchemy import create_engine
+from fastapi import Request
+from sqlalchemy import create_engine, event
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
-from .config import settings
+from .config import settings, to_async_url
+from .metrics import TimedQueuePool, TimedAsyncAdaptedQueuePool, instrument_engine
+from .replicas import Replica, ReplicaSet, RoutingSession, wants_primary, watch_errors
 
 # 从统一配置文件读取连接字符串
 SQLALCHEMY_DATABASE_URL = settings.database_url
 
-engine = create_engine(
+# 每个 worker 进程内连接同一数据库实例的池数：异步模式下同步引擎仍服务后台线程与未改写的路由
+POOLS_PER_WORKER = 2 if settings.DB_ASYNC else 1
+
+def pool_options() -> dict:
+    """按 config 中的连接预算与 worker 数计算连接池参数
+
+    不做取连接前的 ping（每次多一次往返），改为按 DB_POOL_RECYCLE 定时重建连接；数据库重启等断连错误
+    发生时 SQLAlchemy 会作废整个池，之后取出的连接均为新建"""
+    size, overflow = settings.pool_limits(POOLS_PER_WORKER)
+    return dict(pool_size=size, max_overflow=overflow, pool_timeout=settings.DB_POOL_TIMEOUT,
+                pool_recycle=settings.DB_POOL_RECYCLE, pool_pre_ping=settings.DB_POOL_PRE_PING)
+
+def _sync_engine(url: str):
+    return create_engine(
+        url,
+        poolclass=TimedQueuePool,  # 记录取连接等待时间，见 metrics 模块
+        **pool_options(),
+        # SQLite 仅用于本地压测/开发，连接会在线程池线程间传递
+        connect_args={"check_same_thread": False} if url.startswith("sqlite") else {}
+    )
+
+engine = _sync_engine(SQLALCHEMY_DATABASE_URL)
+instrument_engine(engine, "sync")
+
+# 分配变更版本号的短事务专用（见 sync 模块）：写事务持有主池连接时再取连接，共用一个池会在并发写满池时互相等待；
+# 异步模式下同样经此同步连接取号，每个写事务在事件循环线程上多一次短事务
+version_engine = create_engine(
     SQLALCHEMY_DATABASE_URL,
-    pool_pre_ping=True,
-    pool_size=10,
-    max_overflow=20
+    poolclass=TimedQueuePool,
+    pool_size=settings.DB_VERSION_POOL_SIZE, max_overflow=0, pool_timeout=settings.DB_POOL_TIMEOUT,
+    pool_recycle=settings.DB_POOL_RECYCLE,
+    connect_args={"check_same_thread": False} if SQLALCHEMY_DATABASE_URL.startswith("sqlite") else {}
 )
+instrument_engine(version_engine, "version")
 
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# 会话默认绑定主库；只读路由经 get_read_db 传入副本，查询按语句类型路由，见 replicas 模块
+SessionLocal = sessionmaker(class_=RoutingSession, autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
 def get_db():
@@ -23,3 +55,54 @@ def get_db():
         yield db
     finally:
         db.close()
+
+def get_read_db(request: Request):
+    """只读列表路由使用：查询发往健康副本，客户端刚写过（X-Primary-Until 未过期）或无可用副本时走主库"""
+    replica = None if wants_primary(request.headers) else replicas.pick()
+    db = SessionLocal(replica=replica.engine if replica else None)
+    try:
+        yield db
+    finally:
+        db.close()
+
+# 异步引擎仅在 DB_ASYNC 开启时创建，未安装异步驱动时同步模式不受影响
+async_engine = None
+AsyncSessionLocal = None
+if settings.DB_ASYNC:
+    from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+    def _async_engine(url: str):
+        # aiosqlite 默认不使用连接池，显式指定以与同步模式的池化行为保持一致
+        return create_async_engine(
+            url,
+            poolclass=TimedAsyncAdaptedQueuePool,
+            **pool_options()
+        )
+
+    async_engine = _async_engine(settings.async_database_url)
+    instrument_engine(async_engine.sync_engine, "async")
+    # 异步会话不能在提交后隐式懒加载，关闭 expire_on_commit
+    AsyncSessionLocal = async_sessionmaker(async_engine, sync_session_class=RoutingSession,
+                                           autoflush=False, expire_on_commit=False)
+
+def _replica(i: int, url: str) -> Replica:
+    """只读副本：同步引擎始终创建（健康探测使用），异步模式下另建异步引擎"""
+    r = Replica(f"replica{i}", _sync_engine(url))
+    instrument_engine(r.engine, r.name)
+    event.listen(r.engine, "handle_error", watch_errors(r))
+    if settings.DB_ASYNC:
+        r.async_engine = _async_engine(to_async_url(url))
+        instrument_engine(r.async_engine.sync_engine, f"{r.name}-async")
+        event.listen(r.async_engine.sync_engine, "handle_error", watch_errors(r))
+    return r
+
+replicas = ReplicaSet([_replica(i, url) for i, url in enumerate(settings.replica_urls)])
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+async def get_async_read_db(request: Request):
+    replica = None if wants_primary(request.headers) else replicas.pick()
+    async with AsyncSessionLocal(replica=replica.async_engine.sync_engine if replica else None) as db:
+        yield db
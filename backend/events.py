@@ -0,0 +1,151 @@
+import asyncio
+import json
+import threading
+from typing import Callable, Iterable, List, Optional
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+from .models import PatientDB, MedicationDB, PrescriptionDB
+from . import sync  # 确保版本号钩子先于本模块的 after_flush 注册
+
+# 事件主题：订阅方可按完整主题或前缀（如 "patient"）订阅
+TOPICS = (
+    "patient.registered",
+    "patient.status",
+    "prescription.created",
+    "prescription.dispensed",
+    "medication.stock",
+)
+# 通知客户端本地状态可能已丢事件，应通过 /api/sync 补齐
+RESYNC = "resync"
+
+_PENDING_KEY = "pending_events"
+
+
+class Subscription:
+    """单个订阅连接：有界队列 + 所属事件循环"""
+
+    def __init__(self, topics: Optional[Iterable[str]], maxsize: int):
+        self.topics = tuple(topics) if topics else ()
+        self.loop = asyncio.get_running_loop()
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+        self.overflowed = False
+
+    def wants(self, topic: str) -> bool:
+        if not self.topics:
+            return True
+        return any(topic == t or topic.startswith(t + ".") for t in self.topics)
+
+    def _offer(self, message: dict):
+        # 在订阅方事件循环内执行；队列满说明客户端太慢，丢弃积压并要求其重新同步
+        if self.overflowed:
+            return
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            self.overflowed = True
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait({"topic": RESYNC})
+
+    async def get(self) -> dict:
+        message = await self.queue.get()
+        if message.get("topic") == RESYNC:
+            self.overflowed = False
+        return message
+
+
+class EventHub:
+    """进程内事件扇出，不依赖外部消息中间件
+
+    空闲连接只占用一个挂起的协程和一个空队列，单个 worker 可承载数百条长连接。
+    publish 可在线程池线程中调用（同步路由），通过 call_soon_threadsafe 投递到各订阅方循环。
+    多 worker 部署时各进程互不相通，客户端重连后应以 /api/sync 补齐。
+    """
+
+    def __init__(self, queue_size: int = 256):
+        self.queue_size = queue_size
+        self._subs: List[Subscription] = []
+        self._listeners: List[Callable[[dict], None]] = []
+        self._lock = threading.Lock()
+
+    def subscribe(self, topics: Optional[Iterable[str]] = None) -> Subscription:
+        sub = Subscription(topics, self.queue_size)
+        with self._lock:
+            self._subs.append(sub)
+        return sub
+
+    def unsubscribe(self, sub: Subscription):
+        with self._lock:
+            if sub in self._subs:
+                self._subs.remove(sub)
+
+    def add_listener(self, callback: Callable[[dict], None]):
+        """注册进程内同步回调（如本地索引），在发布线程中直接调用，须快速返回"""
+        self._listeners.append(callback)
+
+    @property
+    def subscriber_count(self) -> int:
+        return len(self._subs)
+
+    def publish(self, topic: str, **data):
+        message = {"topic": topic, **data}
+        for callback in self._listeners:
+            callback(message)
+        with self._lock:
+            targets = [s for s in self._subs if s.wants(topic)]
+        for sub in targets:
+            try:
+                sub.loop.call_soon_threadsafe(sub._offer, message)
+            except RuntimeError:
+                # 事件循环已关闭（连接已断开但尚未退订）
+                self.unsubscribe(sub)
+
+
+hub = EventHub()
+
+
+def format_sse(message: dict) -> str:
+    """编码为一条 Server-Sent Events 消息"""
+    return f"event: {message['topic']}\ndata: {json.dumps(message, ensure_ascii=False)}\n\n"
+
+
+def queue_event(db: Session, topic: str, **data):
+    """登记一条事件，待当前事务提交后再广播；回滚则丢弃
+
+    ORM 变更由下方钩子自动登记；绕过 ORM 的 Core 语句需手动调用。
+    """
+    db.info.setdefault(_PENDING_KEY, []).append((topic, data))
+
+
+def _changed(obj, attr: str) -> bool:
+    return inspect(obj).attrs[attr].history.has_changes()
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_events(db: Session, flush_context):
+    # after_flush 时版本号已写入，且属性历史尚未重置
+    for obj in db.new:
+        if isinstance(obj, PatientDB):
+            queue_event(db, "patient.registered", id=obj.id, status=obj.status, version=obj.version)
+        elif isinstance(obj, PrescriptionDB):
+            queue_event(db, "prescription.created", id=obj.id, patientId=obj.patient_id, version=obj.version)
+    for obj in db.dirty:
+        if isinstance(obj, PatientDB) and _changed(obj, "status"):
+            queue_event(db, "patient.status", id=obj.id, status=obj.status, version=obj.version)
+        elif isinstance(obj, PrescriptionDB) and _changed(obj, "status") and obj.status == "已发药":
+            queue_event(db, "prescription.dispensed", id=obj.id, version=obj.version)
+        elif isinstance(obj, MedicationDB) and _changed(obj, "stock"):
+            queue_event(db, "medication.stock", id=obj.id, stock=obj.stock, version=obj.version)
+
+
+@event.listens_for(Session, "after_commit")
+def _publish_events(db: Session):
+    for topic, data in db.info.pop(_PENDING_KEY, []):
+        hub.publish(topic, **data)
+
+
+@event.listens_for(Session, "after_rollback")
+def _drop_events(db: Session):
+    db.info.pop(_PENDING_KEY, None)
@@ -0,0 +1,157 @@
+import csv
+import io
+from datetime import date, timedelta
+from typing import AsyncIterator, Callable, Iterator, List, Tuple
+
+import orjson
+from fastapi import HTTPException, Query
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select
+
+from .config import settings
+from .crud import day_start
+from .models import (PatientDB, PrescriptionDB, PrescriptionItemDB, PatientArchiveDB, PrescriptionArchiveDB,
+                     PrescriptionItemArchiveDB)
+from .serializers import PATIENT_COLUMNS, PRESCRIPTION_COLUMNS, fmt_minute, patient_row_out
+
+# 报表导出：按日期范围流式输出 NDJSON / CSV。
+# 查询以服务端游标（stream_results + yield_per）分批取行，每批编码后立即写出，
+# 进程内同时只持有一批行和一批编码结果，内存占用与导出范围无关。
+# 已归档的就诊一并导出（先归档部分、后在线部分）。
+# 流式响应在路由返回之后才开始迭代，依赖注入的会话此时已关闭，因此由生成器自行打开 / 关闭会话。
+
+FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv; charset=utf-8",
+}
+
+
+def _prescription(r) -> dict:
+    return {"id": r[0], "patientId": r[1], "doctorId": r[2], "createdAt": fmt_minute(r[3]), "status": r[4]}
+
+
+def _item(r) -> dict:
+    return {"prescriptionId": r[0], "createdAt": fmt_minute(r[1]), "medicationId": r[2], "name": r[3],
+            "dosage": r[4], "quantity": r[5]}
+
+
+ITEM_COLUMNS = (
+    PrescriptionItemDB.prescription_id, PrescriptionDB.created_at, PrescriptionItemDB.medication_id,
+    PrescriptionItemDB.med_name, PrescriptionItemDB.dosage, PrescriptionItemDB.quantity,
+)
+
+# 在线表与对应归档表（列名一致）
+_ARCHIVE = {PatientDB: PatientArchiveDB, PrescriptionDB: PrescriptionArchiveDB,
+            PrescriptionItemDB: PrescriptionItemArchiveDB}
+
+
+def _stmt(entity: str, start: date, end: date, archived: bool = False):
+    lo, hi = day_start(start), day_start(end + timedelta(days=1))
+
+    def m(model):
+        return _ARCHIVE[model] if archived else model
+
+    def cols(columns):
+        return [getattr(m(c.class_), c.key) for c in columns]
+
+    pt, px, item = m(PatientDB), m(PrescriptionDB), m(PrescriptionItemDB)
+    if entity == "patients":
+        return (select(*cols(PATIENT_COLUMNS))
+                .where(pt.register_time >= lo, pt.register_time < hi)
+                .order_by(pt.register_time, pt.id))
+    if entity == "prescriptions":
+        return (select(*cols(PRESCRIPTION_COLUMNS))
+                .where(px.created_at >= lo, px.created_at < hi)
+                .order_by(px.created_at, px.id))
+    # 明细按所属处方的开立时间过滤，同一处方的明细连续输出
+    return (select(*cols(ITEM_COLUMNS))
+            .join(px, px.id == item.prescription_id)
+            .where(px.created_at >= lo, px.created_at < hi)
+            .order_by(px.created_at, px.id))
+
+
+# 导出实体 -> (行转换, 字段顺序)
+ENTITIES = {
+    "patients": (patient_row_out, ("id", "name", "age", "gender", "phone", "registerTime", "status", "department",
+                            "symptoms", "diagnosis", "queueNo")),
+    "prescriptions": (_prescription, ("id", "patientId", "doctorId", "createdAt", "status")),
+    "prescription-items": (_item, ("prescriptionId", "createdAt", "medicationId", "name", "dosage", "quantity")),
+}
+
+
+class ExportQuery:
+    """导出查询参数"""
+
+    def __init__(
+        self,
+        entity: str,
+        date_from: date = Query(..., description="起始日期（含）"),
+        date_to: date = Query(..., description="截止日期（含）"),
+        format: str = Query("ndjson", description="ndjson 或 csv"),
+    ):
+        if entity not in ENTITIES:
+            raise HTTPException(404, f"Unknown export: {entity}")
+        if format not in FORMATS:
+            raise HTTPException(400, "format must be ndjson or csv")
+        if date_to < date_from:
+            raise HTTPException(400, "date_to must not be earlier than date_from")
+        self.entity = entity
+        self.date_from = date_from
+        self.date_to = date_to
+        self.format = format
+
+    @property
+    def stmts(self):
+        # 先输出归档部分再输出在线部分，各自按时间有序
+        return [_stmt(self.entity, self.date_from, self.date_to, archived=True),
+                _stmt(self.entity, self.date_from, self.date_to)]
+
+    @property
+    def filename(self) -> str:
+        ext = "csv" if self.format == "csv" else "ndjson"
+        return f"{self.entity}_{self.date_from}_{self.date_to}.{ext}"
+
+
+def _encoder(q: ExportQuery) -> Tuple[bytes, Callable[[List], bytes]]:
+    """返回 (文件头, 一批行 -> 字节)"""
+    convert, fields = ENTITIES[q.entity]
+    if q.format == "ndjson":
+        return b"", lambda rows: b"".join(orjson.dumps(convert(r)) + b"\n" for r in rows)
+
+    def to_csv(rows) -> bytes:
+        buf = io.StringIO()
+        writer = csv.writer(buf)
+        writer.writerows([d[f] for f in fields] for d in map(convert, rows))
+        return buf.getvalue().encode("utf-8")
+    # BOM 让 Excel 按 UTF-8 识别中文
+    return ("\ufeff" + ",".join(fields) + "\r\n").encode("utf-8"), to_csv
+
+
+_STREAM = {"stream_results": True, "yield_per": settings.EXPORT_BATCH_SIZE}
+
+
+def iter_export(session_factory, q: ExportQuery) -> Iterator[bytes]:
+    header, encode = _encoder(q)
+    if header:
+        yield header
+    with session_factory() as db:
+        for stmt in q.stmts:
+            result = db.execute(stmt, execution_options=_STREAM)
+            for rows in result.partitions():
+                yield encode(rows)
+
+
+async def aiter_export(session_factory, q: ExportQuery) -> AsyncIterator[bytes]:
+    header, encode = _encoder(q)
+    if header:
+        yield header
+    async with session_factory() as db:
+        for stmt in q.stmts:
+            result = await db.stream(stmt, execution_options=_STREAM)
+            async for rows in result.partitions():
+                yield encode(rows)
+
+
+def export_response(body, q: ExportQuery) -> StreamingResponse:
+    return StreamingResponse(body, media_type=FORMATS[q.format],
+                             headers={"Content-Disposition": f'attachment; filename="{q.filename}"'})
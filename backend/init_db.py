@@ -1,20 +1,52 @@
 
+import argparse
+import csv
+import json
+import os
+import time
+from datetime import datetime
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from sqlalchemy import select
+
 from .database import engine, Base, SessionLocal
-from .models import DoctorDB, MedicationDB
+from .models import DoctorDB, MedicationDB, SyncCounterDB, DrugInteractionDB
+from . import sync  # 注册变更版本钩子，种子数据同样带版本号
+from .inventory import RECEIPT, append_txns
+from .stats import upsert_replace
+
+# 新建药品的期初库存记一笔入库流水，库存计数器与流水一致，历史库存与出入库报表可从流水推算
+OPENING_NOTE = "期初库存"
+
 
-def init_db():
+def opening_receipts(rows) -> List[dict]:
+    return [{"medication_id": r["id"], "kind": RECEIPT, "quantity": r["stock"], "balance_after": r["stock"],
+             "note": OPENING_NOTE} for r in rows if r["stock"]]
+
+
+def init_db(seed: bool = True):
     # 1. 创建所有表结构
     print("正在创建数据库表结构...")
     Base.metadata.create_all(bind=engine)
-    
+
     # 2. 开启会话进行数据填充
     db = SessionLocal()
     try:
+        # 先初始化增量同步版本计数器，后续种子数据的版本号从这里分配
+        if db.get(SyncCounterDB, 1) is None:
+            db.add(SyncCounterDB(id=1, value=0))
+            db.flush()
+
+        # 指定了导入文件时不写演示数据，避免混入正式字典
+        if not seed:
+            db.commit()
+            return
+
         # 检查并初始化医生数据
         if db.query(DoctorDB).count() == 0:
             print("正在初始化医生基础数据...")
             db.add(DoctorDB(id="DOC001", name="王医生", department="内科", title="主任医师"))
-        
+
         # 检查并初始化药品字典
         if db.query(MedicationDB).count() == 0:
             print("正在初始化药品字典数据...")
@@ -27,7 +59,15 @@ def init_db():
                 MedicationDB(id="M006", name="红霉素软膏", spec="10g:0.1g", stock=30, unit="支", price=8.0, category="皮肤科用药"),
                 MedicationDB(id="M007", name="二甲双胍片", spec="0.5g*30片", stock=200, unit="盒", price=15.6, category="糖尿病药")
             ])
-        
+            db.flush()
+            append_txns(db, opening_receipts({"id": m.id, "stock": m.stock} for m in db.query(MedicationDB)))
+
+        # 检查并初始化药物相互作用示例（开方校验使用）
+        if db.query(DrugInteractionDB).count() == 0:
+            print("正在初始化药物相互作用数据...")
+            db.add(DrugInteractionDB(med_a="M001", med_b="M006", severity="慎用",
+                                     note="杀菌剂与抑菌剂合用可能相互拮抗，降低疗效"))
+
         db.commit()
         print("数据库初始化完成！")
     except Exception as e:
@@ -36,5 +76,257 @@ def init_db():
     finally:
         db.close()
 
+
+# --- 批量导入 ---
+# 上线时导入医院的药品字典（数万行以上）与医生名册：
+#   python -m backend.init_db --medications formulary.csv --doctors doctors.jsonl --interactions ddi.csv
+# - 逐行流式读取 CSV（首行为列名）或 JSONL，每 --chunk 行一个事务，以单条多行 upsert 写入，
+#   内存占用与文件大小无关；
+# - 按主键覆盖字典字段，重复执行结果相同；药品库存只在新建时取文件中的值，并在同一事务内
+#   记一笔期初入库流水；已有药品的库存由库存流水维护，导入不会覆盖；
+# - 每个事务提交后把文件读取位置写入 <文件>.progress，中断后重新执行从断点继续，
+#   --restart 忽略断点从头导入；文件有改动（大小或修改时间变化）时断点失效，从头导入；
+# - 列缺失或格式错误的行跳过并计数，打印前几行的行号与原因。
+
+CHUNK_ROWS = 5000
+MAX_REPORTED = 10
+
+
+class RowError(ValueError):
+    pass
+
+
+def _text(row: dict, name: str, required: bool = False) -> Optional[str]:
+    value = row.get(name)
+    value = "" if value is None else str(value).strip()
+    if required and not value:
+        raise RowError(f"missing {name}")
+    return value or None
+
+
+def _number(row: dict, name: str, kind: type, default):
+    value = row.get(name)
+    if value is None or value == "":
+        return default
+    try:
+        return kind(value)
+    except (TypeError, ValueError):
+        raise RowError(f"invalid {name}: {value!r}")
+
+
+def medication_row(row: dict) -> dict:
+    return {"id": _text(row, "id", True), "name": _text(row, "name", True), "spec": _text(row, "spec"),
+            "unit": _text(row, "unit"), "price": _number(row, "price", float, 0.0),
+            "category": _text(row, "category"), "stock": _number(row, "stock", int, 0)}
+
+
+def doctor_row(row: dict) -> dict:
+    return {"id": _text(row, "id", True), "name": _text(row, "name", True),
+            "department": _text(row, "department"), "title": _text(row, "title")}
+
+
+def interaction_row(row: dict) -> dict:
+    a, b = _text(row, "med_a", True), _text(row, "med_b", True)
+    if a == b:
+        raise RowError("med_a equals med_b")
+    severity = _text(row, "severity", True)
+    if severity not in ("禁忌", "慎用"):
+        raise RowError(f"invalid severity: {severity!r}")
+    a, b = min(a, b), max(a, b)
+    return {"med_a": a, "med_b": b, "severity": severity, "note": _text(row, "note")}
+
+
+def _write_medications(db, rows: List[dict]) -> List[dict]:
+    existing = set(db.execute(select(MedicationDB.id).where(MedicationDB.id.in_([r["id"] for r in rows]))).scalars())
+    upsert_replace(db, MedicationDB.__table__, rows, ("id",), ("name", "spec", "unit", "price", "category"))
+    append_txns(db, opening_receipts(r for r in rows if r["id"] not in existing))
+    # 业务行写入后再取版本号，与在线写入的加锁顺序一致；药品缓存与联想索引据此刷新
+    sync.stamp(db, MedicationDB, [r["id"] for r in rows])
+    return []
+
+
+def _write_doctors(db, rows: List[dict]) -> List[dict]:
+    upsert_replace(db, DoctorDB.__table__, rows, ("id",), ("name", "department", "title"))
+    return []
+
+
+def _write_interactions(db, rows: List[dict]) -> List[dict]:
+    """药品须已存在（外键）；返回被拒绝的行"""
+    meds = {r[k] for r in rows for k in ("med_a", "med_b")}
+    known = set(db.execute(select(MedicationDB.id).where(MedicationDB.id.in_(meds))).scalars())
+    ok = [r for r in rows if r["med_a"] in known and r["med_b"] in known]
+    now = datetime.now()  # 开方校验索引按 updated_at 探测变化
+    upsert_replace(db, DrugInteractionDB.__table__, [{**r, "updated_at": now} for r in ok], ("med_a", "med_b"),
+                   ("severity", "note", "updated_at"))
+    return [r for r in rows if r["med_a"] not in known or r["med_b"] not in known]
+
+
+# 实体 -> (行转换, 主键列, 写入)
+IMPORTS: Dict[str, Tuple[Callable[[dict], dict], Tuple[str, ...], Callable]] = {
+    "doctors": (doctor_row, ("id",), _write_doctors),
+    "medications": (medication_row, ("id",), _write_medications),
+    "interactions": (interaction_row, ("med_a", "med_b"), _write_interactions),
+}
+
+
+def read_records(path: str, offset: int = 0, line: int = 0) -> Iterator[Tuple[int, int, dict]]:
+    """从字节位置 offset（第 line 行之后）开始流式读取，产出 (行号, 读完该行后的字节位置, 记录)"""
+    jsonl = path.lower().endswith((".jsonl", ".ndjson"))
+    if not jsonl and not path.lower().endswith(".csv"):
+        raise SystemExit(f"不支持的文件格式（仅 .csv / .jsonl）: {path}")
+    with open(path, "rb") as f:
+        header = None
+        if not jsonl:
+            first = f.readline()
+            header = next(csv.reader([first.decode("utf-8-sig")]), None)
+            if not header:
+                return
+            header = [h.strip() for h in header]
+            if not offset:
+                offset, line = f.tell(), 1
+        f.seek(offset)
+
+        pos, n = offset, line
+
+        def lines():
+            # 逐行读取并记录位置；CSV 带引号的多行字段由 csv.reader 按需继续取行
+            nonlocal pos, n
+            for raw in iter(f.readline, b""):
+                pos += len(raw)
+                n += 1
+                yield raw.decode("utf-8-sig")  # 兼容带 BOM 的文件
+
+        if jsonl:
+            for text in lines():
+                if not text.strip():
+                    continue
+                try:
+                    record = json.loads(text)
+                except ValueError as e:
+                    record = e
+                yield n, pos, record if isinstance(record, (dict, Exception)) else RowError("not an object")
+        else:
+            for values in csv.reader(lines()):
+                if not any(v.strip() for v in values):
+                    continue
+                yield n, pos, dict(zip(header, values))
+
+
+def _progress_path(path: str) -> str:
+    return path + ".progress"
+
+
+def _fingerprint(path: str, entity: str) -> dict:
+    st = os.stat(path)
+    return {"entity": entity, "size": st.st_size, "mtime": st.st_mtime}
+
+
+def _load_progress(path: str, entity: str) -> Optional[dict]:
+    try:
+        with open(_progress_path(path), encoding="utf-8") as f:
+            progress = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if {k: progress.get(k) for k in ("entity", "size", "mtime")} != _fingerprint(path, entity):
+        print(f"  {path} 在上次导入后有改动，断点失效，从头导入")
+        return None
+    return progress
+
+
+def _save_progress(path: str, progress: dict):
+    # 先写临时文件再替换，写到一半中断也不会留下损坏的断点
+    tmp = _progress_path(path) + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(progress, f)
+    os.replace(tmp, _progress_path(path))
+
+
+def import_file(entity: str, path: str, chunk_size: int = CHUNK_ROWS, restart: bool = False) -> dict:
+    """流式导入一个文件，返回 {"rows": 写入行数, "rejected": 跳过行数}（含断点之前已完成的部分）"""
+    convert, keys, write = IMPORTS[entity]
+    progress = None if restart else _load_progress(path, entity)
+    if progress:
+        print(f"  {entity}: 从断点继续（第 {progress['line']:,} 行之后，已导入 {progress['rows']:,} 行）")
+    else:
+        progress = {**_fingerprint(path, entity), "offset": 0, "line": 0, "rows": 0, "rejected": 0}
+
+    started = time.perf_counter()
+    written = 0
+    reported = 0
+
+    def reject(n: int, reason):
+        nonlocal reported
+        progress["rejected"] += 1
+        if reported < MAX_REPORTED:
+            reported += 1
+            print(f"  {entity} 第 {n} 行跳过: {reason}")
+
+    def flush(batch: Dict[tuple, Tuple[int, dict]], offset: int, line: int):
+        nonlocal written
+        # 同一块内主键重复时以最后一行为准
+        rows = [row for _, row in batch.values()]
+        with SessionLocal() as db:
+            failed = write(db, rows)
+            db.commit()
+        if failed:
+            line_of = {id(row): n for n, row in batch.values()}
+            for row in failed:
+                reject(line_of[id(row)], "medication not found")
+        written += len(rows) - len(failed)
+        progress.update(offset=offset, line=line, rows=progress["rows"] + len(rows) - len(failed))
+        _save_progress(path, progress)
+        rate = written / (time.perf_counter() - started)
+        print(f"  {entity} {progress['rows']:>10,} rows  ({rate:,.0f} rows/s)", flush=True)
+
+    batch: Dict[tuple, Tuple[int, dict]] = {}
+    last = (progress["offset"], progress["line"])
+    for n, pos, record in read_records(path, progress["offset"], progress["line"]):
+        last = (pos, n)
+        try:
+            if isinstance(record, Exception):
+                raise record
+            row = convert(record)
+        except ValueError as e:
+            reject(n, e)
+            continue
+        batch[tuple(row[k] for k in keys)] = (n, row)
+        if len(batch) >= chunk_size:
+            flush(batch, pos, n)
+            batch = {}
+    if batch:
+        flush(batch, *last)
+
+    elapsed = time.perf_counter() - started
+    try:
+        os.remove(_progress_path(path))
+    except FileNotFoundError:
+        pass
+    print(f"{entity}: {progress['rows']:,} rows, {progress['rejected']:,} rejected, "
+          f"{elapsed:.1f}s ({written / elapsed if elapsed else 0:,.0f} rows/s)")
+    return {"rows": progress["rows"], "rejected": progress["rejected"]}
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="创建表结构；不带导入文件时写入演示数据")
+    parser.add_argument("--doctors", help="医生名册 CSV / JSONL：id,name,department,title")
+    parser.add_argument("--medications", help="药品字典 CSV / JSONL：id,name,spec,unit,price,category,stock")
+    parser.add_argument("--interactions", help="药物相互作用 CSV / JSONL：med_a,med_b,severity,note")
+    parser.add_argument("--chunk", type=int, default=CHUNK_ROWS, help="每个写入事务的行数")
+    parser.add_argument("--restart", action="store_true", help="忽略断点，从头导入")
+    return parser
+
+
+def main():
+    args = build_parser().parse_args()
+    # 相互作用引用药品，按 医生 -> 药品 -> 相互作用 的顺序导入
+    files = [(entity, getattr(args, entity)) for entity in IMPORTS if getattr(args, entity)]
+    init_db(seed=not files)
+    for entity, path in files:
+        try:
+            import_file(entity, path, args.chunk, args.restart)
+        except KeyboardInterrupt:
+            raise SystemExit(f"\n{entity} 导入已中断，重新执行同一命令将从断点继续")
+
+
 if __name__ == "__main__":
-    init_db()
+    main()
@@ -0,0 +1,257 @@
+import sys
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import orjson
+from fastapi import Query
+from sqlalchemy import case, func, insert, literal, select
+from sqlalchemy.orm import Session
+
+from .models import MedicationDB, InventoryTxnDB, InventorySnapshotDB
+from .pagination import keyset_before
+from .sync import stamp
+from .events import queue_event
+
+# 库存 = medications.stock 计数器 + 只追加的 inventory_txns 流水 + 定期 inventory_snapshots 快照。
+# 计数器始终以条件 UPDATE 原子增减（不做应用侧读改写），流水与计数器在同一事务内写入；
+# 历史时点库存与出入库报表从最近的快照出发，只读取快照之后（或报表区间两端）的流水。
+
+RECEIPT, DISPENSE, ADJUSTMENT = "receipt", "dispense", "adjustment"
+KINDS = (RECEIPT, DISPENSE, ADJUSTMENT)
+# 快照截止时间比当前时间提前该值，保证截止时间之前开始的写事务都已提交
+SNAPSHOT_GRACE = timedelta(minutes=5)
+
+_med = MedicationDB.__table__
+_txn = InventoryTxnDB.__table__
+_snap = InventorySnapshotDB.__table__
+
+
+# --- 写入 ---
+
+def deduct(db: Session, mid: str, qty: int) -> bool:
+    """库存充足时原子扣减，返回是否成功；检查与扣减在同一条语句中，不会丢失并发更新"""
+    return bool(db.execute(
+        _med.update().where(_med.c.id == mid, _med.c.stock >= qty).values(stock=_med.c.stock - qty)
+    ).rowcount)
+
+
+def _lock_stock(db: Session, mid: str) -> Optional[int]:
+    # 空更新取得行写锁后再读（SQLite 不支持 SELECT ... FOR UPDATE），药品不存在返回 None
+    if not db.execute(_med.update().where(_med.c.id == mid).values(stock=_med.c.stock)).rowcount:
+        return None
+    return db.execute(select(_med.c.stock).where(_med.c.id == mid)).scalar_one()
+
+
+def append_txns(db: Session, rows: List[dict]):
+    """批量追加流水；须在对应库存行已更新（持有行锁）之后调用，created_at 在此取值"""
+    if rows:
+        now = datetime.now()
+        db.execute(insert(InventoryTxnDB), [{"created_at": now, "prescription_id": None, "note": None, **r} for r in rows])
+
+
+def adjust(db: Session, mid: str, change: int, kind: str = ADJUSTMENT, note: Optional[str] = None) -> Optional[int]:
+    """增减单个药品库存并记流水（不提交），返回新库存；药品不存在返回 None
+
+    沿用原接口语义：扣减超过现有库存时截为 0，流水记录实际变化量。
+    """
+    current = _lock_stock(db, mid)
+    if current is None:
+        return None
+    applied = max(-current, change)
+    if not applied:
+        return current
+    db.execute(_med.update().where(_med.c.id == mid).values(stock=_med.c.stock + applied))
+    stock = current + applied
+    append_txns(db, [{"medication_id": mid, "kind": kind, "quantity": applied, "balance_after": stock, "note": note}])
+    v = stamp(db, MedicationDB, [mid])
+    queue_event(db, "medication.stock", id=mid, stock=stock, version=v)
+    return stock
+
+
+# --- 快照 ---
+
+def _period_totals(start: Optional[datetime], end: datetime, inclusive_start: bool = False):
+    """区间内按药品汇总的入库 / 发药 / 调整量子查询；默认区间为 (start, end]"""
+    stmt = select(
+        _txn.c.medication_id,
+        func.sum(case((_txn.c.kind == RECEIPT, _txn.c.quantity), else_=0)).label("received"),
+        func.sum(case((_txn.c.kind == DISPENSE, -_txn.c.quantity), else_=0)).label("dispensed"),
+        func.sum(case((_txn.c.kind == ADJUSTMENT, _txn.c.quantity), else_=0)).label("adjusted"),
+    ).where(_txn.c.created_at <= end)
+    if start is not None:
+        stmt = stmt.where(_txn.c.created_at >= start if inclusive_start else _txn.c.created_at > start)
+    return stmt.group_by(_txn.c.medication_id)
+
+
+def _tail_delta(after: datetime):
+    """after 之后全部流水的净变化量（按药品）"""
+    return (select(_txn.c.medication_id, func.sum(_txn.c.quantity).label("delta"))
+            .where(_txn.c.created_at > after).group_by(_txn.c.medication_id))
+
+
+def take_snapshot(db: Session, now: Optional[datetime] = None) -> Tuple[datetime, int]:
+    """为全部药品写入一期快照（不提交），返回 (截止时间, 写入行数)；距上次快照不足宽限期时跳过
+
+    期末库存 = 当前库存 - 截止时间之后的流水净变化，只扫描截止时间之后的少量流水；
+    本期出入库合计只扫描 (上次截止, 本次截止] 区间。
+    """
+    cutoff = (now or datetime.now()) - SNAPSHOT_GRACE
+    prev = db.execute(select(func.max(_snap.c.taken_at))).scalar()
+    if prev is not None and prev >= cutoff:
+        return prev, 0
+    tail = _tail_delta(cutoff).subquery()
+    period = _period_totals(prev, cutoff).subquery()
+    src = (
+        select(
+            _med.c.id, literal(prev, _snap.c.period_start.type), literal(cutoff, _snap.c.taken_at.type),
+            _med.c.stock - func.coalesce(tail.c.delta, 0),
+            func.coalesce(period.c.received, 0), func.coalesce(period.c.dispensed, 0),
+            func.coalesce(period.c.adjusted, 0),
+        )
+        .select_from(_med)
+        .outerjoin(tail, tail.c.medication_id == _med.c.id)
+        .outerjoin(period, period.c.medication_id == _med.c.id)
+    )
+    res = db.execute(_snap.insert().from_select(
+        ["medication_id", "period_start", "taken_at", "stock", "received", "dispensed", "adjusted"], src))
+    return cutoff, res.rowcount
+
+
+# --- 查询 ---
+
+def stock_at(db: Session, at: datetime, mids: Optional[Iterable[str]] = None) -> Dict[str, int]:
+    """各药品在时刻 at 的库存
+
+    有不晚于 at 的快照时从快照向后累加 (快照截止, at] 的流水；快照之后新增的药品及没有快照时，
+    从当前库存向前扣除 at 之后的流水。两种方式都只读取有限区间的流水。
+    """
+    mids = list(mids) if mids is not None else None
+    result: Dict[str, int] = {}
+    snap_time = db.execute(select(func.max(_snap.c.taken_at)).where(_snap.c.taken_at <= at)).scalar()
+    if snap_time is not None:
+        delta = (select(_txn.c.medication_id, func.sum(_txn.c.quantity).label("delta"))
+                 .where(_txn.c.created_at > snap_time, _txn.c.created_at <= at)
+                 .group_by(_txn.c.medication_id).subquery())
+        stmt = (select(_snap.c.medication_id, _snap.c.stock + func.coalesce(delta.c.delta, 0))
+                .outerjoin(delta, delta.c.medication_id == _snap.c.medication_id)
+                .where(_snap.c.taken_at == snap_time))
+        if mids is not None:
+            stmt = stmt.where(_snap.c.medication_id.in_(mids))
+        result.update(db.execute(stmt).all())
+
+    missing = None if mids is None else [m for m in mids if m not in result]
+    if missing is None or missing:
+        tail = _tail_delta(at).subquery()
+        stmt = (select(_med.c.id, _med.c.stock - func.coalesce(tail.c.delta, 0))
+                .outerjoin(tail, tail.c.medication_id == _med.c.id))
+        if missing is not None:
+            stmt = stmt.where(_med.c.id.in_(missing))
+        elif result:
+            stmt = stmt.where(_med.c.id.notin_(list(result)))
+        result.update(db.execute(stmt).all())
+    return result
+
+
+def consumption(db: Session, start: datetime, end: datetime) -> Dict[str, Dict[str, int]]:
+    """[start, end) 内各药品的入库 / 发药 / 调整合计
+
+    完全落在区间内的快照期直接累加快照行，只对区间两端未被快照覆盖的部分读取流水。
+    """
+    totals: Dict[str, Dict[str, int]] = {}
+
+    def add(rows):
+        for mid, received, dispensed, adjusted in rows:
+            t = totals.setdefault(mid, {"received": 0, "dispensed": 0, "adjusted": 0})
+            t["received"] += received or 0
+            t["dispensed"] += dispensed or 0
+            t["adjusted"] += adjusted or 0
+
+    covered = db.execute(
+        select(func.min(_snap.c.period_start), func.max(_snap.c.taken_at))
+        .where(_snap.c.period_start >= start, _snap.c.taken_at < end)
+    ).one()
+    if covered[0] is None:
+        add(db.execute(_period_totals(start, end, inclusive_start=True).where(_txn.c.created_at < end)).all())
+        return totals
+
+    first, last = covered
+    add(db.execute(
+        select(_snap.c.medication_id, func.sum(_snap.c.received), func.sum(_snap.c.dispensed),
+               func.sum(_snap.c.adjusted))
+        .where(_snap.c.period_start >= first, _snap.c.taken_at <= last)
+        .group_by(_snap.c.medication_id)
+    ).all())
+    # 快照期为 (period_start, taken_at]，两端补读 [start, first] 与 (last, end)
+    add(db.execute(_period_totals(start, first, inclusive_start=True)).all())
+    add(db.execute(_period_totals(last, end).where(_txn.c.created_at < end)).all())
+    # 快照包含区间内无变动的药品，去掉全零项与纯流水统计的结果保持一致
+    return {mid: t for mid, t in totals.items() if any(t.values())}
+
+
+class LedgerFilters:
+    """库存流水查询参数"""
+
+    def __init__(
+        self,
+        medication_id: Optional[str] = Query(None),
+        kind: Optional[str] = Query(None, description="receipt / dispense / adjustment"),
+        prescription_id: Optional[str] = Query(None),
+        date_from: Optional[datetime] = Query(None, description="起始时间（含）"),
+        date_to: Optional[datetime] = Query(None, description="截止时间（不含）"),
+        cursor: Optional[str] = Query(None, description="上一页响应头 X-Next-Cursor 的值"),
+        limit: int = Query(100, ge=1, le=1000),
+    ):
+        self.medication_id = medication_id
+        self.kind = kind
+        self.prescription_id = prescription_id
+        self.date_from = date_from
+        self.date_to = date_to
+        self.cursor = cursor
+        self.limit = limit
+
+
+LEDGER_COLUMNS = (
+    InventoryTxnDB.id, InventoryTxnDB.medication_id, InventoryTxnDB.kind, InventoryTxnDB.quantity,
+    InventoryTxnDB.balance_after, InventoryTxnDB.prescription_id, InventoryTxnDB.note, InventoryTxnDB.created_at,
+)
+
+
+def ledger_page_stmt(f: LedgerFilters):
+    stmt = select(*LEDGER_COLUMNS)
+    if f.medication_id:
+        stmt = stmt.where(InventoryTxnDB.medication_id == f.medication_id)
+    if f.kind:
+        stmt = stmt.where(InventoryTxnDB.kind == f.kind)
+    if f.prescription_id:
+        stmt = stmt.where(InventoryTxnDB.prescription_id == f.prescription_id)
+    if f.date_from:
+        stmt = stmt.where(InventoryTxnDB.created_at >= f.date_from)
+    if f.date_to:
+        stmt = stmt.where(InventoryTxnDB.created_at < f.date_to)
+    if f.cursor:
+        stmt = stmt.where(keyset_before(InventoryTxnDB.created_at, InventoryTxnDB.id, f.cursor, key_type=int))
+    return stmt.order_by(InventoryTxnDB.created_at.desc(), InventoryTxnDB.id.desc()).limit(f.limit + 1)
+
+
+def stock_at_json(db: Session, at: datetime, mids: Optional[List[str]]) -> bytes:
+    """stock_at 结果 -> StockAtRead 列表 JSON"""
+    return orjson.dumps([{"medicationId": mid, "stock": stock} for mid, stock in sorted(stock_at(db, at, mids).items())])
+
+
+def consumption_json(db: Session, start: datetime, end: datetime) -> bytes:
+    """consumption 结果 -> ConsumptionRead 列表 JSON，按发药量降序"""
+    totals = consumption(db, start, end)
+    return orjson.dumps([{"medicationId": mid, **t}
+                         for mid, t in sorted(totals.items(), key=lambda kv: (-kv[1]["dispensed"], kv[0]))])
+
+
+if __name__ == "__main__":
+    # 定时任务入口（如每日凌晨）：python -m backend.inventory snapshot
+    from .database import SessionLocal
+
+    if sys.argv[1:] != ["snapshot"]:
+        raise SystemExit("usage: python -m backend.inventory snapshot")
+    with SessionLocal() as session:
+        taken_at, count = take_snapshot(session)
+        session.commit()
+    print(f"inventory snapshot at {taken_at:%Y-%m-%d %H:%M:%S}: {count} rows")
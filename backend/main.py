@@ -1,52 +1,105 @@
 
-from fastapi import FastAPI, HTTPException, Depends, Body
+from fastapi import FastAPI, HTTPException, Depends, Body, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
-from sqlalchemy.orm import Session
-from typing import List
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import ORJSONResponse, PlainTextResponse, StreamingResponse
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session, selectinload
+from typing import List, Optional
+from datetime import date, datetime
+import asyncio
+import orjson
 import uvicorn
 
-from .database import get_db
-from .models import PatientDB, MedicationDB, PrescriptionDB, PrescriptionItemDB
-from .schemas import PatientSchema, MedicationSchema, PrescriptionRead, PrescriptionCreate
+from .database import get_db, get_read_db, async_engine, SessionLocal, replicas
+from .replicas import PRIMARY_UNTIL_HEADER, StickyPrimaryMiddleware
+from .admission import AdmissionMiddleware
+from .compression import CompressionMiddleware
+from .models import PatientDB, MedicationDB, PrescriptionDB, TombstoneDB
+from .schemas import (PatientSchema, MedicationSchema, PrescriptionRead, PrescriptionCreate, SyncRead,
+                      InventoryTxnRead, StockAtRead, ConsumptionRead, BulkResultRead, StatsRead)
+from .sync import current_version, page_end
+from .events import TOPICS, hub, format_sse
 from .config import settings
+from .pagination import NEXT_CURSOR_HEADER, cut_page
+from .serializers import (RawJSONResponse, MEDICATION_FIELDS, parse_fields, patient_out, prescription_out,
+                          patient_rows_json, prescription_rows_json, ledger_rows_json, page_response)
+from .cache import medication_cache, conditional_json
+from .metrics import MetricsMiddleware, render as render_metrics
+from .search import patient_index, index_patient, search_patients
+from .autocomplete import medication_index
+from .crud import (PatientFilters, PrescriptionFilters, patient_page_stmt, prescription_page_stmt,
+                   prescription_items_stmt, get_patient, dispense_prescription, adjust_medication_stock)
+from .stats import stats_json
+from .registration import registration_batcher, register_one
+from .prescribing import interaction_index, prescribe
+from .export import ExportQuery, iter_export, export_response
+from .inventory import LedgerFilters, ledger_page_stmt, stock_at_json, consumption_json
+from .bulk import (BULK_ADJUST_DOC, BULK_DISPENSE_DOC, read_adjust_lines, read_prescription_ids, run_chunked,
+                   number_lines, adjust_chunk, adjust_key, run_dispense)
 
 # 使用配置模块中的元数据初始化 FastAPI
 app = FastAPI(
     title=settings.API_TITLE,
     description=settings.API_DESCRIPTION,
     version=settings.API_VERSION,
+    # 其余返回 dict 的路由也改用 orjson 编码
+    default_response_class=ORJSONResponse,
     contact={
         "name": "HIS 系统管理员",
         "url": "http://localhost:3000",
     },
 )
 
+# 列表与导出响应按 Accept-Encoding 压缩
+app.add_middleware(CompressionMiddleware)
+# 按路由优先级准入，过载时先拒绝批量读；位于 CORS 之内，503 响应同样带跨域头
+app.add_middleware(AdmissionMiddleware)
+# 写请求成功后下发读主库的截止时间（读己之写），见 replicas 模块
+app.add_middleware(StickyPrimaryMiddleware)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER, "ETag", PRIMARY_UNTIL_HEADER, "Retry-After"],
 )
+# 最后添加的中间件位于最外层，计时覆盖 CORS 处理
+app.add_middleware(MetricsMiddleware)
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    # Prometheus 文本格式：请求延迟、每请求 SQL 数 / 耗时 / 行数、连接池等待与占用
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
 
 # --- 患者管理 ---
 
 @app.get("/api/patients", 
          response_model=List[PatientSchema], 
          tags=["患者管理"],
-         summary="获取所有患者列表")
-def list_patients(db: Session = Depends(get_db)):
-    pts = db.query(PatientDB).order_by(PatientDB.register_time.desc()).all()
-    return [{**p.__dict__, "registerTime": p.register_time.strftime("%Y-%m-%d %H:%M")} for p in pts]
+         summary="分页查询患者列表")
+def list_patients(f: PatientFilters = Depends(), db: Session = Depends(get_read_db)):
+    rows = (db.execute(patient_page_stmt(f))).all()
+    rows, next_cursor = cut_page(rows, f.limit, lambda r: (r.register_time, r.id))
+    return page_response(patient_rows_json(rows, f.fields), next_cursor)
 
 @app.post("/api/patients", tags=["患者管理"], summary="新增患者挂号")
-def create_patient(p: PatientSchema, db: Session = Depends(get_db)):
-    db_p = PatientDB(
-        id=p.id, name=p.name, age=p.age, gender=p.gender, 
-        phone=p.phone, status=p.status
-    )
-    db.add(db_p)
-    db.commit()
-    return {"status": "ok"}
+async def create_patient(p: PatientSchema, db: Session = Depends(get_db)):
+    # 返回患者 ID 与当日挂号序号；开启合并提交时 ID 由服务端分配
+    if settings.REGISTRATION_GROUP_COMMIT:
+        return await registration_batcher.register(p)
+    return await run_in_threadpool(register_one, db, p)
+
+@app.get("/api/patients/search", response_model=List[PatientSchema], tags=["患者管理"], summary="按姓名 / 电话尾号 / 拼音首字母检索患者")
+def search(q: str = Query(..., min_length=1, max_length=50), limit: int = Query(20, ge=1, le=100),
+           db: Session = Depends(get_db)):
+    return RawJSONResponse(search_patients(db, q, limit))
+
+@app.get("/api/patients/{pid}", response_model=PatientSchema, tags=["患者管理"], summary="按 ID 查询患者（含已归档）")
+def get_patient_by_id(pid: str, db: Session = Depends(get_db)):
+    patient = get_patient(db, pid)
+    if patient is None: raise HTTPException(404, "Patient not found")
+    return RawJSONResponse(orjson.dumps(patient))
 
 @app.patch("/api/patients/{pid}", tags=["患者管理"], summary="更新患者信息")
 def update_patient(pid: str, updates: dict = Body(...), db: Session = Depends(get_db)):
@@ -55,77 +108,225 @@ def update_patient(pid: str, updates: dict = Body(...), db: Session = Depends(ge
     for k, v in updates.items():
         if hasattr(db_p, k): setattr(db_p, k, v)
     db.commit()
+    if "name" in updates or "phone" in updates:
+        index_patient(db_p)
     return {"status": "updated"}
 
 # --- 药品与库存 ---
 
 @app.get("/api/medications", response_model=List[MedicationSchema], tags=["药品管理"], summary="获取药品字典")
-def list_meds(db: Session = Depends(get_db)):
-    return db.query(MedicationDB).all()
-
-@app.patch("/api/medications/{mid}", tags=["药品管理"], summary="调整药品库存")
-def adjust_stock(mid: str, payload: dict = Body(..., example={"change": 50}), db: Session = Depends(get_db)):
-    med = db.query(MedicationDB).filter(MedicationDB.id == mid).first()
-    if not med: raise HTTPException(404)
-    med.stock = max(0, med.stock + payload.get("change", 0))
+def list_meds(request: Request, db: Session = Depends(get_read_db),
+              fields: Optional[str] = Query(None, description="只返回这些字段，逗号分隔，如 id,name,stock")):
+    # 命中缓存时只执行一次版本探测；客户端携带相同 ETag 时返回 304 无响应体
+    etag, body = medication_cache.load(db, parse_fields(fields, MEDICATION_FIELDS))
+    return conditional_json(request, etag, body)
+
+@app.get("/api/medications/suggest", response_model=List[MedicationSchema], tags=["药品管理"], summary="药品联想输入")
+async def suggest_meds(q: str = Query(..., min_length=1, max_length=50), limit: int = Query(10, ge=1, le=50)):
+    # 按药名 / 拼音首字母 / 分类 / 规格前缀匹配，只读内存索引，不访问数据库
+    return RawJSONResponse(medication_index.suggest_json(q, limit))
+
+@app.patch("/api/medications/{mid}", response_model=MedicationSchema, tags=["药品管理"], summary="调整药品库存")
+def adjust_stock(mid: str, payload: dict = Body(..., example={"change": 50, "kind": "receipt", "note": "供应商到货"}),
+                 db: Session = Depends(get_db)):
+    # 计数器原子增减并追加库存流水，同一事务提交
+    adjust_medication_stock(db, mid, payload)
     db.commit()
-    return med
+    return db.get(MedicationDB, mid)
+
+@app.post("/api/medications/bulk-adjust", response_model=BulkResultRead, tags=["药品管理"],
+          summary="批量入库 / 库存调整（JSON 或 CSV）", openapi_extra=BULK_ADJUST_DOC)
+async def bulk_adjust(request: Request, db: Session = Depends(get_db)):
+    # 需要原始请求体（CSV），故为协程路由；分块事务放到线程池执行
+    lines = number_lines(read_adjust_lines(request.headers.get("content-type", ""), await request.body()))
+    result = await run_in_threadpool(run_chunked, db, lines, adjust_chunk, adjust_key)
+    return RawJSONResponse(orjson.dumps(result))
+
+# --- 库存流水与报表 ---
+
+@app.get("/api/inventory/ledger", response_model=List[InventoryTxnRead], tags=["库存流水"], summary="分页查询库存流水")
+def list_ledger(f: LedgerFilters = Depends(), db: Session = Depends(get_db)):
+    rows = db.execute(ledger_page_stmt(f)).all()
+    rows, next_cursor = cut_page(rows, f.limit, lambda r: (r.created_at, r.id))
+    return page_response(ledger_rows_json(rows), next_cursor)
+
+@app.get("/api/inventory/stock-at", response_model=List[StockAtRead], tags=["库存流水"], summary="查询历史时点库存")
+def get_stock_at(at: datetime = Query(..., description="时点，如 2024-05-01T00:00:00"),
+                 medication_id: Optional[List[str]] = Query(None, description="不传则返回全部药品"),
+                 db: Session = Depends(get_db)):
+    return RawJSONResponse(stock_at_json(db, at, medication_id))
+
+@app.get("/api/inventory/consumption", response_model=List[ConsumptionRead], tags=["库存流水"], summary="区间出入库统计")
+def get_consumption(date_from: datetime = Query(..., description="起始时间（含）"),
+                    date_to: datetime = Query(..., description="截止时间（不含）"),
+                    db: Session = Depends(get_db)):
+    return RawJSONResponse(consumption_json(db, date_from, date_to))
+
+# --- 统计看板 ---
+
+@app.get("/api/stats", response_model=StatsRead, tags=["统计看板"], summary="挂号 / 处方 / 发药汇总与低库存计数")
+def get_stats(date_from: Optional[date] = Query(None, description="起始日期（含），默认当天"),
+              date_to: Optional[date] = Query(None, description="截止日期（含），默认当天"),
+              top: int = Query(10, ge=1, le=100, description="按金额返回前若干种药品"),
+              db: Session = Depends(get_db)):
+    # 只读按天汇总表，不扫描患者 / 处方明细
+    today = date.today()
+    return RawJSONResponse(stats_json(db, date_from or today, date_to or today, top))
 
 # --- 处方业务 ---
 
-@app.get("/api/prescriptions", response_model=List[PrescriptionRead], tags=["处方管理"], summary="查询处方列表")
-def list_prescriptions(db: Session = Depends(get_db)):
-    pxs = db.query(PrescriptionDB).all()
-    res = []
-    for p in pxs:
-        items = [{"medicationId": i.medication_id, "name": i.med_name, "dosage": i.dosage, "quantity": i.quantity} for i in p.items]
-        res.append({
-            "id": p.id, "patientId": p.patient_id, "doctorId": p.doctor_id,
-            "createdAt": p.created_at.strftime("%Y-%m-%d %H:%M"),
-            "status": p.status, "medications": items
-        })
-    return res
-
-@app.post("/api/prescriptions", tags=["处方管理"], summary="开立新处方")
-def save_prescription(data: PrescriptionCreate, db: Session = Depends(get_db)):
+@app.get("/api/prescriptions", response_model=List[PrescriptionRead], tags=["处方管理"], summary="分页查询处方列表")
+def list_prescriptions(f: PrescriptionFilters = Depends(), db: Session = Depends(get_read_db)):
+    headers = (db.execute(prescription_page_stmt(f))).all()
+    headers, next_cursor = cut_page(headers, f.limit, lambda r: (r.created_at, r.id))
+    ids = [h.id for h in headers] if f.with_items else []
+    items = (db.execute(prescription_items_stmt(ids, archived=bool(f.patient_id)))).all() if ids else []
+    return page_response(prescription_rows_json(headers, items, f.fields), next_cursor)
+
+@app.post("/api/prescriptions", tags=["处方管理"], summary="开立新处方",
+          responses={404: {"description": "患者不存在"},
+                     409: {"description": "处方号已存在；或库存不足、药品不存在、存在禁忌配伍，detail 为校验结果"},
+                     503: {"description": "药物相互作用表不可用"}})
+def save_prescription(data: PrescriptionCreate, dry_run: bool = Query(False, description="只校验库存与配伍，不写入"),
+                      db: Session = Depends(get_db)):
     try:
-        new_px = PrescriptionDB(id=data.id, patient_id=data.patientId, doctor_id=data.doctorId, status=data.status)
-        db.add(new_px)
-        
-        for m in data.medications:
-            item = PrescriptionItemDB(
-                prescription_id=data.id, medication_id=m.medicationId,
-                med_name=m.name, dosage=m.dosage, quantity=m.quantity
-            )
-            db.add(item)
-            
-        pt = db.query(PatientDB).filter(PatientDB.id == data.patientId).first()
-        if pt: pt.status = "已完成"
-        
-        db.commit()
-        return {"status": "success"}
+        res = prescribe(db, data, dry_run)
+        if not dry_run:
+            db.commit()
+        return res
+    except HTTPException:
+        db.rollback()
+        raise
     except Exception as e:
         db.rollback()
         raise HTTPException(500, detail=str(e))
 
-@app.post("/api/prescriptions/{rxid}/dispense", tags=["处方管理"], summary="确认发药")
+@app.post("/api/prescriptions/{rxid}/dispense", tags=["处方管理"], summary="确认发药",
+          responses={404: {"description": "处方不存在"}, 409: {"description": "库存不足"}})
 def dispense(rxid: str, db: Session = Depends(get_db)):
-    px = db.query(PrescriptionDB).filter(PrescriptionDB.id == rxid).first()
-    if not px or px.status == "已发药": return {"msg": "invalid or already done"}
-    
     try:
-        px.status = "已发药"
-        for item in px.items:
-            med = db.query(MedicationDB).filter(MedicationDB.id == item.medication_id).first()
-            if med:
-                if med.stock < item.quantity:
-                    raise HTTPException(400, f"{med.name} 库存不足")
-                med.stock -= item.quantity
+        res = dispense_prescription(db, rxid)
         db.commit()
-        return {"status": "dispensed"}
-    except Exception as e:
+        return res
+    except HTTPException:
+        db.rollback()
+        raise
+    except SQLAlchemyError as e:
         db.rollback()
         raise HTTPException(500, detail=str(e))
 
+@app.post("/api/prescriptions/bulk-dispense", response_model=BulkResultRead, tags=["处方管理"],
+          summary="批量确认发药", openapi_extra=BULK_DISPENSE_DOC)
+async def bulk_dispense(request: Request, db: Session = Depends(get_db)):
+    ids = read_prescription_ids(await request.body())
+    result = await run_in_threadpool(run_dispense, db, ids)
+    return RawJSONResponse(orjson.dumps(result))
+
+# --- 报表导出 ---
+
+@app.get("/api/export/{entity}", tags=["报表导出"], summary="按日期范围流式导出 patients / prescriptions / prescription-items",
+         response_class=StreamingResponse)
+async def export(q: ExportQuery = Depends()):
+    # 生成器自行管理会话与服务端游标，分批编码写出，内存占用与导出范围无关
+    return export_response(iter_export(SessionLocal, q), q)
+
+# --- 增量同步 ---
+
+@app.get("/api/sync", response_model=SyncRead, tags=["增量同步"], summary="拉取指定版本之后的变更")
+def sync_changes(
+    since: Optional[int] = Query(None, ge=0, description="客户端已持有的版本号；不传则只返回当前版本作为基线"),
+    limit: int = Query(1000, ge=1, le=5000, description="单次最多返回的变更行数；more 为 true 时以返回的 version 继续拉取"),
+    db: Session = Depends(get_db),
+):
+    # 先取安全高水位再查行，保证返回的 version 之前的变更都已包含在本次及之前的结果中
+    top = current_version(db)
+    if since is None or since >= top:
+        return {"version": top}
+    version = page_end(db, since, top, limit)
+
+    def changed(col):
+        return (col > since, col <= version)
+
+    pts = db.query(PatientDB).filter(*changed(PatientDB.version)).all()
+    meds = db.query(MedicationDB).filter(*changed(MedicationDB.version)).all()
+    pxs = (db.query(PrescriptionDB).options(selectinload(PrescriptionDB.items))
+           .filter(*changed(PrescriptionDB.version)).all())
+    tombs = db.query(TombstoneDB).filter(*changed(TombstoneDB.version)).all()
+    return {
+        "version": version,
+        "more": version < top,
+        "patients": [patient_out(p) for p in pts],
+        "medications": meds,
+        "prescriptions": [prescription_out(p) for p in pxs],
+        "deleted": [{"entity": t.entity, "id": t.entity_id} for t in tombs],
+    }
+
+# --- 实时推送 ---
+
+@app.get("/api/events", tags=["实时推送"], summary="订阅变更事件 (Server-Sent Events)")
+async def stream_events(
+    topics: Optional[List[str]] = Query(None, description="主题或主题前缀，如 patient、prescription.created；不传订阅全部"),
+):
+    for t in topics or []:
+        if not any(t == full or full.startswith(t + ".") for full in TOPICS):
+            raise HTTPException(400, f"Unknown topic: {t}")
+    sub = hub.subscribe(topics)
+
+    async def stream():
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                try:
+                    message = await asyncio.wait_for(sub.get(), timeout=15)
+                except asyncio.TimeoutError:
+                    # 心跳注释行，防止中间设备关闭空闲连接
+                    yield ": ping\n\n"
+                    continue
+                yield format_sse(message)
+        finally:
+            hub.unsubscribe(sub)
+
+    return StreamingResponse(stream(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+# 患者检索索引在后台构建（有快照时只补增量），退出时落盘供下次启动使用；药品联想索引由后台线程定期同步
+@app.on_event("startup")
+def start_search_index():
+    patient_index.start(SessionLocal)
+    medication_index.start(SessionLocal)
+    replicas.start()
+    interaction_index.start(SessionLocal)
+    if settings.REGISTRATION_GROUP_COMMIT:
+        registration_batcher.start(SessionLocal)
+
+@app.on_event("shutdown")
+def save_search_index():
+    registration_batcher.stop()
+    interaction_index.stop()
+    replicas.stop()
+    medication_index.stop()
+    patient_index.save_snapshot(settings.SEARCH_SNAPSHOT_PATH)
+
+# 异步模式：用 async_routes 中同路径的协程版本替换上面的同步业务路由
+if settings.DB_ASYNC:
+    from fastapi.routing import APIRoute
+    from .async_routes import router as async_router
+
+    overridden = {(r.path, m) for r in async_router.routes for m in r.methods}
+    app.router.routes = [
+        r for r in app.router.routes
+        if not (isinstance(r, APIRoute) and any((r.path, m) in overridden for m in r.methods))
+    ]
+    app.include_router(async_router)
+
+    @app.on_event("shutdown")
+    async def dispose_async_engine():
+        # 关闭异步连接池；aiosqlite 每个连接占用一个后台线程，不释放会阻止进程退出
+        await async_engine.dispose()
+        for r in replicas.replicas:
+            await r.async_engine.dispose()
+
 if __name__ == "__main__":
-    uvicorn.run("backend.main:app", host="0.0.0.0", port=8000, reload=settings.DEBUG_MODE)
+    # 多 worker 时各进程连接池按 WEB_CONCURRENCY 均分 DB_CONNECTION_BUDGET；reload 模式下只有一个 worker
+    uvicorn.run("backend.main:app", host="0.0.0.0", port=8000, reload=settings.DEBUG_MODE,
+                workers=settings.WEB_CONCURRENCY)
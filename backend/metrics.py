@@ -0,0 +1,280 @@
+import logging
+import threading
+import time
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+from .config import settings
+
+# 请求延迟、每请求 SQL 数 / 耗时 / 行数、连接池等待与溢出，以 Prometheus 文本格式在 /metrics 导出。
+# 指标按进程统计；多 worker 部署时由 Prometheus 分别抓取各实例再聚合。
+
+logger = logging.getLogger("his.slow")
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+STATEMENT_BUCKETS = (1, 2, 3, 5, 8, 13, 21, 50, 100)
+POOL_WAIT_BUCKETS = (0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 30.0)
+# 不计入请求指标的路径：抓取自身与长连接推送
+SKIP_PATHS = {"/metrics", "/api/events"}
+# 慢请求日志最多记录的语句条数
+MAX_CAPTURED = 50
+
+_lock = threading.Lock()
+
+
+class Histogram:
+    def __init__(self, name: str, doc: str, labels: Tuple[str, ...], buckets):
+        self.name, self.doc, self.labels, self.buckets = name, doc, labels, tuple(buckets)
+        self.series: Dict[tuple, list] = {}  # 标签值 -> [各桶计数..., sum, count]
+
+    def observe(self, values: tuple, amount: float):
+        with _lock:
+            s = self.series.get(values)
+            if s is None:
+                s = self.series[values] = [0] * len(self.buckets) + [0.0, 0]
+            for i, b in enumerate(self.buckets):
+                if amount <= b:
+                    s[i] += 1
+            s[-2] += amount
+            s[-1] += 1
+
+    def render(self) -> List[str]:
+        out = [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} histogram"]
+        with _lock:
+            series = {k: list(v) for k, v in self.series.items()}
+        for values, s in sorted(series.items()):
+            base = _labels(self.labels, values)
+            for b, n in zip(self.buckets, s):
+                out.append(f'{self.name}_bucket{{{base}{"," if base else ""}le="{b:g}"}} {n}')
+            out.append(f'{self.name}_bucket{{{base}{"," if base else ""}le="+Inf"}} {s[-1]}')
+            out.append(f"{self.name}_sum{{{base}}} {s[-2]:.6f}")
+            out.append(f"{self.name}_count{{{base}}} {s[-1]}")
+        return out
+
+
+class Counter:
+    def __init__(self, name: str, doc: str, labels: Tuple[str, ...]):
+        self.name, self.doc, self.labels = name, doc, labels
+        self.series: Dict[tuple, float] = {}
+
+    def inc(self, values: tuple, amount: float = 1):
+        with _lock:
+            self.series[values] = self.series.get(values, 0) + amount
+
+    def render(self) -> List[str]:
+        out = [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} counter"]
+        with _lock:
+            series = dict(self.series)
+        for values, v in sorted(series.items()):
+            out.append(f"{self.name}{{{_labels(self.labels, values)}}} {v:g}")
+        return out
+
+
+def _labels(names, values) -> str:
+    return ",".join(f'{n}="{_escape(v)}"' for n, v in zip(names, values))
+
+
+def _escape(v) -> str:
+    return str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+ROUTE = ("method", "route")
+
+http_requests = Counter("his_http_requests_total", "HTTP requests by route and status", ROUTE + ("status",))
+http_latency = Histogram("his_http_request_duration_seconds", "HTTP request latency", ROUTE, LATENCY_BUCKETS)
+sql_per_request = Histogram("his_sql_statements_per_request", "SQL statements executed per request", ROUTE,
+                            STATEMENT_BUCKETS)
+sql_statements = Counter("his_sql_statements_total", "SQL statements executed", ROUTE)
+sql_seconds = Counter("his_sql_duration_seconds_total", "Time spent executing SQL", ROUTE)
+sql_rows = Counter("his_sql_rows_total", "Rows returned or affected, as reported by the driver", ROUTE)
+pool_wait = Histogram("his_db_pool_checkout_wait_seconds", "Time per request spent waiting for pooled connections",
+                      ROUTE, POOL_WAIT_BUCKETS)
+pool_overflow_checkouts = Counter("his_db_pool_overflow_checkouts_total",
+                                  "Checkouts served while the pool was beyond pool_size", ROUTE)
+pool_connections = Counter("his_db_pool_connections_total",
+                           "DBAPI connections opened / closed (recycle, overflow release) / invalidated",
+                           ("pool", "event"))
+admission_rejected = Counter("his_admission_rejected_total", "Requests shed with 503 by admission control",
+                             ("class", "reason"))
+admission_wait = Histogram("his_admission_queue_wait_seconds", "Time queued requests waited for admission",
+                           ("class",), LATENCY_BUCKETS)
+
+METRICS = (http_requests, http_latency, sql_per_request, sql_statements, sql_seconds, sql_rows,
+           pool_wait, pool_overflow_checkouts, pool_connections, admission_rejected, admission_wait)
+
+
+class RequestStats:
+    """单个请求内累积的数据库开销；由中间件创建，经 contextvar 传到线程池与 SQL 钩子"""
+
+    __slots__ = ("statements", "sql_seconds", "rows", "checkouts", "pool_wait", "overflow_checkouts", "captured")
+
+    def __init__(self, capture: bool):
+        self.statements = 0
+        self.sql_seconds = 0.0
+        self.rows = 0
+        self.checkouts = 0
+        self.pool_wait = 0.0
+        self.overflow_checkouts = 0
+        self.captured: Optional[list] = [] if capture else None
+
+
+_current: ContextVar[Optional[RequestStats]] = ContextVar("his_request_stats", default=None)
+# 请求之外（启动、后台任务）的 SQL 归入该标签
+BACKGROUND = ("-", "-")
+
+
+# --- SQL 钩子 ---
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["query_start"].pop()
+    # SELECT 的行数依赖驱动：pymysql 缓冲游标会给出行数，sqlite3 为 -1 时不计
+    rows = max(cursor.rowcount or 0, 0)
+    stats = _current.get()
+    if stats is None:
+        sql_statements.inc(BACKGROUND)
+        sql_seconds.inc(BACKGROUND, elapsed)
+        sql_rows.inc(BACKGROUND, rows)
+        return
+    stats.statements += 1
+    stats.sql_seconds += elapsed
+    stats.rows += rows
+    if stats.captured is not None and len(stats.captured) < MAX_CAPTURED:
+        stats.captured.append((elapsed, " ".join(statement.split())))
+
+
+engines: dict = {}
+
+
+def instrument_engine(engine, name: str):
+    """为同步引擎（或异步引擎的 sync_engine）挂上 SQL 计时钩子，并登记其连接池供 /metrics 读取"""
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+    # 连接的建立与关闭次数：定时重建（pool_recycle）与溢出连接归还时的关闭都计入 closed
+    for pool_event in POOL_EVENTS:
+        event.listen(engine, pool_event, _count_connection(name, pool_event))
+    # 保存引擎而非池：dispose() 会替换 engine.pool
+    engines[name] = engine
+
+
+# --- 连接池 ---
+
+POOL_EVENTS = {"connect": "opened", "close": "closed", "invalidate": "invalidated"}
+
+
+def _count_connection(pool_name: str, event_name: str):
+    labels = (pool_name, POOL_EVENTS[event_name])
+
+    def listener(*args):
+        pool_connections.inc(labels)
+    return listener
+
+
+class _TimedCheckout:
+    """记录从池中取得连接的等待时间，以及取连接时是否已动用溢出连接"""
+
+    def connect(self):
+        start = time.perf_counter()
+        conn = super().connect()
+        waited, overflowed = time.perf_counter() - start, self.overflow() > 0
+        stats = _current.get()
+        if stats is None:
+            pool_wait.observe(BACKGROUND, waited)
+            pool_overflow_checkouts.inc(BACKGROUND, overflowed)
+        else:
+            # 取连接时尚未匹配路由，先记在请求上下文里，请求结束时按路由标签汇总
+            stats.checkouts += 1
+            stats.pool_wait += waited
+            stats.overflow_checkouts += overflowed
+        return conn
+
+
+class TimedQueuePool(_TimedCheckout, QueuePool):
+    pass
+
+
+class TimedAsyncAdaptedQueuePool(_TimedCheckout, AsyncAdaptedQueuePool):
+    pass
+
+
+def _pool_gauges() -> List[str]:
+    out = []
+    for name, doc, read in (
+        ("his_db_pool_size", "Configured pool_size", lambda p: p.size()),
+        ("his_db_pool_max_overflow", "Configured max_overflow", lambda p: p._max_overflow),
+        ("his_db_pool_recycle_seconds", "Configured pool_recycle (-1: never)", lambda p: p._recycle),
+        ("his_db_pool_checked_out", "Connections currently checked out", lambda p: p.checkedout()),
+        ("his_db_pool_checked_in", "Idle connections in the pool", lambda p: p.checkedin()),
+        ("his_db_pool_overflow", "Overflow connections currently open", lambda p: max(p.overflow(), 0)),
+    ):
+        out += [f"# HELP {name} {doc}", f"# TYPE {name} gauge"]
+        for pool_name, engine in engines.items():
+            if isinstance(engine.pool, QueuePool):
+                out.append(f'{name}{{pool="{pool_name}"}} {read(engine.pool)}')
+    return out
+
+
+def render() -> str:
+    lines = []
+    for m in METRICS:
+        lines += m.render()
+    lines += _pool_gauges()
+    return "\n".join(lines) + "\n"
+
+
+# --- 请求中间件 ---
+
+class MetricsMiddleware:
+    """纯 ASGI 中间件，不缓冲响应体，SSE 等流式响应不受影响"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in SKIP_PATHS:
+            return await self.app(scope, receive, send)
+
+        status = 500
+        slow_ms = settings.SLOW_REQUEST_MS
+        stats = RequestStats(capture=slow_ms > 0)
+        token = _current.set(stats)
+        start = time.perf_counter()
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            _current.reset(token)
+            self._record(scope, stats, status, elapsed, slow_ms)
+
+    @staticmethod
+    def _record(scope, stats: RequestStats, status: int, elapsed: float, slow_ms: int):
+        # 以路由模板而非实际路径作标签，避免 /api/patients/{pid} 按 ID 膨胀
+        route = scope.get("route")
+        labels = (scope["method"], getattr(route, "path", "unmatched"))
+        http_requests.inc(labels + (str(status),))
+        http_latency.observe(labels, elapsed)
+        sql_per_request.observe(labels, stats.statements)
+        sql_statements.inc(labels, stats.statements)
+        sql_seconds.inc(labels, stats.sql_seconds)
+        sql_rows.inc(labels, stats.rows)
+        if stats.checkouts:
+            pool_wait.observe(labels, stats.pool_wait)
+            pool_overflow_checkouts.inc(labels, stats.overflow_checkouts)
+        if slow_ms and elapsed * 1000 >= slow_ms:
+            detail = "\n".join(f"  {s * 1000:8.1f} ms  {sql}" for s, sql in stats.captured)
+            logger.warning("slow request %s %s -> %s in %.0f ms, %d SQL (%.0f ms)\n%s",
+                           scope["method"], scope["path"], status, elapsed * 1000,
+                           stats.statements, stats.sql_seconds * 1000, detail)
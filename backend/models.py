@@ -1,6 +1,7 @@
 
-from sqlalchemy import Column, Integer, String, Float, Text, ForeignKey, DateTime, func
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, Integer, BigInteger, String, Float, Text, ForeignKey, Date, DateTime, Index
+from sqlalchemy.orm import relationship, column_property
+from datetime import datetime
 from .database import Base
 
 class DoctorDB(Base):
@@ -19,10 +20,22 @@ class PatientDB(Base):
     age = Column(Integer)
     gender = Column(String(10))
     phone = Column(String(20))
-    register_time = Column(DateTime, default=func.now())
-    status = Column(String(20))  # 待诊, 已完成
+    # 由应用侧取时间，保证游标中的时间值与库内存储格式一致（SQLite 下 func.now() 精度不同）
+    register_time = Column(DateTime, default=datetime.now)
+    # active_history：修改前总是取到旧值，看板汇总据此在旧状态减一、新状态加一
+    status = column_property(Column(String(20)), active_history=True)  # 待诊, 已完成
+    department = Column(String(50), nullable=True)  # 挂号科室
     symptoms = Column(Text, nullable=True)
     diagnosis = Column(Text, nullable=True)
+    version = Column(BigInteger, default=0, index=True)  # 变更版本号，由 sync 模块在 flush 时写入
+    queue_no = Column(Integer, nullable=True)  # 当日挂号序号，由 registration 模块分配
+
+    # 复合索引：支撑按 (register_time, id) 的游标分页及状态/科室过滤
+    __table_args__ = (
+        Index("ix_patients_register", "register_time", "id"),
+        Index("ix_patients_status_register", "status", "register_time", "id"),
+        Index("ix_patients_dept_register", "department", "register_time", "id"),
+    )
 
 class MedicationDB(Base):
     """药品字典与库存主表"""
@@ -34,6 +47,10 @@ class MedicationDB(Base):
     unit = Column(String(20))
     price = Column(Float)
     category = Column(String(50))
+    version = Column(BigInteger, default=0, index=True)
+
+    # 低库存计数走索引范围扫描
+    __table_args__ = (Index("ix_medications_stock", "stock"),)
 
 class PrescriptionDB(Base):
     """处方主单表"""
@@ -41,20 +58,173 @@ class PrescriptionDB(Base):
     id = Column(String(50), primary_key=True)
     patient_id = Column(String(50), ForeignKey("patients.id"))
     doctor_id = Column(String(50), ForeignKey("doctors.id"))
-    created_at = Column(DateTime, default=func.now())
-    status = Column(String(20))  # 已开立, 已发药
+    created_at = Column(DateTime, default=datetime.now)
+    status = column_property(Column(String(20)), active_history=True)  # 已开立, 已发药
+    version = Column(BigInteger, default=0, index=True)  # 明细变更同样提升主单版本
     
     # 级联删除：删除处方时同步删除明细
     items = relationship("PrescriptionItemDB", back_populates="prescription", cascade="all, delete-orphan")
 
+    # 发药台按状态取待发处方，并按 (created_at, id) 游标分页
+    __table_args__ = (
+        Index("ix_prescriptions_status_created", "status", "created_at", "id"),
+        Index("ix_prescriptions_created", "created_at", "id"),
+        Index("ix_prescriptions_patient_created", "patient_id", "created_at"),
+        Index("ix_prescriptions_doctor_created", "doctor_id", "created_at"),
+    )
+
 class PrescriptionItemDB(Base):
     """处方详情表（实现药品清单与主单的关联）"""
     __tablename__ = "prescription_items"
     id = Column(Integer, primary_key=True, autoincrement=True)
-    prescription_id = Column(String(50), ForeignKey("prescriptions.id"))
+    prescription_id = Column(String(50), ForeignKey("prescriptions.id"), index=True)
     medication_id = Column(String(50), ForeignKey("medications.id"))
     med_name = Column(String(100))
     dosage = Column(String(50))
     quantity = Column(Integer)
     
     prescription = relationship("PrescriptionDB", back_populates="items")
+
+class SyncCounterDB(Base):
+    """全局变更版本计数器（单行），在独立的短事务中递增，不随业务事务持锁（见 sync 模块）"""
+    __tablename__ = "sync_counter"
+    id = Column(Integer, primary_key=True)
+    value = Column(BigInteger, nullable=False, default=0)
+
+class SyncPendingDB(Base):
+    """已分配、所属写事务尚未结束的版本号；写事务在自己的事务内删除该行，随提交生效"""
+    __tablename__ = "sync_pending"
+    version = Column(BigInteger, primary_key=True, autoincrement=False)
+    created_at = Column(DateTime, nullable=False, default=datetime.now, index=True)
+
+class TombstoneDB(Base):
+    """删除墓碑表，供增量同步下发删除事件"""
+    __tablename__ = "tombstones"
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    entity = Column(String(20), nullable=False)  # patient, medication, prescription
+    entity_id = Column(String(50), nullable=False)
+    version = Column(BigInteger, nullable=False, index=True)
+    deleted_at = Column(DateTime, default=datetime.now)
+
+    # 按实体取最大删除版本（药品字典缓存校验）
+    __table_args__ = (Index("ix_tombstones_entity_version", "entity", "version"),)
+
+class IdSequenceDB(Base):
+    """命名序号计数器：patient 为服务端患者 ID，queue:YYYY-MM-DD 为当日挂号序号"""
+    __tablename__ = "id_sequences"
+    name = Column(String(50), primary_key=True)
+    value = Column(BigInteger, nullable=False, default=0)
+
+class DrugInteractionDB(Base):
+    """药物相互作用：每对药品存一行，med_a < med_b"""
+    __tablename__ = "drug_interactions"
+    med_a = Column(String(50), ForeignKey("medications.id"), primary_key=True)
+    med_b = Column(String(50), ForeignKey("medications.id"), primary_key=True)
+    severity = Column(String(10), nullable=False)  # 禁忌（拒绝开立）, 慎用（提示）
+    note = Column(String(200))
+    # 与行数一起作为开方校验索引的重载探测
+    updated_at = Column(DateTime, nullable=False, default=datetime.now, onupdate=datetime.now)
+
+class InventoryTxnDB(Base):
+    """库存流水（只追加）：入库、发药、盘点调整，数量带符号"""
+    __tablename__ = "inventory_txns"
+    # SQLite 仅 INTEGER 主键可自增
+    id = Column(BigInteger().with_variant(Integer, "sqlite"), primary_key=True, autoincrement=True)
+    medication_id = Column(String(50), ForeignKey("medications.id"), nullable=False)
+    kind = Column(String(20), nullable=False)  # receipt, dispense, adjustment
+    quantity = Column(Integer, nullable=False)  # 库存变化量，出库为负
+    balance_after = Column(Integer, nullable=False)  # 本条流水后的库存
+    prescription_id = Column(String(50), nullable=True)  # 发药流水关联的处方
+    note = Column(String(200), nullable=True)
+    # 在取得库存行锁之后取时间，同一药品的流水时间与加锁顺序一致
+    created_at = Column(DateTime, nullable=False, default=datetime.now)
+
+    __table_args__ = (
+        Index("ix_inventory_txns_med_created", "medication_id", "created_at", "id"),
+        Index("ix_inventory_txns_created", "created_at"),
+        Index("ix_inventory_txns_prescription", "prescription_id"),
+    )
+
+class InventorySnapshotDB(Base):
+    """库存快照：每次快照为全部药品各写一行期末库存及本期出入库合计"""
+    __tablename__ = "inventory_snapshots"
+    id = Column(BigInteger().with_variant(Integer, "sqlite"), primary_key=True, autoincrement=True)
+    medication_id = Column(String(50), ForeignKey("medications.id"), nullable=False)
+    period_start = Column(DateTime, nullable=True)  # 上一次快照的截止时间，首个快照为空
+    taken_at = Column(DateTime, nullable=False)  # 截止时间：覆盖 created_at <= taken_at 的流水
+    stock = Column(Integer, nullable=False)
+    received = Column(Integer, nullable=False, default=0)
+    dispensed = Column(Integer, nullable=False, default=0)
+    adjusted = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        Index("ix_inventory_snapshots_taken_med", "taken_at", "medication_id", unique=True),
+        Index("ix_inventory_snapshots_med_taken", "medication_id", "taken_at"),
+    )
+
+class DailyPatientStatDB(Base):
+    """按挂号日期与状态汇总的患者数，随挂号 / 状态变更在同一事务内增减"""
+    __tablename__ = "daily_patient_stats"
+    day = Column(Date, primary_key=True)
+    status = Column(String(20), primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+
+class DailyPrescriptionStatDB(Base):
+    """按开立日期与状态汇总的处方数"""
+    __tablename__ = "daily_prescription_stats"
+    day = Column(Date, primary_key=True)
+    status = Column(String(20), primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+
+class DailyDispenseStatDB(Base):
+    """按发药日期与药品汇总的发药数量与金额（按发药时单价计）"""
+    __tablename__ = "daily_dispense_stats"
+    day = Column(Date, primary_key=True)
+    medication_id = Column(String(50), primary_key=True)
+    quantity = Column(Integer, nullable=False, default=0)
+    revenue = Column(Float, nullable=False, default=0)
+
+# --- 归档表：已结束且超过 ARCHIVE_AFTER_DAYS 的就诊由 archive 模块整体迁入，结构与在线表一致 ---
+
+class PatientArchiveDB(Base):
+    """已归档患者（已完成就诊）"""
+    __tablename__ = "patients_archive"
+    id = Column(String(50), primary_key=True)
+    name = Column(String(100))
+    age = Column(Integer)
+    gender = Column(String(10))
+    phone = Column(String(20))
+    register_time = Column(DateTime)
+    status = Column(String(20))
+    department = Column(String(50), nullable=True)
+    symptoms = Column(Text, nullable=True)
+    diagnosis = Column(Text, nullable=True)
+    version = Column(BigInteger, default=0)
+    queue_no = Column(Integer, nullable=True)
+    archived_at = Column(DateTime, nullable=False, default=datetime.now)
+
+    __table_args__ = (Index("ix_patients_archive_register", "register_time", "id"),)
+
+class PrescriptionArchiveDB(Base):
+    """已归档处方主单（已发药）"""
+    __tablename__ = "prescriptions_archive"
+    id = Column(String(50), primary_key=True)
+    patient_id = Column(String(50))
+    doctor_id = Column(String(50))
+    created_at = Column(DateTime)
+    status = Column(String(20))
+    version = Column(BigInteger, default=0)
+    archived_at = Column(DateTime, nullable=False, default=datetime.now)
+
+    # 历史查询只按患者取处方
+    __table_args__ = (Index("ix_prescriptions_archive_patient_created", "patient_id", "created_at", "id"),)
+
+class PrescriptionItemArchiveDB(Base):
+    """已归档处方明细，保留原明细 ID"""
+    __tablename__ = "prescription_items_archive"
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    prescription_id = Column(String(50), index=True)
+    medication_id = Column(String(50))
+    med_name = Column(String(100))
+    dosage = Column(String(50))
+    quantity = Column(Integer)
@@ -0,0 +1,39 @@
+import base64
+from datetime import datetime
+from typing import Any, Optional, Tuple
+
+from fastapi import HTTPException
+from sqlalchemy import and_, or_
+
+# 游标分页: 按 (时间列, 主键) 倒序, 游标为上一页最后一行的键值
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def encode_cursor(ts: datetime, key) -> str:
+    """将 (时间, 主键) 编码为不透明游标"""
+    raw = f"{ts.isoformat()}|{key}".encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
+
+def decode_cursor(cursor: str, key_type=str) -> Tuple[datetime, Any]:
+    """解析游标, 格式非法时返回 400"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8")
+        ts, key = raw.split("|", 1)
+        return datetime.fromisoformat(ts), key_type(key)
+    except (ValueError, UnicodeError):
+        raise HTTPException(400, "Invalid cursor")
+
+
+def keyset_before(ts_col, key_col, cursor: str, key_type=str):
+    """生成 "排在游标之后" 的过滤条件 (倒序场景)；整数主键传 key_type=int"""
+    ts, key = decode_cursor(cursor, key_type)
+    return or_(ts_col < ts, and_(ts_col == ts, key_col < key))
+
+
+def cut_page(rows: list, limit: int, key) -> Tuple[list, Optional[str]]:
+    """查询时多取一行：超出 limit 说明还有下一页，返回截断后的行与下一页游标"""
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(*key(rows[-1]))
@@ -0,0 +1,178 @@
+import logging
+import threading
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from fastapi import HTTPException
+from sqlalchemy import func, select
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+from sqlalchemy.orm import Session
+
+from .config import settings
+from .models import DrugInteractionDB, MedicationDB, PatientDB, PrescriptionDB, PrescriptionItemDB
+from .schemas import PrescriptionCreate
+
+logger = logging.getLogger("his.prescribing")
+
+# 开方校验：写入处方前检查
+# - 库存：同一药品各行数量合计不超过 当前库存 - 未发药处方的占用（PRESCRIPTION_RESERVE_HOURS 内开立、
+#   状态仍为 已开立 的处方明细），两条批量查询完成，与药品行数无关；
+# - 相互作用：药物相互作用表常驻内存，药品 ID 映射为序号、每对药品编码为一个整数键存入哈希表，
+#   10 种药品的处方只需 45 次字典查找，不访问数据库；后台线程探测表的行数与最后修改时间，变化时整体重建。
+# 库存不足、药品不存在与 禁忌 配伍拒绝开立（409），慎用 配伍只作提示。相互作用表从未加载成功时
+# 在当前会话中补加载，仍失败则拒绝开方（503），不在缺少配伍数据时放行。dry_run 只返回校验结果不写入，
+# 供医生编辑处方时调用。校验与写入之间库存仍可能被其他处方占用，发药时的加锁扣减仍是最终保证。
+
+CONTRAINDICATED, CAUTION = "禁忌", "慎用"
+OPEN_STATUS = "已开立"
+
+
+def pair_key(i: int, j: int) -> int:
+    """一对药品序号 -> 与顺序无关的整数键"""
+    return (i << 32) | j if i < j else (j << 32) | i
+
+
+class InteractionIndex:
+    def __init__(self):
+        # (药品 ID -> 序号, 序号对键 -> (严重程度, 说明))；重建后整体替换引用，查询无需加锁
+        self._data: Tuple[Dict[str, int], Dict[int, Tuple[str, Optional[str]]]] = ({}, {})
+        self._probe: Optional[tuple] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def load(self, db: Session) -> bool:
+        """表有变化时重建，返回是否重建"""
+        probe = tuple(db.execute(select(func.count(), func.max(DrugInteractionDB.updated_at))).one())
+        if probe == self._probe:
+            return False
+        ids: Dict[str, int] = {}
+        pairs: Dict[int, Tuple[str, Optional[str]]] = {}
+        for a, b, severity, note in db.execute(select(DrugInteractionDB.med_a, DrugInteractionDB.med_b,
+                                                      DrugInteractionDB.severity, DrugInteractionDB.note)):
+            pairs[pair_key(ids.setdefault(a, len(ids)), ids.setdefault(b, len(ids)))] = (severity, note)
+        self._data, self._probe = (ids, pairs), probe
+        logger.info("loaded %d drug interactions over %d medications", len(pairs), len(ids))
+        return True
+
+    def ensure_loaded(self, db: Session):
+        """启动加载失败或未启动后台线程时，首次校验在当前会话中加载；加载不了则抛出 503"""
+        if self._probe is not None:
+            return
+        try:
+            self.load(db)
+        except SQLAlchemyError:
+            logger.exception("drug interaction load failed")
+            raise HTTPException(503, "drug interaction table is unavailable")
+
+    def check(self, med_ids: Iterable[str]) -> List[dict]:
+        ids, pairs = self._data
+        # 未出现在任何相互作用中的药品直接略过
+        found = sorted({(ids[m], m) for m in med_ids if m in ids})
+        hits = []
+        for x, (i, a) in enumerate(found):
+            for j, b in found[x + 1:]:
+                hit = pairs.get(pair_key(i, j))
+                if hit:
+                    hits.append({"type": "interaction", "medicationIds": [a, b], "severity": hit[0], "note": hit[1]})
+        return hits
+
+    # --- 后台同步 ---
+
+    def start(self, session_factory):
+        """启动时先同步加载一次，第一张处方即按完整的相互作用表校验"""
+        if self._thread is not None:
+            return
+        self._refresh(session_factory)
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, args=(session_factory,), name="drug-interactions",
+                                        daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread = None
+
+    def _refresh(self, session_factory):
+        try:
+            with session_factory() as db:
+                self.load(db)
+        except Exception:
+            logger.exception("drug interaction refresh failed")
+
+    def _run(self, session_factory):
+        while not self._stop.wait(settings.INTERACTION_REFRESH_SECONDS):
+            self._refresh(session_factory)
+
+
+interaction_index = InteractionIndex()
+
+
+def available_stock(db: Session, med_ids: List[str]) -> Dict[str, int]:
+    """药品可用库存（当前库存减去未发药处方的占用）；不存在的药品不在结果中"""
+    stock = {mid: s or 0 for mid, s in db.execute(
+        select(MedicationDB.id, MedicationDB.stock).where(MedicationDB.id.in_(med_ids)))}
+    if stock and settings.PRESCRIPTION_RESERVE_HOURS > 0:
+        # 走 (status, created_at) 索引只扫描占用窗口内的待发处方
+        cutoff = datetime.now() - timedelta(hours=settings.PRESCRIPTION_RESERVE_HOURS)
+        for mid, reserved in db.execute(
+            select(PrescriptionItemDB.medication_id, func.sum(PrescriptionItemDB.quantity))
+            .join(PrescriptionDB, PrescriptionDB.id == PrescriptionItemDB.prescription_id)
+            .where(PrescriptionDB.status == OPEN_STATUS, PrescriptionDB.created_at >= cutoff,
+                   PrescriptionItemDB.medication_id.in_(list(stock)))
+            .group_by(PrescriptionItemDB.medication_id)
+        ):
+            stock[mid] -= reserved or 0
+    return stock
+
+
+def validate_prescription(db: Session, data: PrescriptionCreate) -> dict:
+    """{"ok": 可否开立, "errors": [...], "warnings": [...]}"""
+    requested: Dict[str, int] = defaultdict(int)
+    names: Dict[str, str] = {}
+    errors, warnings = [], []
+    for m in data.medications:
+        if m.quantity <= 0:
+            errors.append({"type": "quantity", "medicationId": m.medicationId, "name": m.name,
+                           "requested": m.quantity})
+        requested[m.medicationId] += m.quantity
+        names.setdefault(m.medicationId, m.name)
+
+    available = available_stock(db, list(requested)) if requested else {}
+    for mid, qty in requested.items():
+        if mid not in available:
+            errors.append({"type": "unknown", "medicationId": mid, "name": names[mid]})
+        elif qty > available[mid]:
+            errors.append({"type": "stock", "medicationId": mid, "name": names[mid], "requested": qty,
+                           "available": max(available[mid], 0)})
+    interaction_index.ensure_loaded(db)
+    for hit in interaction_index.check(requested):
+        (errors if hit["severity"] == CONTRAINDICATED else warnings).append(hit)
+    return {"ok": not errors, "errors": errors, "warnings": warnings}
+
+
+def prescribe(db: Session, data: PrescriptionCreate, dry_run: bool = False) -> dict:
+    """开方事务主体（不提交）：患者不存在 404；处方号重复或校验不通过 409（后者 detail 为校验结果）；
+    dry_run 只返回校验结果"""
+    pt = db.get(PatientDB, data.patientId)
+    if pt is None:
+        raise HTTPException(404, "Patient not found")
+    result = validate_prescription(db, data)
+    if dry_run:
+        return result
+    if not result["ok"]:
+        raise HTTPException(409, detail=result)
+    if db.get(PrescriptionDB, data.id) is not None:
+        raise HTTPException(409, "Prescription already exists")
+    db.add(PrescriptionDB(id=data.id, patient_id=data.patientId, doctor_id=data.doctorId, status=data.status))
+    db.add_all(PrescriptionItemDB(
+        prescription_id=data.id, medication_id=m.medicationId,
+        med_name=m.name, dosage=m.dosage, quantity=m.quantity
+    ) for m in data.medications)
+    pt.status = "已完成"
+    try:
+        db.flush()
+    except IntegrityError:
+        # 并发提交同一处方号：检查之后被另一请求抢先写入
+        raise HTTPException(409, "Prescription already exists")
+    return {"status": "success", "warnings": result["warnings"]}
@@ -0,0 +1,166 @@
+import asyncio
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from datetime import date
+from typing import List, Optional, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from .config import settings
+from .models import PatientDB, IdSequenceDB
+from .schemas import PatientSchema
+from .search import index_patient
+from .stats import upsert_add
+
+# 挂号写入。开启 REGISTRATION_GROUP_COMMIT 后，请求只把挂号放入进程内队列并等待结果，
+# 由单个写线程把几毫秒内到达的挂号合并为一个事务：ORM 对同一张表的多行插入会合并为一条
+# executemany（MySQL 下为多行 INSERT），版本号、推送事件、看板汇总仍由 flush 钩子处理，
+# 一次提交（一次 fsync）承载整批。整批失败时逐条重试，每个请求各自得到成功或失败。
+#
+# 患者 ID 与当日挂号序号由 id_sequences 计数器按批预留：一批 N 条在事务内一次预留连续 N 个号，
+# 计数器行锁持有到提交，多 worker 并发时序号按提交顺序连续；事务回滚时预留一并撤销，不留空号。
+
+logger = logging.getLogger("his.registration")
+
+PATIENT_SEQUENCE = "patient"
+_seq = IdSequenceDB.__table__
+
+
+def reserve(db: Session, name: str, n: int) -> int:
+    """在当前事务内预留计数器 name 的 n 个连续号，返回第一个"""
+    upsert_add(db, _seq, [{"name": name, "value": n}], ("name",), ("value",))
+    return db.execute(select(_seq.c.value).where(_seq.c.name == name)).scalar() - n + 1
+
+
+def patient_id(n: int) -> str:
+    # 与客户端生成的短 ID（P + 3 位）长度不同，不会冲突
+    return f"P{n:09d}"
+
+
+def register_patients(db: Session, payloads: List[PatientSchema], server_ids: bool) -> List[PatientDB]:
+    """挂号事务主体（不提交）：按顺序分配当日序号，server_ids 时一并分配患者 ID
+
+    计数器固定按 当日序号 -> 患者 ID 的顺序加锁，之后才写患者行与版本计数器。
+    """
+    n = len(payloads)
+    first_no = reserve(db, f"queue:{date.today().isoformat()}", n)
+    first_id = reserve(db, PATIENT_SEQUENCE, n) if server_ids else 0
+    patients = [
+        PatientDB(id=patient_id(first_id + i) if server_ids else p.id, name=p.name, age=p.age, gender=p.gender,
+                  phone=p.phone, status=p.status, department=p.department, queue_no=first_no + i)
+        for i, p in enumerate(payloads)
+    ]
+    db.add_all(patients)
+    db.flush()
+    return patients
+
+
+def registered(p: PatientDB) -> dict:
+    return {"status": "ok", "id": p.id, "queueNo": p.queue_no}
+
+
+def register_one(db: Session, p: PatientSchema) -> dict:
+    """逐条挂号（未开启合并提交时），沿用客户端传入的 ID"""
+    pt = register_patients(db, [p], server_ids=False)[0]
+    out = registered(pt)
+    db.commit()
+    index_patient(pt)
+    return out
+
+
+class RegistrationBatcher:
+    """进程内挂号队列与合并提交写线程；请求线程 / 协程只等待各自的 Future"""
+
+    def __init__(self):
+        self._queue: "queue.Queue[Optional[Tuple[PatientSchema, Future]]]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._session_factory = None
+
+    def start(self, session_factory):
+        if self._thread is not None:
+            return
+        self._session_factory = session_factory
+        self._thread = threading.Thread(target=self._run, name="registration-writer", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """写完已入队的挂号后退出"""
+        if self._thread is None:
+            return
+        self._queue.put(None)
+        self._thread.join()
+        self._thread = None
+
+    def submit(self, p: PatientSchema) -> Future:
+        fut = Future()
+        self._queue.put((p, fut))
+        return fut
+
+    async def register(self, p: PatientSchema) -> dict:
+        return await asyncio.wrap_future(self.submit(p))
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            batch, stopping = [item], False
+            deadline = time.monotonic() + settings.GROUP_COMMIT_WAIT_MS / 1000
+            while len(batch) < settings.GROUP_COMMIT_MAX_ROWS:
+                # 等待窗口结束后仍取走已排队的请求，积压时每批尽量凑满
+                timeout = deadline - time.monotonic()
+                try:
+                    item = self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            try:
+                self._flush(batch)
+            except Exception:
+                # 写线程退出后所有挂号都会一直等待，单批的意外错误只记录
+                logger.exception("registration batch of %d failed", len(batch))
+            if stopping:
+                return
+
+    def _flush(self, batch: List[Tuple[PatientSchema, Future]]):
+        # 等待方已取消（客户端断开、停机）的挂号不再写入；其余 Future 置为运行中，之后不能再被取消，
+        # 写入结果时不会因状态变化而出错
+        batch = [(p, fut) for p, fut in batch if fut.set_running_or_notify_cancel()]
+        if not batch:
+            return
+        try:
+            results = self._write([p for p, _ in batch])
+        except Exception as e:
+            if len(batch) == 1:
+                batch[0][1].set_exception(e)
+                return
+            # 整批回滚后逐条重试，只有出错的挂号返回失败
+            logger.warning("registration batch of %d failed, retrying one by one: %s", len(batch), e)
+            for p, fut in batch:
+                try:
+                    out = self._write([p])[0]
+                except Exception as e1:
+                    fut.set_exception(e1)
+                else:
+                    fut.set_result(out)
+            return
+        for (_, fut), out in zip(batch, results):
+            fut.set_result(out)
+
+    def _write(self, payloads: List[PatientSchema]) -> List[dict]:
+        with self._session_factory(expire_on_commit=False) as db:
+            patients = register_patients(db, payloads, server_ids=True)
+            db.commit()
+        for pt in patients:
+            index_patient(pt)
+        return [registered(pt) for pt in patients]
+
+
+registration_batcher = RegistrationBatcher()
@@ -0,0 +1,142 @@
+import itertools
+import logging
+import threading
+import time
+from typing import List, Optional
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+from sqlalchemy.sql import Select
+
+from .config import settings
+
+# 读写分离：列表类只读路由的查询发往只读副本，其余一律走主库。
+# - 会话层路由：RoutingSession 只把普通 SELECT 发往副本；flush、DML、SELECT ... FOR UPDATE 以及
+#   会话内发生写入之后的所有语句都走主库，只读路由即使偶有写入也不会落到副本。
+# - 读己之写：写请求成功后响应头 X-Primary-Until 给出一个截止时间，客户端在之后的读请求中原样带回，
+#   截止前的读请求走主库，避开副本复制延迟导致"刚挂号却查不到"。
+# - 健康检查：后台线程定期探测各副本，探测失败或请求中遇到断连即摘除，全部不可用时回退主库。
+
+logger = logging.getLogger("his.replica")
+
+PRIMARY_UNTIL_HEADER = "X-Primary-Until"
+SAFE_METHODS = {"GET", "HEAD", "OPTIONS"}
+
+
+class Replica:
+    """一个只读副本：同步引擎用于健康探测与同步路由，异步模式下另有异步引擎，二者共用健康状态"""
+
+    def __init__(self, name: str, engine, async_engine=None):
+        self.name = name
+        self.engine = engine
+        self.async_engine = async_engine
+        self.healthy = True
+
+    def mark_down(self, reason):
+        if self.healthy:
+            logger.warning("replica %s marked down: %s", self.name, reason)
+        self.healthy = False
+
+
+class ReplicaSet:
+    def __init__(self, replicas: List[Replica]):
+        self.replicas = replicas
+        self._rr = itertools.count()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def pick(self) -> Optional[Replica]:
+        """轮询选取健康副本；没有配置或全部不可用时返回 None（走主库）"""
+        healthy = [r for r in self.replicas if r.healthy]
+        return healthy[next(self._rr) % len(healthy)] if healthy else None
+
+    def check(self):
+        for r in self.replicas:
+            try:
+                with r.engine.connect() as conn:
+                    conn.execute(text("SELECT 1"))
+            except Exception as e:
+                r.mark_down(e)
+                continue
+            if not r.healthy:
+                logger.info("replica %s back online", r.name)
+            r.healthy = True
+
+    def start(self):
+        """启动时先同步探测一轮，不可用的副本不会接到第一批请求"""
+        if not self.replicas or self._thread is not None:
+            return
+        self.check()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="replica-health", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread = None
+
+    def _run(self):
+        while not self._stop.wait(settings.REPLICA_HEALTH_SECONDS):
+            self.check()
+
+
+def watch_errors(replica: Replica):
+    """请求中遇到断连或建连失败（connection 为 None）立即摘除副本，不必等下一轮健康检查"""
+    def on_error(context):
+        if context.is_disconnect or context.connection is None:
+            replica.mark_down(context.original_exception)
+    return on_error
+
+
+class RoutingSession(Session):
+    """replica 为副本的同步引擎（异步模式下为 async_engine.sync_engine）；为 None 时等同普通会话"""
+
+    def __init__(self, *args, replica=None, **kw):
+        super().__init__(*args, **kw)
+        self.replica = replica
+        self._wrote = False
+
+    def get_bind(self, mapper=None, clause=None, **kw):
+        if self.replica is not None and not self._wrote:
+            if not self._flushing and isinstance(clause, Select) and clause._for_update_arg is None:
+                return self.replica
+            # 一旦写过主库，本会话后续读也留在主库，保证会话内读己之写
+            self._wrote = True
+        return super().get_bind(mapper=mapper, clause=clause, **kw)
+
+
+def wants_primary(headers) -> bool:
+    """请求带回的 X-Primary-Until（毫秒时间戳）尚未过期时读主库
+
+    服务端下发的值不会晚于 当前时间 + REPLICA_STICKY_SECONDS；超出该范围的值视为伪造或无效，
+    防止客户端用远期时间戳把所有读请求钉在主库上。
+    """
+    value = headers.get(PRIMARY_UNTIL_HEADER.lower())
+    if not value:
+        return False
+    try:
+        until = float(value)
+    except ValueError:
+        return False
+    now = time.time() * 1000
+    return now < until <= now + settings.REPLICA_STICKY_SECONDS * 1000
+
+
+class StickyPrimaryMiddleware:
+    """写请求成功后在响应头中下发 X-Primary-Until；纯 ASGI 实现，不缓冲响应体"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] in SAFE_METHODS:
+            return await self.app(scope, receive, send)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start" and message["status"] < 400:
+                until = int((time.time() + settings.REPLICA_STICKY_SECONDS) * 1000)
+                message["headers"] = list(message.get("headers", [])) + [
+                    (PRIMARY_UNTIL_HEADER.lower().encode(), str(until).encode())]
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
@@ -1,7 +1,6 @@
 
 from pydantic import BaseModel
-from typing import List, Optional
-from datetime import datetime
+from typing import Dict, List, Optional
 
 class MedItemSchema(BaseModel):
     medicationId: str
@@ -17,8 +16,10 @@ class PatientSchema(BaseModel):
     phone: str
     registerTime: str
     status: str
+    department: Optional[str] = None
     symptoms: Optional[str] = None
     diagnosis: Optional[str] = None
+    queueNo: Optional[int] = None  # 当日挂号序号，服务端分配
     class Config:
         from_attributes = True
 
@@ -50,3 +51,76 @@ class PrescriptionRead(BaseModel):
     medications: List[MedItemSchema]
     class Config:
         from_attributes = True
+
+class TombstoneSchema(BaseModel):
+    entity: str
+    id: str
+
+class SyncRead(BaseModel):
+    version: int
+    more: bool = False  # 变更未取完，以 version 为 since 继续拉取
+    patients: List[PatientSchema] = []
+    medications: List[MedicationSchema] = []
+    prescriptions: List[PrescriptionRead] = []
+    deleted: List[TombstoneSchema] = []
+
+class InventoryTxnRead(BaseModel):
+    id: int
+    medicationId: str
+    kind: str  # receipt, dispense, adjustment
+    quantity: int
+    balanceAfter: int
+    prescriptionId: Optional[str] = None
+    note: Optional[str] = None
+    createdAt: str
+
+class StockAtRead(BaseModel):
+    medicationId: str
+    stock: int
+
+class ConsumptionRead(BaseModel):
+    medicationId: str
+    received: int
+    dispensed: int
+    adjusted: int
+
+class BulkResultRead(BaseModel):
+    total: int
+    succeeded: int
+    failed: int
+    # 逐行结果：{"line"/"id", "ok", "error"?, ...}，顺序与请求一致
+    results: List[dict]
+
+class StatusCountRead(BaseModel):
+    total: int
+    byStatus: Dict[str, int]
+
+class PatientStatsRead(StatusCountRead):
+    completionRate: float  # 已完成 / 挂号总数
+
+class DispenseStatRead(BaseModel):
+    medicationId: Optional[str] = None
+    name: Optional[str] = None
+    category: Optional[str] = None
+    quantity: int
+    revenue: float
+
+class DispenseStatsRead(BaseModel):
+    quantity: int
+    revenue: float
+    byMedication: List[DispenseStatRead]  # 按金额取前若干种
+    byCategory: List[DispenseStatRead]
+
+class LowStockRead(BaseModel):
+    warning: int  # 库存 <= warningThreshold 的药品数（含急缺）
+    critical: int
+    warningThreshold: int
+    criticalThreshold: int
+
+class StatsRead(BaseModel):
+    dateFrom: str
+    dateTo: str
+    patients: PatientStatsRead
+    prescriptions: StatusCountRead
+    dispensed: DispenseStatsRead
+    lowStock: LowStockRead
@@ -0,0 +1,321 @@
+import functools
+import logging
+import os
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+import orjson
+from sqlalchemy import and_, or_, select
+from sqlalchemy.orm import Session
+
+from .config import settings
+from .database import SessionLocal
+from .models import PatientDB, TombstoneDB
+from .serializers import PATIENT_COLUMNS, patient_rows_json
+from .sync import current_version
+
+try:
+    from pypinyin import Style, lazy_pinyin
+except ImportError:  # 未安装 pypinyin 时不建拼音首字母索引，姓名 / 电话检索不受影响
+    lazy_pinyin = None
+
+logger = logging.getLogger("his.search")
+
+# 每个倒排表最多扫描的候选数；倒排表按挂号时间排列，从新到旧扫描，常见姓氏也能在毫秒级返回
+SCAN_LIMIT = 5000
+# 单个倒排表命中数达到该值即停止：只在最近的这批命中里按得分排序，单字查询不必扫满上限
+HIT_LIMIT = 200
+# 增量同步每批读取的行数
+CHUNK = 5000
+# 电话按末 4 位建倒排，更长的尾号在候选上再做 endswith 校验
+PHONE_KEY_LEN = 4
+
+# 匹配得分：先按得分、再按挂号时间从新到旧排序
+SCORE_ID = 100
+SCORE_PHONE = 95
+SCORE_NAME_EXACT = 90
+SCORE_NAME_PREFIX = 70
+SCORE_INITIALS_EXACT = 60
+SCORE_PHONE_SUFFIX = 55
+SCORE_NAME_CONTAINS = 50
+SCORE_INITIALS_PREFIX = 40
+
+
+@functools.lru_cache(maxsize=65536)
+def name_initials(name: Optional[str]) -> str:
+    """姓名的拼音首字母，如 张三丰 -> zsf；非汉字部分取各段首字母"""
+    if not name or lazy_pinyin is None:
+        return ""
+    return "".join(s[0] for s in lazy_pinyin(name, style=Style.FIRST_LETTER) if s and s[0].isalnum()).lower()
+
+
+class _Doc:
+    __slots__ = ("name", "phone", "initials", "ts", "version")
+
+    def __init__(self, name: str, phone: str, initials: str, ts: float, version: int):
+        self.name, self.phone, self.initials, self.ts, self.version = name, phone, initials, ts, version
+
+
+class PatientSearchIndex:
+    """患者检索的进程内倒排索引
+
+    键包括姓名的单字与双字 n-gram、电话末 4 位、拼音首字母的各级前缀。倒排表只追加，
+    姓名或电话修改后旧键上的条目在查询时按当前文档校验剔除。
+
+    索引按 (version, id) 游标从数据库增量同步，各 worker 独立维护：本进程的挂号与修改在提交后
+    立即写入，其他进程的写入最迟在 SEARCH_REFRESH_SECONDS 后同步。退出时把文档写入快照，
+    重启后只需加载快照并补齐快照之后的变更，不必全表扫描。
+    """
+
+    def __init__(self):
+        self._docs: Dict[str, _Doc] = {}
+        self._postings: Dict[str, List[str]] = {}
+        self._write_lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._cursor: Tuple[int, str] = (-1, "")  # 已同步到的 (version, id)
+        self._tomb_version = 0
+        self._last_refresh = 0.0
+        self._builder: Optional[threading.Thread] = None
+        self.ready = False
+
+    # --- 索引维护 ---
+
+    def _keys(self, pid: str, doc: _Doc):
+        name = (doc.name or "").lower()
+        yield from {f"n:{c}" for c in name}
+        yield from {f"n:{name[i:i + 2]}" for i in range(len(name) - 1)}
+        digits = "".join(c for c in doc.phone or "" if c.isdigit())
+        if len(digits) >= PHONE_KEY_LEN:
+            yield f"t:{digits[-PHONE_KEY_LEN:]}"
+        for i in range(1, len(doc.initials) + 1):
+            yield f"i:{doc.initials[:i]}"
+
+    def _post(self, pid: str, doc: _Doc):
+        for key in self._keys(pid, doc):
+            self._postings.setdefault(key, []).append(pid)
+
+    def upsert(self, pid: str, name: str, phone: str, register_time, version: int):
+        """写入或更新一名患者；挂号、修改接口提交后调用，增量同步也经此写入"""
+        ts = register_time.timestamp() if register_time else 0.0
+        with self._write_lock:
+            old = self._docs.get(pid)
+            if old is not None and old.version > version:
+                return
+            if old is not None and old.name == name and old.phone == phone:
+                old.version = version
+                return
+            doc = _Doc(name or "", phone or "", name_initials(name), ts, version)
+            self._docs[pid] = doc
+            if self.ready:
+                self._post(pid, doc)
+
+    def remove(self, pid: str, version: int):
+        with self._write_lock:
+            doc = self._docs.get(pid)
+            if doc is not None and doc.version < version:
+                del self._docs[pid]
+
+    def _rebuild_postings(self):
+        # 初次构建时按挂号时间排序后再建倒排，之后的追加天然是新挂号在后
+        postings: Dict[str, List[str]] = {}
+        for pid, doc in sorted(self._docs.items(), key=lambda kv: kv[1].ts):
+            for key in self._keys(pid, doc):
+                postings.setdefault(key, []).append(pid)
+        self._postings = postings
+
+    def refresh(self, db: Session) -> int:
+        """按 (version, id) 游标拉取新增或修改的患者与患者墓碑，返回处理的行数"""
+        if not self._refresh_lock.acquire(blocking=False):
+            return 0  # 其他线程正在同步
+        try:
+            seen = 0
+            # 版本号不按提交顺序递增，游标只推进到安全高水位，之后才提交的较小版本下次仍能取到
+            top = current_version(db)
+            while True:
+                v, last_id = self._cursor
+                rows = db.execute(
+                    select(PatientDB.id, PatientDB.name, PatientDB.phone, PatientDB.register_time, PatientDB.version)
+                    .where(or_(PatientDB.version > v, and_(PatientDB.version == v, PatientDB.id > last_id)),
+                           PatientDB.version <= top)
+                    .order_by(PatientDB.version, PatientDB.id)
+                    .limit(CHUNK)
+                ).all()
+                for r in rows:
+                    self.upsert(r.id, r.name, r.phone, r.register_time, r.version or 0)
+                if rows:
+                    self._cursor = (rows[-1].version or 0, rows[-1].id)
+                seen += len(rows)
+                if len(rows) < CHUNK:
+                    break
+            for pid, version in db.execute(
+                select(TombstoneDB.entity_id, TombstoneDB.version)
+                .where(TombstoneDB.entity == "patient", TombstoneDB.version > self._tomb_version,
+                       TombstoneDB.version <= top)
+                .order_by(TombstoneDB.version)
+            ):
+                self.remove(pid, version)
+                self._tomb_version = version
+                seen += 1
+            self._last_refresh = time.monotonic()
+            return seen
+        finally:
+            self._refresh_lock.release()
+
+    def maybe_refresh(self, db: Session):
+        if time.monotonic() - self._last_refresh >= settings.SEARCH_REFRESH_SECONDS:
+            self.refresh(db)
+
+    # --- 构建与快照 ---
+
+    def start(self, session_factory):
+        """后台线程中加载快照并补齐增量；构建完成前检索回退到数据库查询，重复调用无副作用"""
+        with self._write_lock:
+            if self._builder is not None:
+                return
+            self._builder = threading.Thread(target=self._build, args=(session_factory,),
+                                             name="patient-search-build", daemon=True)
+        self._builder.start()
+
+    def _build(self, session_factory):
+        started = time.perf_counter()
+        loaded = self.load_snapshot(settings.SEARCH_SNAPSHOT_PATH)
+        try:
+            with session_factory() as db:
+                synced = self.refresh(db)
+        except Exception:
+            logger.exception("patient search index build failed")
+            self._builder = None
+            return
+        with self._write_lock:
+            self._rebuild_postings()
+            self.ready = True
+        logger.info("patient search index ready: %d patients (%d from snapshot, %d synced) in %.1fs",
+                    len(self._docs), loaded, synced, time.perf_counter() - started)
+
+    def load_snapshot(self, path: str) -> int:
+        if not path or not os.path.exists(path):
+            return 0
+        try:
+            with open(path, "rb") as fh:
+                data = orjson.loads(fh.read())
+            self._docs = {pid: _Doc(name, phone, initials, ts, version)
+                          for pid, name, phone, initials, ts, version in data["docs"]}
+            self._cursor = tuple(data["cursor"])
+            self._tomb_version = data["tomb_version"]
+        except (OSError, ValueError, KeyError, TypeError):
+            logger.warning("ignoring unreadable patient search snapshot %s", path)
+            self._docs, self._cursor, self._tomb_version = {}, (-1, ""), 0
+            return 0
+        return len(self._docs)
+
+    def save_snapshot(self, path: str):
+        if not path or not self.ready:
+            return
+        with self._write_lock:
+            data = {
+                "cursor": list(self._cursor),
+                "tomb_version": self._tomb_version,
+                "docs": [[pid, d.name, d.phone, d.initials, d.ts, d.version] for pid, d in self._docs.items()],
+            }
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as fh:
+            fh.write(orjson.dumps(data))
+        os.replace(tmp, path)
+
+    # --- 查询 ---
+
+    def _scan(self, key: str, match, best: int, limit: int, hits: Dict[str, int]):
+        """从新到旧扫描倒排表；最高分命中已满 limit 条、命中满 HIT_LIMIT 条或达到扫描上限时停止"""
+        posting = self._postings.get(key)
+        if not posting:
+            return
+        top = found = 0
+        for n, pid in enumerate(reversed(posting)):
+            if n >= SCAN_LIMIT:
+                break
+            doc = self._docs.get(pid)
+            score = match(doc) if doc is not None else 0
+            if score and score > hits.get(pid, 0):
+                hits[pid] = score
+                found += 1
+                top += score == best
+                if top >= limit or found >= HIT_LIMIT:
+                    break
+
+    def search(self, q: str, limit: int) -> List[str]:
+        """返回按得分与挂号时间排序的患者 ID"""
+        q = q.strip().lower()
+        if not q:
+            return []
+        hits: Dict[str, int] = {}
+        for pid in (q, q.upper()):
+            if pid in self._docs:
+                hits[pid] = SCORE_ID
+
+        digits = q.isdigit()
+        if digits and len(q) >= PHONE_KEY_LEN:
+            self._scan(f"t:{q[-PHONE_KEY_LEN:]}",
+                       lambda d: SCORE_PHONE if d.phone == q else SCORE_PHONE_SUFFIX if d.phone.endswith(q) else 0,
+                       SCORE_PHONE_SUFFIX, limit, hits)
+
+        if not digits:
+            if q.isascii() and q.isalpha():
+                self._scan(f"i:{q}",
+                           lambda d: SCORE_INITIALS_EXACT if d.initials == q else
+                           SCORE_INITIALS_PREFIX if d.initials.startswith(q) else 0,
+                           SCORE_INITIALS_EXACT, limit, hits)
+            # 姓名：取最短的 n-gram 倒排表作为候选，再校验子串
+            grams = [q] if len(q) == 1 else [q[i:i + 2] for i in range(len(q) - 1)]
+            key = min((f"n:{g}" for g in grams), key=lambda k: len(self._postings.get(k, ())))
+
+            def match_name(d: _Doc) -> int:
+                name = d.name.lower()
+                if name == q:
+                    return SCORE_NAME_EXACT
+                if name.startswith(q):
+                    return SCORE_NAME_PREFIX
+                return SCORE_NAME_CONTAINS if q in name else 0
+
+            # 单字查询几乎不会有同名全匹配，按姓氏（前缀）命中数提前结束
+            self._scan(key, match_name, SCORE_NAME_EXACT if len(q) > 1 else SCORE_NAME_PREFIX, limit, hits)
+
+        docs = self._docs
+        ranked = sorted(hits, key=lambda pid: (-hits[pid], -(docs[pid].ts if pid in docs else 0)))
+        return ranked[:limit]
+
+
+patient_index = PatientSearchIndex()
+
+
+def index_patient(p: PatientDB):
+    """挂号或修改姓名 / 电话提交后写入本进程索引，无需等待下一次同步"""
+    patient_index.upsert(p.id, p.name, p.phone, p.register_time, p.version or 0)
+
+
+def _like_prefix(q: str) -> str:
+    """转义 LIKE 通配符后作为前缀模式，配合 escape="\\" 使用"""
+    return q.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+
+
+def _fallback_stmt(q: str, limit: int):
+    # 索引尚未构建完成时的退路：只做 ID 精确与姓名前缀，均走索引；电话尾号需要前导通配符（全表扫描），
+    # 索引就绪前不返回电话命中
+    return (select(*PATIENT_COLUMNS)
+            .where(or_(PatientDB.id == q, PatientDB.name.like(_like_prefix(q), escape="\\")))
+            .order_by(PatientDB.register_time.desc())
+            .limit(limit))
+
+
+def search_patients(db: Session, q: str, limit: int) -> bytes:
+    """检索患者并返回与列表接口同格式的 JSON；异步模式下经 AsyncSession.run_sync 调用"""
+    if not patient_index.ready:
+        patient_index.start(SessionLocal)
+        q = q.strip()
+        return patient_rows_json(db.execute(_fallback_stmt(q, limit)).all()) if q else b"[]"
+    patient_index.maybe_refresh(db)
+    ids = patient_index.search(q, limit)
+    if not ids:
+        return b"[]"
+    rows = {r.id: r for r in db.execute(select(*PATIENT_COLUMNS).where(PatientDB.id.in_(ids)))}
+    return patient_rows_json([rows[i] for i in ids if i in rows])
@@ -0,0 +1,163 @@
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, Iterable, Optional, Sequence, Tuple
+
+import orjson
+from fastapi import HTTPException, Response
+
+from .models import PatientDB, MedicationDB, PrescriptionDB, PrescriptionItemDB
+from .pagination import NEXT_CURSOR_HEADER
+
+# 列表接口直接按列取行并用 orjson 编码为字节，跳过 ORM 实体构造、response_model 二次校验
+# 与 jsonable_encoder；路由上仍声明 response_model，OpenAPI 文档保持不变。
+# 下列列顺序与字段名即为响应结构，需与 schemas 中对应模型保持一致。
+
+PATIENT_COLUMNS = (
+    PatientDB.id, PatientDB.name, PatientDB.age, PatientDB.gender, PatientDB.phone,
+    PatientDB.register_time, PatientDB.status, PatientDB.department,
+    PatientDB.symptoms, PatientDB.diagnosis, PatientDB.queue_no,
+)
+MEDICATION_COLUMNS = (
+    MedicationDB.id, MedicationDB.name, MedicationDB.spec, MedicationDB.stock, MedicationDB.unit,
+    MedicationDB.price, MedicationDB.category,
+)
+PRESCRIPTION_COLUMNS = (
+    PrescriptionDB.id, PrescriptionDB.patient_id, PrescriptionDB.doctor_id,
+    PrescriptionDB.created_at, PrescriptionDB.status,
+)
+PRESCRIPTION_ITEM_COLUMNS = (
+    PrescriptionItemDB.prescription_id, PrescriptionItemDB.medication_id,
+    PrescriptionItemDB.med_name, PrescriptionItemDB.dosage, PrescriptionItemDB.quantity,
+)
+
+
+class RawJSONResponse(Response):
+    """内容已是 JSON 字节，原样输出"""
+    media_type = "application/json"
+
+
+def fmt_minute(dt: Optional[datetime]) -> Optional[str]:
+    # 与 strftime("%Y-%m-%d %H:%M") 输出一致，isoformat 为 C 实现，快一个数量级
+    return dt.isoformat(" ", "minutes") if dt is not None else None
+
+
+# --- 字段投影（?fields=）---
+# 响应字段名 -> (列, 输出转换)。投影下推到 SELECT，未选取的列（如较长的 symptoms / diagnosis）不从库中读出；
+# 分页排序所需的列即使未选取也会查询，但不输出。
+
+PATIENT_FIELDS = {
+    "id": (PatientDB.id, None), "name": (PatientDB.name, None), "age": (PatientDB.age, None),
+    "gender": (PatientDB.gender, None), "phone": (PatientDB.phone, None),
+    "registerTime": (PatientDB.register_time, fmt_minute), "status": (PatientDB.status, None),
+    "department": (PatientDB.department, None), "symptoms": (PatientDB.symptoms, None),
+    "diagnosis": (PatientDB.diagnosis, None), "queueNo": (PatientDB.queue_no, None),
+}
+MEDICATION_FIELDS = {
+    "id": (MedicationDB.id, None), "name": (MedicationDB.name, None), "spec": (MedicationDB.spec, None),
+    "stock": (MedicationDB.stock, None), "unit": (MedicationDB.unit, None), "price": (MedicationDB.price, None),
+    "category": (MedicationDB.category, None),
+}
+# medications 不是主单列：未选取时整页不再查询明细
+PRESCRIPTION_FIELDS = {
+    "id": (PrescriptionDB.id, None), "patientId": (PrescriptionDB.patient_id, None),
+    "doctorId": (PrescriptionDB.doctor_id, None), "createdAt": (PrescriptionDB.created_at, fmt_minute),
+    "status": (PrescriptionDB.status, None), "medications": (None, None),
+}
+
+
+def parse_fields(value: Optional[str], available: Dict[str, tuple]) -> Optional[Tuple[str, ...]]:
+    """解析逗号分隔的 ?fields=，按 available 的顺序返回（同一组字段的写法不同也得到相同结果）；未传时为 None"""
+    if not value:
+        return None
+    names = {n.strip() for n in value.split(",") if n.strip()}
+    unknown = names - available.keys()
+    if unknown:
+        raise HTTPException(400, f"Unknown fields: {', '.join(sorted(unknown))}")
+    return tuple(n for n in available if n in names)
+
+
+def projected_columns(available: Dict[str, tuple], fields: Sequence[str], keys: Sequence = ()) -> list:
+    """投影字段对应的列，末尾补上排序键中未被选取的列"""
+    cols = [available[n][0] for n in fields if available[n][0] is not None]
+    selected = {c.key for c in cols}
+    return cols + [k for k in keys if k.key not in selected]
+
+
+def projected_rows_json(rows: Iterable, available: Dict[str, tuple], fields: Sequence[str]) -> bytes:
+    """projected_columns 行 -> 只含所选字段的 JSON 列表"""
+    out = [(n, available[n][1]) for n in fields]
+    return orjson.dumps([{n: conv(v) if conv else v for (n, conv), v in zip(out, r)} for r in rows])
+
+
+def patient_out(p: PatientDB) -> dict:
+    return {**p.__dict__, "registerTime": fmt_minute(p.register_time), "queueNo": p.queue_no}
+
+
+def prescription_out(p: PrescriptionDB) -> dict:
+    items = [{"medicationId": i.medication_id, "name": i.med_name, "dosage": i.dosage, "quantity": i.quantity} for i in p.items]
+    return {
+        "id": p.id, "patientId": p.patient_id, "doctorId": p.doctor_id,
+        "createdAt": fmt_minute(p.created_at),
+        "status": p.status, "medications": items
+    }
+
+
+def patient_row_out(r) -> dict:
+    """PATIENT_COLUMNS 行 -> PatientSchema 字典"""
+    return {"id": r[0], "name": r[1], "age": r[2], "gender": r[3], "phone": r[4],
+            "registerTime": fmt_minute(r[5]), "status": r[6], "department": r[7],
+            "symptoms": r[8], "diagnosis": r[9], "queueNo": r[10]}
+
+
+def patient_rows_json(rows: Iterable, fields: Optional[Sequence[str]] = None) -> bytes:
+    """PATIENT_COLUMNS 行 -> PatientSchema 列表 JSON；给出 fields 时为对应的投影行"""
+    if fields:
+        return projected_rows_json(rows, PATIENT_FIELDS, fields)
+    return orjson.dumps([patient_row_out(r) for r in rows])
+
+
+def medication_rows_json(rows: Iterable, fields: Optional[Sequence[str]] = None) -> bytes:
+    """MEDICATION_COLUMNS 行 -> MedicationSchema 列表 JSON；给出 fields 时为对应的投影行"""
+    if fields:
+        return projected_rows_json(rows, MEDICATION_FIELDS, fields)
+    return orjson.dumps([{"id": r[0], "name": r[1], "spec": r[2], "stock": r[3], "unit": r[4],
+                          "price": r[5], "category": r[6]} for r in rows])
+
+
+def prescription_rows_json(headers: Iterable, items: Iterable, fields: Optional[Sequence[str]] = None) -> bytes:
+    """PRESCRIPTION_COLUMNS 主单行 + PRESCRIPTION_ITEM_COLUMNS 明细行 -> PrescriptionRead 列表 JSON
+
+    给出 fields 时主单行为对应的投影行（末尾带排序键 id / created_at）。
+    """
+    by_rx = defaultdict(list)
+    for i in items:
+        by_rx[i[0]].append({"medicationId": i[1], "name": i[2], "dosage": i[3], "quantity": i[4]})
+    if fields:
+        out = [(n, PRESCRIPTION_FIELDS[n][1]) for n in fields if n != "medications"]
+        with_items = "medications" in fields
+        rows = []
+        for h in headers:
+            row = {n: conv(v) if conv else v for (n, conv), v in zip(out, h)}
+            if with_items:
+                row["medications"] = by_rx.get(h.id, [])
+            rows.append(row)
+        return orjson.dumps(rows)
+    return orjson.dumps([
+        {"id": h[0], "patientId": h[1], "doctorId": h[2], "createdAt": fmt_minute(h[3]),
+         "status": h[4], "medications": by_rx.get(h[0], [])}
+        for h in headers
+    ])
+
+
+def ledger_rows_json(rows: Iterable) -> bytes:
+    """inventory.LEDGER_COLUMNS 行 -> InventoryTxnRead 列表 JSON（流水时间保留到秒）"""
+    return orjson.dumps([
+        {"id": r[0], "medicationId": r[1], "kind": r[2], "quantity": r[3], "balanceAfter": r[4],
+         "prescriptionId": r[5], "note": r[6], "createdAt": r[7].isoformat(" ", "seconds")}
+        for r in rows
+    ])
+
+
+def page_response(body: bytes, next_cursor: Optional[str]) -> RawJSONResponse:
+    headers = {NEXT_CURSOR_HEADER: next_cursor} if next_cursor else None
+    return RawJSONResponse(content=body, headers=headers)
@@ -0,0 +1,206 @@
+import sys
+from collections import Counter
+from datetime import date, datetime
+from typing import Dict, Iterable, Tuple
+
+import orjson
+from sqlalchemy import case, event, func, inspect, literal, not_, exists, select, union_all
+from sqlalchemy.orm import Session
+
+from .config import settings
+from .models import (PatientDB, MedicationDB, PrescriptionDB, PrescriptionItemDB, InventoryTxnDB,
+                     DailyPatientStatDB, DailyPrescriptionStatDB, DailyDispenseStatDB,
+                     PatientArchiveDB, PrescriptionArchiveDB, PrescriptionItemArchiveDB)
+# 版本号钩子先于本模块的 after_flush 注册：SQLite 上计数器在业务事务内更新，加锁顺序为
+# 业务行 -> 版本计数器 -> 汇总行；其他数据库的版本号由独立短事务分配，业务事务不持有计数器锁
+from . import sync  # noqa: F401
+from .inventory import DISPENSE
+
+# 看板与挂号台 KPI 的汇总表：按天计数，写路径在同一事务内增减，/api/stats 只读汇总行。
+# ORM 写入（挂号、改状态、开处方）由下方 after_flush 钩子自动记账；绕过 ORM 的 Core 写语句（发药、批量发药）需手动调用。
+# 汇总表与业务表不一致时（如 datagen 直接写库、历史数据）用 python -m backend.stats rebuild 重建。
+
+_patients = DailyPatientStatDB.__table__
+_prescriptions = DailyPrescriptionStatDB.__table__
+_dispense = DailyDispenseStatDB.__table__
+
+
+def _upsert(db: Session, table, rows: list, keys: Tuple[str, ...], set_):
+    """单条多行 upsert；set_(冲突时的新行列) -> 冲突时的 SET 字典"""
+    if not rows:
+        return
+    rows = sorted(rows, key=lambda r: tuple(r[k] for k in keys))  # 固定加锁顺序
+    if db.get_bind().dialect.name == "mysql":
+        from sqlalchemy.dialects.mysql import insert
+        stmt = insert(table)
+        stmt = stmt.on_duplicate_key_update(set_(stmt.inserted))
+    else:
+        from sqlalchemy.dialects.sqlite import insert  # PostgreSQL 的 insert 接口相同
+        stmt = insert(table)
+        stmt = stmt.on_conflict_do_update(index_elements=list(keys), set_=set_(stmt.excluded))
+    db.execute(stmt, rows)
+
+
+def upsert_add(db: Session, table, rows: list, keys: Tuple[str, ...], fields: Tuple[str, ...]):
+    """按主键累加：行不存在时插入，存在时各字段加上增量（单条多行语句）"""
+    _upsert(db, table, rows, keys, lambda new: {f: table.c[f] + new[f] for f in fields})
+
+
+def upsert_replace(db: Session, table, rows: list, keys: Tuple[str, ...], fields: Tuple[str, ...]):
+    """按主键覆盖：行不存在时插入，存在时以新值覆盖 fields（未列出的列保留原值）"""
+    _upsert(db, table, rows, keys, lambda new: {f: new[f] for f in fields})
+
+
+def bump_status(db: Session, table, deltas: Dict[Tuple[date, str], int]):
+    """{(日期, 状态): 增量} 写入患者或处方状态汇总"""
+    upsert_add(db, table, [{"day": day, "status": status, "count": n} for (day, status), n in deltas.items() if n],
+               ("day", "status"), ("count",))
+
+
+def record_dispense(db: Session, lines: Iterable[Tuple[str, int]], when: datetime = None):
+    """记入一批发药明细 (药品 ID, 数量)，金额按当前单价计"""
+    qty = Counter()
+    for mid, n in lines:
+        qty[mid] += n
+    if not qty:
+        return
+    prices = dict(db.execute(select(MedicationDB.id, MedicationDB.price).where(MedicationDB.id.in_(list(qty)))).all())
+    day = (when or datetime.now()).date()
+    upsert_add(db, _dispense, [{"day": day, "medication_id": mid, "quantity": n, "revenue": n * (prices.get(mid) or 0)}
+                               for mid, n in qty.items()], ("day", "medication_id"), ("quantity", "revenue"))
+
+
+@event.listens_for(Session, "after_flush")
+def _count_changes(db: Session, flush_context):
+    deltas = {PatientDB: Counter(), PrescriptionDB: Counter()}
+    time_attr = {PatientDB: "register_time", PrescriptionDB: "created_at"}
+    # 没有挂号 / 开立时间的旧数据不计入汇总，与 rebuild 一致
+    for obj in db.new:
+        if type(obj) in deltas and obj.status and getattr(obj, time_attr[type(obj)]) is not None:
+            deltas[type(obj)][getattr(obj, time_attr[type(obj)]).date(), obj.status] += 1
+    for obj in db.dirty:
+        if type(obj) not in deltas or getattr(obj, time_attr[type(obj)]) is None:
+            continue
+        hist = inspect(obj).attrs.status.history
+        if hist.has_changes():
+            day = getattr(obj, time_attr[type(obj)]).date()
+            for old in hist.deleted:
+                if old:
+                    deltas[type(obj)][day, old] -= 1
+            if obj.status:
+                deltas[type(obj)][day, obj.status] += 1
+    for obj in db.deleted:
+        if type(obj) in deltas and obj.status and getattr(obj, time_attr[type(obj)]) is not None:
+            deltas[type(obj)][getattr(obj, time_attr[type(obj)]).date(), obj.status] -= 1
+    bump_status(db, _patients, deltas[PatientDB])
+    bump_status(db, _prescriptions, deltas[PrescriptionDB])
+
+
+# --- 查询 ---
+
+def _by_status(db: Session, table, start: date, end: date) -> dict:
+    rows = db.execute(select(table.c.status, func.sum(table.c.count))
+                      .where(table.c.day >= start, table.c.day <= end).group_by(table.c.status)).all()
+    by_status = {status: int(n) for status, n in rows if n}
+    return {"total": sum(by_status.values()), "byStatus": by_status}
+
+
+def stats(db: Session, start: date, end: date, top: int = 10) -> dict:
+    """[start, end] 日期范围内的汇总；只读汇总表与药品库存索引"""
+    patients = _by_status(db, _patients, start, end)
+    patients["completionRate"] = round(patients["byStatus"].get("已完成", 0) / patients["total"], 4) if patients["total"] else 0
+
+    med = MedicationDB.__table__
+    qty, revenue = func.sum(_dispense.c.quantity), func.sum(_dispense.c.revenue)
+    in_range = (_dispense.c.day >= start, _dispense.c.day <= end)
+    by_med = db.execute(
+        select(_dispense.c.medication_id, med.c.name, med.c.category, qty, revenue)
+        .outerjoin(med, med.c.id == _dispense.c.medication_id)
+        .where(*in_range).group_by(_dispense.c.medication_id, med.c.name, med.c.category)
+        .order_by(revenue.desc()).limit(top)
+    ).all()
+    by_category = db.execute(
+        select(med.c.category, qty, revenue)
+        .outerjoin(med, med.c.id == _dispense.c.medication_id)
+        .where(*in_range).group_by(med.c.category).order_by(revenue.desc())
+    ).all()
+
+    warning, critical = settings.LOW_STOCK_WARNING, settings.LOW_STOCK_CRITICAL
+    low = db.execute(
+        select(func.count(), func.sum(case((med.c.stock <= critical, 1), else_=0)))
+        .where(med.c.stock <= warning)
+    ).one()
+    return {
+        "dateFrom": start.isoformat(),
+        "dateTo": end.isoformat(),
+        "patients": patients,
+        "prescriptions": _by_status(db, _prescriptions, start, end),
+        "dispensed": {
+            "quantity": sum(int(q) for _, q, _ in by_category),
+            "revenue": round(sum(r for _, _, r in by_category), 2),
+            "byMedication": [{"medicationId": mid, "name": name, "category": cat, "quantity": int(q),
+                              "revenue": round(r, 2)} for mid, name, cat, q, r in by_med],
+            "byCategory": [{"category": cat, "quantity": int(q), "revenue": round(r, 2)} for cat, q, r in by_category],
+        },
+        "lowStock": {"warning": int(low[0]), "critical": int(low[1] or 0),
+                     "warningThreshold": warning, "criticalThreshold": critical},
+    }
+
+
+def stats_json(db: Session, start: date, end: date, top: int = 10) -> bytes:
+    return orjson.dumps(stats(db, start, end, top))
+
+
+# --- 重建 ---
+
+def rebuild(db: Session) -> Dict[str, int]:
+    """清空并由业务表重算全部汇总（不提交），返回各表行数；应在低峰期执行
+
+    发药汇总以库存流水为准（按发药日期、当前单价）；早于库存流水上线的已发药处方没有发药时间，
+    按处方开立日期计入。
+    """
+    for table in (_patients, _prescriptions, _dispense):
+        db.execute(table.delete())
+    counts = {}
+    # 在线表与归档表合并计数，归档前后重建结果一致
+    for table, models in ((_patients, (PatientDB, PatientArchiveDB)),
+                          (_prescriptions, (PrescriptionDB, PrescriptionArchiveDB))):
+        time_col = "register_time" if table is _patients else "created_at"
+        rows = union_all(*(select(getattr(m, time_col).label("t"), m.status.label("status")) for m in models)).subquery()
+        day = func.date(rows.c.t)
+        src = (select(day, rows.c.status, func.count())
+               .where(rows.c.t.isnot(None), rows.c.status.isnot(None)).group_by(day, rows.c.status))
+        counts[table.name] = db.execute(table.insert().from_select(["day", "status", "count"], src)).rowcount
+
+    txn = InventoryTxnDB
+    from_ledger = (select(func.date(txn.created_at).label("day"), txn.medication_id.label("mid"),
+                          (-txn.quantity).label("qty"))
+                   .where(txn.kind == DISPENSE))
+    legacy = [
+        select(func.date(px.created_at), item.medication_id, item.quantity)
+        .join(px, px.id == item.prescription_id)
+        .where(px.status == "已发药", px.created_at.isnot(None),
+               not_(exists().where(txn.prescription_id == px.id)))
+        for px, item in ((PrescriptionDB, PrescriptionItemDB), (PrescriptionArchiveDB, PrescriptionItemArchiveDB))
+    ]
+    lines = union_all(from_ledger, *legacy).subquery()
+    med = MedicationDB.__table__
+    src = (select(lines.c.day, lines.c.mid, func.sum(lines.c.qty),
+                  func.sum(lines.c.qty * func.coalesce(med.c.price, literal(0))))
+           .join(med, med.c.id == lines.c.mid)
+           .group_by(lines.c.day, lines.c.mid))
+    counts[_dispense.name] = db.execute(
+        _dispense.insert().from_select(["day", "medication_id", "quantity", "revenue"], src)).rowcount
+    return counts
+
+
+if __name__ == "__main__":
+    # 回填 / 校正：python -m backend.stats rebuild
+    from .database import SessionLocal
+
+    if sys.argv[1:] != ["rebuild"]:
+        raise SystemExit("usage: python -m backend.stats rebuild")
+    with SessionLocal() as session:
+        result = rebuild(session)
+        session.commit()
+    print("stats rebuilt: " + ", ".join(f"{name}={n} rows" for name, n in result.items()))
@@ -0,0 +1,186 @@
+import logging
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, Set
+
+from sqlalchemy import event, func, select
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlalchemy.orm.util import identity_key
+
+from .config import settings
+from .database import version_engine
+from .models import (PatientDB, MedicationDB, PrescriptionDB, PrescriptionItemDB, SyncCounterDB, SyncPendingDB,
+                     TombstoneDB)
+
+# 参与增量同步的实体及其在同步响应中的名称
+TRACKED = {PatientDB: "patient", MedicationDB: "medication", PrescriptionDB: "prescription"}
+
+_VERSION_KEY = "sync_version"
+_PENDING_KEY = "sync_pending"
+_COMMITTED_KEY = "sync_committed"
+_counter = SyncCounterDB.__table__
+_pending = SyncPendingDB.__table__
+
+logger = logging.getLogger("his.sync")
+
+# SQLite 同一时刻只有一个写事务，版本号在业务事务内分配即按提交顺序递增；在独立连接上
+# 另开写事务反而会等待业务事务的库锁
+_IN_TRANSACTION = version_engine.dialect.name == "sqlite"
+_last_reap = 0.0
+
+
+def _increment(conn) -> int:
+    res = conn.execute(_counter.update().where(_counter.c.id == 1).values(value=_counter.c.value + 1))
+    if res.rowcount == 0:
+        conn.execute(_counter.insert().values(id=1, value=1))
+    return conn.execute(select(_counter.c.value).where(_counter.c.id == 1)).scalar_one()
+
+
+def _allocate() -> int:
+    """在独立的短事务中取号并登记为未结束；计数器行锁只持有到这个短事务提交
+
+    取号事务按计数器行锁串行提交，读方只要看到某个版本号，更小的号及其登记一定也已可见。
+    """
+    with version_engine.begin() as conn:
+        v = _increment(conn)
+        conn.execute(_pending.insert().values(version=v, created_at=datetime.now()))
+    return v
+
+
+def _discard(v: int):
+    """业务事务回滚后撤销登记，否则安全高水位会停在该版本之前直到超时清理"""
+    try:
+        with version_engine.begin() as conn:
+            conn.execute(_pending.delete().where(_pending.c.version == v))
+    except Exception:
+        logger.exception("failed to discard pending sync version %d", v)
+
+
+def next_version(db: Session) -> int:
+    """为当前事务分配一个变更版本号（同一事务内复用）
+
+    版本号在独立的短事务中分配，并在 sync_pending 中登记；业务事务随后在自己的事务内删除这条
+    登记，提交时与业务行一同生效。版本号因此不再按提交顺序递增，读方改用安全高水位
+    （见 current_version），按 since 拉取时仍不会漏掉"版本小但提交晚"的行。
+    """
+    v = db.info.get(_VERSION_KEY)
+    if v is None:
+        if _IN_TRANSACTION:
+            v = _increment(db)
+        else:
+            v = _allocate()
+            db.info[_PENDING_KEY] = v
+            db.execute(_pending.delete().where(_pending.c.version == v))
+        db.info[_VERSION_KEY] = v
+    return v
+
+
+def _reap(cutoff: datetime):
+    """清理超时仍未结束的登记：所属事务仍在进行时它已删除该行并持有行锁，DELETE 会等它结束后
+    跳过；只有所属事务已不存在（进程崩溃、回滚后撤销失败）的登记会被删除"""
+    try:
+        with version_engine.begin() as conn:
+            n = conn.execute(_pending.delete().where(_pending.c.created_at < cutoff)).rowcount
+        if n:
+            logger.warning("reaped %d abandoned sync versions", n)
+    except Exception:
+        logger.exception("failed to reap abandoned sync versions")
+
+
+def current_version(db: Session) -> int:
+    """安全高水位：不大于它的版本号所属的写事务都已结束（提交或回滚）
+
+    计数器与最小未结束版本在同一条语句中读取（同一快照），高水位之前的变更此后不会再出现。
+    """
+    global _last_reap
+    oldest = select(func.min(_pending.c.version).label("version"),
+                    func.min(_pending.c.created_at).label("created_at")).subquery()
+    top = select(_counter.c.value).where(_counter.c.id == 1).scalar_subquery()
+    value, pending, created = db.execute(select(top, oldest.c.version, oldest.c.created_at)).one()
+    if pending is None:
+        return value or 0
+    cutoff = datetime.now() - timedelta(seconds=settings.SYNC_PENDING_TIMEOUT)
+    if created < cutoff and time.monotonic() - _last_reap > settings.SYNC_PENDING_TIMEOUT:
+        _last_reap = time.monotonic()
+        _reap(cutoff)
+    return pending - 1
+
+
+# 增量同步下发的各类变更及其版本列
+CHANGE_COLUMNS = (PatientDB.version, MedicationDB.version, PrescriptionDB.version, TombstoneDB.version)
+
+
+def page_end(db: Session, since: int, until: int, limit: int) -> int:
+    """(since, until] 内的变更超过 limit 行时，返回更小的上界使本页不超过 limit 行
+
+    同一版本的行不拆到两页（客户端只记一个版本号）；单个版本就超过 limit 行时整版本下发。
+    """
+    versions = sorted(v for col in CHANGE_COLUMNS for v in db.execute(
+        select(col).where(col > since, col <= until).order_by(col).limit(limit + 1)).scalars())
+    if len(versions) <= limit:
+        return until
+    cut = versions[limit]  # 第一条放不下的行所在的版本
+    return cut if versions[0] == cut else cut - 1
+
+
+def stamp(db: Session, model, ids: Iterable[str]) -> int:
+    """将已写入的行标记为当前事务版本，返回版本号
+
+    ORM 变更由 flush 钩子自动调用；绕过 ORM 的 Core 写语句应在业务行更新完成后手动调用。
+    """
+    ids = list(ids)
+    v = next_version(db)
+    if ids:
+        table = model.__table__
+        db.execute(table.update().where(table.c.id.in_(ids)).values(version=v))
+        # after_flush 时新插入的对象尚未进入 identity_map，从 db.new 中补找
+        pending = {obj.id: obj for obj in db.new if isinstance(obj, model)}
+        for key in ids:
+            obj = db.identity_map.get(identity_key(model, key)) or pending.get(key)
+            if obj is not None:
+                set_committed_value(obj, "version", v)
+    return v
+
+
+@event.listens_for(Session, "after_flush")
+def _stamp_versions(db: Session, flush_context):
+    # after_flush 时业务行已写入；SQLite 下计数器在本事务内加锁，放在业务行之后与其他写入的加锁顺序一致
+    touched: Dict[type, Set[str]] = defaultdict(set)
+    for obj in list(db.new) + list(db.dirty):
+        if isinstance(obj, PrescriptionItemDB):
+            # 明细变化视为主单变化
+            touched[PrescriptionDB].add(obj.prescription_id)
+        elif type(obj) in TRACKED and (obj in db.new or db.is_modified(obj, include_collections=False)):
+            touched[type(obj)].add(obj.id)
+    deleted = [obj for obj in db.deleted if type(obj) in TRACKED]
+    for obj in db.deleted:
+        if isinstance(obj, PrescriptionItemDB) and obj.prescription_id not in {d.id for d in deleted}:
+            touched[PrescriptionDB].add(obj.prescription_id)
+    if not touched and not deleted:
+        return
+
+    v = next_version(db)
+    for model, ids in touched.items():
+        stamp(db, model, ids)
+    if deleted:
+        db.execute(TombstoneDB.__table__.insert(), [
+            {"entity": TRACKED[type(obj)], "entity_id": obj.id, "version": v, "deleted_at": datetime.now()}
+            for obj in deleted
+        ])
+
+
+@event.listens_for(Session, "after_commit")
+def _mark_committed(db: Session):
+    db.info[_COMMITTED_KEY] = True
+
+
+@event.listens_for(Session, "after_transaction_end")
+def _reset_version(db: Session, transaction):
+    if transaction.parent is None:
+        db.info.pop(_VERSION_KEY, None)
+        committed = db.info.pop(_COMMITTED_KEY, False)
+        v = db.info.pop(_PENDING_KEY, None)
+        if v is not None and not committed:
+            _discard(v)
@@ -0,0 +1,5 @@
+"""Smart-HIS 后端压测与基准脚本
+
+各脚本以 ``python -m benchmarks.<name>`` 运行，默认使用本地 SQLite 文件，
+可通过环境变量 DATABASE_URL 指向本地 MySQL。
+"""
@@ -0,0 +1,166 @@
+"""压测脚本共用的工具：延迟统计、报告输出、uvicorn 子进程"""
+import contextlib
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional
+
+import httpx
+
+
+def default_database_url(name: str) -> str:
+    """未设置 DATABASE_URL 时使用临时目录下的 SQLite 文件"""
+    url = os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(tempfile.gettempdir(), name)}")
+    return url
+
+
+def percentile(samples, pct: float) -> float:
+    """最近秩法百分位；samples 为空时返回 0"""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    idx = min(len(ordered) - 1, max(0, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[idx]
+
+
+class LatencyRecorder:
+    """按接口记录延迟样本与状态码"""
+
+    def __init__(self):
+        self.samples: Dict[str, List[float]] = defaultdict(list)
+        self.statuses: Dict[str, Counter] = defaultdict(Counter)
+        self.started = time.perf_counter()
+        self.finished: Optional[float] = None
+
+    def record(self, endpoint: str, seconds: float, status: int):
+        self.samples[endpoint].append(seconds)
+        self.statuses[endpoint][status] += 1
+
+    def stop(self):
+        self.finished = time.perf_counter()
+
+    @property
+    def elapsed(self) -> float:
+        return (self.finished or time.perf_counter()) - self.started
+
+    def summary(self) -> Dict[str, dict]:
+        out = {}
+        for endpoint in sorted(self.samples):
+            s = self.samples[endpoint]
+            out[endpoint] = {
+                "count": len(s),
+                "rps": len(s) / self.elapsed if self.elapsed else 0.0,
+                "p50_ms": percentile(s, 50) * 1000,
+                "p95_ms": percentile(s, 95) * 1000,
+                "p99_ms": percentile(s, 99) * 1000,
+                "max_ms": max(s) * 1000,
+                "statuses": {str(k): v for k, v in sorted(self.statuses[endpoint].items())},
+            }
+        return out
+
+
+def print_report(summary: Dict[str, dict], baseline: Optional[Dict[str, dict]] = None):
+    """打印各接口吞吐与延迟；给出基线时附带 p95 与吞吐的相对变化"""
+    header = f"{'endpoint':<44} {'count':>7} {'req/s':>8} {'p50':>8} {'p95':>8} {'p99':>8} {'max':>8}  statuses"
+    if baseline:
+        header += "   Δp95    Δreq/s"
+    print(header)
+    for endpoint, m in summary.items():
+        line = (f"{endpoint:<44} {m['count']:>7} {m['rps']:>8.1f} {m['p50_ms']:>8.1f} {m['p95_ms']:>8.1f}"
+                f" {m['p99_ms']:>8.1f} {m['max_ms']:>8.1f}  {m['statuses']}")
+        base = (baseline or {}).get(endpoint)
+        if base:
+            d95 = (m["p95_ms"] - base["p95_ms"]) / base["p95_ms"] * 100 if base["p95_ms"] else 0.0
+            drps = (m["rps"] - base["rps"]) / base["rps"] * 100 if base["rps"] else 0.0
+            line += f"  {d95:>+6.1f}%  {drps:>+7.1f}%"
+        print(line)
+    print("latencies in ms")
+
+
+def save_report(path: str, summary: Dict[str, dict], meta: dict):
+    with open(path, "w", encoding="utf-8") as fh:
+        json.dump({"meta": meta, "endpoints": summary}, fh, ensure_ascii=False, indent=2)
+
+
+def load_report(path: str) -> Dict[str, dict]:
+    with open(path, encoding="utf-8") as fh:
+        return json.load(fh)["endpoints"]
+
+
+@contextlib.contextmanager
+def uvicorn_server(port: int, env: Optional[dict] = None, workers: int = 1, with_process: bool = False):
+    """以子进程启动后端并等待就绪，退出时终止；with_process 时产出 (base_url, Popen) 供采样进程指标"""
+    args = [sys.executable, "-m", "uvicorn", "backend.main:app", "--port", str(port), "--log-level", "warning"]
+    if workers > 1:
+        args += ["--workers", str(workers)]
+    # 后端按 WEB_CONCURRENCY 均分连接预算
+    proc = subprocess.Popen(args, env={**os.environ, "DEBUG_MODE": "false", "WEB_CONCURRENCY": str(workers),
+                                       **(env or {})})
+    base = f"http://127.0.0.1:{port}"
+    try:
+        for _ in range(200):
+            try:
+                httpx.get(f"{base}/openapi.json", timeout=1)
+                break
+            except httpx.HTTPError:
+                if proc.poll() is not None:
+                    raise RuntimeError("uvicorn exited during startup")
+                time.sleep(0.1)
+        yield (base, proc) if with_process else base
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(timeout=15)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+
+
+class RssSampler:
+    """后台线程按固定间隔读取 /proc/<pid>/status 的 VmRSS，记录峰值（仅 Linux）"""
+
+    def __init__(self, pid: int, interval: float = 0.01):
+        self.pid = pid
+        self.interval = interval
+        self.peak_kb = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def rss_kb(self) -> int:
+        with open(f"/proc/{self.pid}/status") as fh:
+            for line in fh:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+        return 0
+
+    def wait_steady(self, window: float = 3.0, tolerance_kb: int = 1024, timeout: float = 300.0) -> int:
+        """等待 RSS 在 window 秒内变化不超过 tolerance_kb（如启动时后台构建的内存索引完成），返回当时 RSS"""
+        deadline = time.perf_counter() + timeout
+        last = self.rss_kb()
+        while time.perf_counter() < deadline:
+            time.sleep(window)
+            now = self.rss_kb()
+            if abs(now - last) <= tolerance_kb:
+                return now
+            last = now
+        return last
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak_kb = max(self.peak_kb, self.rss_kb())
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self.peak_kb = self.rss_kb()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak_kb = max(self.peak_kb, self.rss_kb())
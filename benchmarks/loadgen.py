@@ -0,0 +1,140 @@
+"""门诊全流程负载驱动
+
+每个虚拟用户循环执行一次完整就诊：
+  挂号 POST /api/patients → 医生候诊队列 GET /api/patients → 取药品字典 GET /api/medications
+  → 开方 POST /api/prescriptions → 发药台待发列表 GET /api/prescriptions → 发药 POST .../dispense
+按接口统计吞吐与 p50/p95/p99 延迟，可保存为 JSON 并与上一版本的结果对比。
+
+    python -m benchmarks.loadgen --concurrency 32 --duration 30 --save v1.json
+    python -m benchmarks.loadgen --concurrency 32 --duration 30 --baseline v1.json
+    python -m benchmarks.loadgen --base-url http://127.0.0.1:8000   # 压测已启动的服务
+
+未指定 --base-url 时以 uvicorn 子进程启动后端；库为空时先用 datagen 生成一份小数据集。
+"""
+import argparse
+import asyncio
+import itertools
+import random
+import time
+from datetime import date
+
+import httpx
+
+from .common import LatencyRecorder, default_database_url, load_report, print_report, save_report, uvicorn_server
+from .datagen import build_parser as datagen_parser, doctor_id, generate
+
+
+async def call(client: httpx.AsyncClient, rec: LatencyRecorder, label: str, method: str, url: str, **kw):
+    start = time.perf_counter()
+    try:
+        r = await client.request(method, url, **kw)
+    except httpx.HTTPError:
+        rec.record(label, time.perf_counter() - start, 599)
+        return None
+    rec.record(label, time.perf_counter() - start, r.status_code)
+    return r
+
+
+async def visit(client: httpx.AsyncClient, rec: LatencyRecorder, rng: random.Random, uid: str, doctors: int):
+    today = date.today().isoformat()
+    pid = f"L{uid}"
+    r = await call(client, rec, "POST /api/patients", "POST", "/api/patients", json={
+        "id": pid, "name": "压测患者", "age": rng.randint(1, 90), "gender": rng.choice("男女"),
+        "phone": "13800000000", "registerTime": "", "status": "待诊", "department": "内科"})
+    if r is None or r.status_code >= 400:
+        return
+    await call(client, rec, "GET /api/patients?queue", "GET", "/api/patients",
+               params={"exclude_status": "已完成", "date_from": today, "limit": 50})
+
+    r = await call(client, rec, "GET /api/medications", "GET", "/api/medications")
+    if r is None or r.status_code != 200:
+        return
+    meds = r.json()
+    picks = rng.sample(meds, k=min(len(meds), rng.randint(1, 4)))
+    rxid = f"LRX{uid}"
+    r = await call(client, rec, "POST /api/prescriptions", "POST", "/api/prescriptions", json={
+        "id": rxid, "patientId": pid, "doctorId": doctor_id(rng.randrange(doctors)), "createdAt": "", "status": "已开立",
+        "medications": [{"medicationId": m["id"], "name": m["name"], "dosage": "1片 tid", "quantity": rng.randint(1, 3)}
+                        for m in picks]})
+    if r is None or r.status_code >= 400:
+        return
+
+    await call(client, rec, "GET /api/prescriptions?pending", "GET", "/api/prescriptions",
+               params={"status": "已开立", "limit": 50})
+    await call(client, rec, "POST /api/prescriptions/{id}/dispense", "POST", f"/api/prescriptions/{rxid}/dispense")
+
+
+async def drive(base: str, args) -> LatencyRecorder:
+    run = f"{int(time.time()) % 10 ** 6:06d}"
+    counter = itertools.count()
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+
+    async def user(client: httpx.AsyncClient, rec: LatencyRecorder, deadline: float, wid: int):
+        rng = random.Random(args.seed + wid)
+        while time.perf_counter() < deadline:
+            await visit(client, rec, rng, f"{run}-{next(counter):07d}", args.doctors)
+
+    async with httpx.AsyncClient(base_url=base, limits=limits, timeout=60) as client:
+        if args.warmup:
+            warm = LatencyRecorder()
+            await asyncio.gather(*(user(client, warm, time.perf_counter() + args.warmup, i)
+                                   for i in range(args.concurrency)))
+        rec = LatencyRecorder()
+        deadline = time.perf_counter() + args.duration
+        await asyncio.gather(*(user(client, rec, deadline, i) for i in range(args.concurrency)))
+        rec.stop()
+    return rec
+
+
+def ensure_dataset(args):
+    from sqlalchemy import func, select
+    from backend.database import Base, engine
+    from backend.models import DoctorDB
+
+    Base.metadata.create_all(bind=engine)
+    with engine.connect() as conn:
+        if conn.execute(select(func.count()).select_from(DoctorDB).where(DoctorDB.id == doctor_id(0))).scalar():
+            return
+    print(f"seeding {args.seed_patients} patients ...")
+    generate(datagen_parser().parse_args(["--patients", str(args.seed_patients), "--doctors", str(args.doctors),
+                                          "--medications", str(args.seed_medications), "--days", "30"]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", help="压测已运行的服务；不指定则启动本地 uvicorn")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=20.0)
+    parser.add_argument("--warmup", type=float, default=3.0)
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--workers", type=int, default=1, help="本地 uvicorn worker 数")
+    parser.add_argument("--doctors", type=int, default=200, help="与 datagen 生成的医生数一致")
+    parser.add_argument("--seed-patients", type=int, default=20000)
+    parser.add_argument("--seed-medications", type=int, default=300)
+    parser.add_argument("--seed", type=int, default=11)
+    parser.add_argument("--save", help="结果保存为 JSON")
+    parser.add_argument("--baseline", help="与之前保存的 JSON 对比")
+    args = parser.parse_args()
+
+    if args.base_url:
+        rec = asyncio.run(drive(args.base_url, args))
+    else:
+        url = default_database_url("his_bench.db")
+        ensure_dataset(args)
+        print(f"database {url}")
+        with uvicorn_server(args.port, workers=args.workers) as base:
+            rec = asyncio.run(drive(base, args))
+
+    summary = rec.summary()
+    visits = summary.get("POST /api/prescriptions/{id}/dispense", {}).get("count", 0)
+    print(f"concurrency={args.concurrency} duration={rec.elapsed:.1f}s completed visits={visits}"
+          f" ({visits / rec.elapsed:.1f}/s)")
+    print_report(summary, load_report(args.baseline) if args.baseline else None)
+    if args.save:
+        save_report(args.save, summary, {"concurrency": args.concurrency, "duration": rec.elapsed,
+                                         "base_url": args.base_url, "at": time.strftime("%Y-%m-%d %H:%M:%S")})
+        print(f"saved {args.save}")
+
+
+if __name__ == "__main__":
+    main()
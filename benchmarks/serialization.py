@@ -0,0 +1,115 @@
+"""列表接口序列化路径微基准（10k 行）
+
+对比两条路径从数据库取数到产出响应字节的耗时：
+  before  ORM 实体 + strftime 手工拼 dict + response_model 校验 + jsonable_encoder + json.dumps
+          （即 FastAPI 对返回 dict 列表的路由所做的处理）
+  after   按列取行 + isoformat + orjson 直接编码（serializers.patient_rows_json / prescription_rows_json）
+
+    python -m benchmarks.serialization --rows 10000 --repeat 5
+"""
+import argparse
+import json
+import os
+import statistics
+import tempfile
+import time
+from datetime import datetime, timedelta
+from typing import List
+
+
+def timed(fn, repeat: int) -> float:
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.gettempdir(), "his_serialization_bench.db")
+    if os.path.exists(path):
+        os.remove(path)
+    os.environ["DATABASE_URL"] = f"sqlite:///{path}"
+
+    from fastapi.encoders import jsonable_encoder
+    from pydantic import TypeAdapter
+    from sqlalchemy import insert, select
+    from sqlalchemy.orm import selectinload
+    from backend.database import Base, SessionLocal, engine
+    from backend.models import PatientDB, PrescriptionDB, PrescriptionItemDB
+    from backend.schemas import PatientSchema, PrescriptionRead
+    from backend.serializers import (PATIENT_COLUMNS, PRESCRIPTION_COLUMNS, PRESCRIPTION_ITEM_COLUMNS,
+                                     patient_rows_json, prescription_rows_json)
+
+    Base.metadata.create_all(bind=engine)
+    t0 = datetime(2024, 1, 1, 8, 0)
+    with engine.begin() as conn:
+        conn.execute(insert(PatientDB), [
+            {"id": f"P{i:07d}", "name": f"患者{i}", "age": 20 + i % 60, "gender": "男女"[i % 2], "phone": "13800000000",
+             "register_time": t0 + timedelta(seconds=i), "status": "待诊", "symptoms": "发热咳嗽三天，伴咽痛", "version": 0}
+            for i in range(args.rows)])
+        conn.execute(insert(PrescriptionDB), [
+            {"id": f"RX{i:07d}", "patient_id": f"P{i:07d}", "doctor_id": "DOC001",
+             "created_at": t0 + timedelta(seconds=i), "status": "已开立", "version": 0}
+            for i in range(args.rows)])
+        conn.execute(insert(PrescriptionItemDB), [
+            {"prescription_id": f"RX{i:07d}", "medication_id": f"M{k:03d}", "med_name": "阿莫西林胶囊",
+             "dosage": "0.25g tid", "quantity": 2}
+            for i in range(args.rows) for k in range(3)])
+
+    patients_adapter = TypeAdapter(List[PatientSchema])
+    rx_adapter = TypeAdapter(List[PrescriptionRead])
+
+    def fastapi_encode(adapter, content) -> bytes:
+        validated = adapter.validate_python(content)
+        return json.dumps(jsonable_encoder(adapter.dump_python(validated, mode="json")),
+                          ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+    def patients_before():
+        with SessionLocal() as db:
+            pts = db.query(PatientDB).order_by(PatientDB.register_time.desc()).all()
+            rows = [{**p.__dict__, "registerTime": p.register_time.strftime("%Y-%m-%d %H:%M")} for p in pts]
+            return fastapi_encode(patients_adapter, rows)
+
+    def patients_after():
+        with SessionLocal() as db:
+            rows = db.execute(select(*PATIENT_COLUMNS).order_by(PatientDB.register_time.desc())).all()
+            return patient_rows_json(rows)
+
+    def rx_before():
+        with SessionLocal() as db:
+            pxs = db.query(PrescriptionDB).options(selectinload(PrescriptionDB.items)).all()
+            rows = [{
+                "id": p.id, "patientId": p.patient_id, "doctorId": p.doctor_id,
+                "createdAt": p.created_at.strftime("%Y-%m-%d %H:%M"), "status": p.status,
+                "medications": [{"medicationId": i.medication_id, "name": i.med_name, "dosage": i.dosage,
+                                 "quantity": i.quantity} for i in p.items],
+            } for p in pxs]
+            return fastapi_encode(rx_adapter, rows)
+
+    def rx_after():
+        with SessionLocal() as db:
+            headers = db.execute(select(*PRESCRIPTION_COLUMNS)).all()
+            items = db.execute(select(*PRESCRIPTION_ITEM_COLUMNS)).all()
+            return prescription_rows_json(headers, items)
+
+    # 两条路径的输出应当等价
+    assert json.loads(patients_before()) == json.loads(patients_after())
+    assert sorted(json.loads(rx_before()), key=lambda r: r["id"]) == sorted(json.loads(rx_after()), key=lambda r: r["id"])
+
+    print(f"rows={args.rows} repeat={args.repeat} (median ms)")
+    print(f"{'endpoint':>14} {'before':>9} {'after':>9} {'speedup':>8}")
+    for name, before, after in (("patients", patients_before, patients_after),
+                                ("prescriptions", rx_before, rx_after)):
+        b, a = timed(before, args.repeat), timed(after, args.repeat)
+        print(f"{name:>14} {b * 1000:>9.1f} {a * 1000:>9.1f} {b / a:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,15 @@
 
-import React, { createContext, useContext, useState, useEffect } from 'react';
-import { Patient, Medication, Prescription } from '../types';
+import React, { createContext, useContext, useState, useEffect, useRef } from 'react';
+import { Patient, Medication, Prescription, Stats } from '../types';
 import { api } from '../services/apiService';
 
 interface AppContextType {
   patients: Patient[];
   medications: Medication[];
   prescriptions: Prescription[];
+  stats: Stats | null;
+  // 列表超过单次加载上限，界面只显示了其中一部分
+  truncated: boolean;
   refreshData: () => Promise<void>;
   addPatient: (p: Patient) => Promise<void>;
   updatePatient: (id: string, updates: Partial<Patient>) => Promise<void>;
@@ -15,60 +18,126 @@ interface AppContextType {
   updateInventory: (medId: string, change: number) => Promise<void>;
 }
 
+// 本地日期 YYYY-MM-DD（toISOString 为 UTC，跨零点时会错一天）
+const localToday = () => {
+  const d = new Date();
+  return `${d.getFullYear()}-${String(d.getMonth() + 1).padStart(2, '0')}-${String(d.getDate()).padStart(2, '0')}`;
+};
+
+// 按 id 去重，保留首次出现的顺序
+const byId = <T extends { id: string }>(rows: T[]) => [...new Map(rows.map(r => [r.id, r] as [string, T])).values()];
+
 const AppContext = createContext<AppContextType | undefined>(undefined);
 
 export const AppProvider: React.FC<{ children: React.ReactNode }> = ({ children }) => {
   const [patients, setPatients] = useState<Patient[]>([]);
   const [medications, setMedications] = useState<Medication[]>([]);
   const [prescriptions, setPrescriptions] = useState<Prescription[]>([]);
+  const [stats, setStats] = useState<Stats | null>(null);
+  const [truncated, setTruncated] = useState(false);
+
+  const versionRef = useRef<number | null>(null);
 
   const refreshData = async () => {
     try {
-      const [p, m, rx] = await Promise.all([
-        api.getPatients(),
+      // 先取基线版本再全量拉取，期间发生的变更会在下一次增量中重复下发，合并是幂等的
+      const { version } = await api.sync();
+      const [today, waiting, m, todayRx, pendingRx, st] = await Promise.all([
+        // 挂号台显示当日挂号；候诊队列与发药台的待办不限日期，按状态拉取，避免漏掉前几天未处理的
+        api.getAllPatients({ date_from: localToday() }),
+        api.getAllPatients({ exclude_status: '已完成' }),
         api.getMedications(),
-        api.getPrescriptions()
+        api.getAllPrescriptions({ date_from: localToday() }),
+        api.getAllPrescriptions({ status: '已开立' }),
+        api.getStats()
       ]);
-      setPatients(p);
+      const p = byId([...today.rows, ...waiting.rows]);
+      const rx = byId([...pendingRx.rows, ...todayRx.rows])
+        .sort((a, b) => (b.createdAt || '').localeCompare(a.createdAt || ''));
+      // 前几天开立的待发处方，其患者不在上面两个列表中，逐个补取姓名
+      const known = new Set(p.map(x => x.id));
+      const missing = [...new Set<string>(rx.map(x => x.patientId))].filter(id => !known.has(id));
+      const extra = await Promise.all(missing.map(id => api.getPatient(id).catch(() => null)));
+      versionRef.current = version;
+      setPatients([...p, ...extra.filter(Boolean)]);
       setMedications(m);
       setPrescriptions(rx);
+      setTruncated([today, waiting, todayRx, pendingRx].some(r => r.truncated));
+      setStats(st);
     } catch (e) {
       console.error("Failed to fetch data from Python backend:", e);
     }
   };
 
+  // 写操作后只拉取自上次同步以来的变更并按 id 合并
+  const syncChanges = async () => {
+    if (versionRef.current === null) return refreshData();
+    try {
+      // KPI 计数来自服务端汇总，与增量同步并行刷新；变更较多时服务端分页（more），以返回的 version 继续拉取
+      const [first, st] = await Promise.all([api.sync(versionRef.current), api.getStats()]);
+      setStats(st);
+      const delta = { ...first };
+      for (let page = first; page.more;) {
+        page = await api.sync(page.version);
+        (['patients', 'medications', 'prescriptions', 'deleted'] as const)
+          .forEach(k => { delta[k] = [...(delta[k] ?? []), ...(page[k] ?? [])]; });
+        delta.version = page.version;
+      }
+      const gone = (entity: string) => new Set<string>(
+        delta.deleted.filter((d: { entity: string }) => d.entity === entity).map((d: { id: string }) => d.id)
+      );
+      const merge = <T extends { id: string }>(rows: T[], changed: T[], removed: Set<string>) => {
+        const byId = new Map(changed.map(c => [c.id, c]));
+        const kept = rows.filter(r => !removed.has(r.id)).map(r => byId.get(r.id) ?? r);
+        const known = new Set(rows.map(r => r.id));
+        return [...changed.filter(c => !known.has(c.id) && !removed.has(c.id)), ...kept];
+      };
+      setPatients(prev => merge(prev, delta.patients, gone('patient')));
+      setMedications(prev => merge(prev, delta.medications, gone('medication')));
+      setPrescriptions(prev => merge(prev, delta.prescriptions, gone('prescription')));
+      versionRef.current = delta.version;
+    } catch (e) {
+      console.error("Failed to sync changes from Python backend:", e);
+    }
+  };
+
   useEffect(() => {
     refreshData();
+    // 其他工作站的挂号、开方、发药、库存变更通过推送触发增量同步，无需轮询
+    return api.subscribe(
+      ['patient.registered', 'patient.status', 'prescription.created', 'prescription.dispensed', 'medication.stock'],
+      () => { syncChanges(); }
+    );
   }, []);
 
   const addPatient = async (p: Patient) => {
     await api.addPatient(p);
-    await refreshData();
+    await syncChanges();
   };
 
   const updatePatient = async (id: string, updates: Partial<Patient>) => {
     await api.updatePatient(id, updates);
-    await refreshData();
+    await syncChanges();
   };
 
   const addPrescription = async (pres: Prescription) => {
     await api.addPrescription(pres);
-    await refreshData();
+    await syncChanges();
   };
 
   const updateInventory = async (medId: string, change: number) => {
     await api.updateInventory(medId, change);
-    await refreshData();
+    await syncChanges();
   };
 
   const dispenseMedication = async (prescriptionId: string) => {
     await api.dispenseMedication(prescriptionId);
-    await refreshData();
+    await syncChanges();
   };
 
   return (
     <AppContext.Provider value={{
-      patients, medications, prescriptions,
+      patients, medications, prescriptions, stats, truncated,
       refreshData, addPatient, updatePatient, addPrescription,
       dispenseMedication, updateInventory
     }}>
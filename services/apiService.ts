@@ -11,9 +11,56 @@ const getApiBase = () => {
 
 const API_BASE = getApiBase();
 
+// 将查询条件拼接为查询字符串，数组参数按后端约定重复传入
+const toQuery = (params?: Record<string, string | number | string[] | undefined>) => {
+  if (!params) return '';
+  const qs = new URLSearchParams();
+  Object.entries(params).forEach(([k, v]) => {
+    if (v === undefined) return;
+    (Array.isArray(v) ? v : [v]).forEach(item => qs.append(k, String(item)));
+  });
+  const str = qs.toString();
+  return str ? `?${str}` : '';
+};
+
+// 读写分离：写请求响应头给出读主库的截止时间，之后的列表读请求原样带回，服务端据此避开复制延迟（读己之写）
+let primaryUntil = '';
+const remember = (r: Response) => {
+  const v = r.headers.get('X-Primary-Until');
+  if (v) primaryUntil = v;
+  return r;
+};
+const readInit = (): RequestInit => (primaryUntil ? { headers: { 'X-Primary-Until': primaryUntil } } : {});
+
+// 列表分页：跟随响应头 X-Next-Cursor 逐页取完；超过 maxRows 行时停止，truncated 表示列表不完整
+const PAGE_SIZE = 500;
+const fetchAll = async (path: string, params: Record<string, string | number | string[] | undefined>, maxRows = 5000) => {
+  const rows: any[] = [];
+  let cursor: string | undefined;
+  do {
+    const r = await fetch(`${API_BASE}/${path}${toQuery({ ...params, cursor, limit: PAGE_SIZE })}`, readInit());
+    if (!r.ok) throw new Error('网络响应错误');
+    rows.push(...await r.json());
+    cursor = r.headers.get('X-Next-Cursor') ?? undefined;
+  } while (cursor && rows.length < maxRows);
+  return { rows, truncated: cursor !== undefined };
+};
+
 export const api = {
   // 患者相关
-  getPatients: () => fetch(`${API_BASE}/patients`).then(r => {
+  // 支持 status / exclude_status / date_from / date_to / department / cursor / limit
+  getPatients: (params?: Record<string, string | number | string[] | undefined>) => fetch(`${API_BASE}/patients${toQuery(params)}`, readInit()).then(r => {
+    if (!r.ok) throw new Error('网络响应错误');
+    return r.json();
+  }),
+  // 取完所有分页，返回 { rows, truncated }
+  getAllPatients: (params: Record<string, string | number | string[] | undefined>) => fetchAll('patients', params),
+  getPatient: (id: string) => fetch(`${API_BASE}/patients/${encodeURIComponent(id)}`, readInit()).then(r => {
+    if (!r.ok) throw new Error('网络响应错误');
+    return r.json();
+  }),
+  // 按姓名 / 电话尾号 / 拼音首字母检索，结果按匹配度排序
+  searchPatients: (q: string, limit = 20) => fetch(`${API_BASE}/patients/search${toQuery({ q, limit })}`).then(r => {
     if (!r.ok) throw new Error('网络响应错误');
     return r.json();
   }),
@@ -21,15 +68,20 @@ export const api = {
     method: 'POST',
     headers: { 'Content-Type': 'application/json' },
     body: JSON.stringify(p)
-  }).then(r => r.json()),
+  }).then(remember).then(r => r.json()),
   updatePatient: (id: string, updates: any) => fetch(`${API_BASE}/patients/${id}`, {
     method: 'PATCH',
     headers: { 'Content-Type': 'application/json' },
     body: JSON.stringify(updates)
-  }).then(r => r.json()),
+  }).then(remember).then(r => r.json()),
 
   // 药品相关
-  getMedications: () => fetch(`${API_BASE}/medications`).then(r => {
+  getMedications: () => fetch(`${API_BASE}/medications`, readInit()).then(r => {
+    if (!r.ok) throw new Error('网络响应错误');
+    return r.json();
+  }),
+  // 药品联想：药名 / 拼音首字母 / 分类 / 规格前缀匹配，返回含当前库存的前若干条
+  suggestMedications: (q: string, limit = 10) => fetch(`${API_BASE}/medications/suggest${toQuery({ q, limit })}`).then(r => {
     if (!r.ok) throw new Error('网络响应错误');
     return r.json();
   }),
@@ -37,19 +89,54 @@ export const api = {
     method: 'PATCH',
     headers: { 'Content-Type': 'application/json' },
     body: JSON.stringify({ change })
-  }).then(r => r.json()),
+  }).then(remember).then(r => r.json()),
 
   // 处方相关
-  getPrescriptions: () => fetch(`${API_BASE}/prescriptions`).then(r => {
+  // 支持 status / patient_id / doctor_id / date_from / date_to / cursor / limit
+  getPrescriptions: (params?: Record<string, string | number | string[] | undefined>) => fetch(`${API_BASE}/prescriptions${toQuery(params)}`, readInit()).then(r => {
     if (!r.ok) throw new Error('网络响应错误');
     return r.json();
   }),
+  getAllPrescriptions: (params: Record<string, string | number | string[] | undefined>) => fetchAll('prescriptions', params),
+  // 库存不足、药品不存在或禁忌配伍时返回 409，detail 为校验结果
   addPrescription: (pres: any) => fetch(`${API_BASE}/prescriptions`, {
     method: 'POST',
     headers: { 'Content-Type': 'application/json' },
     body: JSON.stringify(pres)
-  }).then(r => r.json()),
+  }).then(remember).then(async r => {
+    const body = await r.json();
+    if (!r.ok) throw Object.assign(new Error('处方开立失败'), { check: body.detail });
+    return body;
+  }),
+  // 只校验库存与配伍不写入，返回 { ok, errors, warnings }；医生编辑处方时调用
+  checkPrescription: (pres: any) => fetch(`${API_BASE}/prescriptions?dry_run=true`, {
+    method: 'POST',
+    headers: { 'Content-Type': 'application/json' },
+    body: JSON.stringify(pres)
+  }).then(r => {
+    if (!r.ok) throw new Error('网络响应错误');
+    return r.json();
+  }),
   dispenseMedication: (rxId: string) => fetch(`${API_BASE}/prescriptions/${rxId}/dispense`, {
     method: 'POST'
-  }).then(r => r.json())
+  }).then(remember).then(r => r.json()),
+
+  // 看板统计：不传日期默认当天，服务端只读汇总表
+  getStats: (params?: { date_from?: string; date_to?: string; top?: number }) => fetch(`${API_BASE}/stats${toQuery(params)}`).then(r => {
+    if (!r.ok) throw new Error('网络响应错误');
+    return r.json();
+  }),
+
+  // 订阅服务端推送（SSE），返回取消订阅函数；resync 表示推送积压被丢弃，需要补拉增量
+  subscribe: (topics: string[], onEvent: (e: { topic: string; [k: string]: any }) => void) => {
+    const source = new EventSource(`${API_BASE}/events${toQuery({ topics })}`);
+    [...topics, 'resync'].forEach(t => source.addEventListener(t, (ev) => onEvent(JSON.parse((ev as MessageEvent).data))));
+    return () => source.close();
+  },
+
+  // 增量同步：不传 since 仅返回当前版本号作为基线
+  sync: (since?: number) => fetch(`${API_BASE}/sync${toQuery({ since })}`).then(r => {
+    if (!r.ok) throw new Error('网络响应错误');
+    return r.json();
+  })
 };
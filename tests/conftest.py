@@ -0,0 +1,38 @@
+import os
+import tempfile
+import uuid
+
+# 须在导入 backend 之前指定测试库：默认临时 SQLite 文件，设置 TEST_DATABASE_URL 可改用 MySQL 测试库
+_tmp = tempfile.mkdtemp(prefix="his-tests-")
+os.environ["DATABASE_URL"] = os.environ.get("TEST_DATABASE_URL") or f"sqlite:///{os.path.join(_tmp, 'his.db')}"
+os.environ.update(SEARCH_SNAPSHOT_PATH="", READ_REPLICA_URLS="", DB_ASYNC="false", ADMISSION_CONTROL="false",
+                  REGISTRATION_GROUP_COMMIT="false")
+
+import pytest  # noqa: E402
+from fastapi.testclient import TestClient  # noqa: E402
+
+
+@pytest.fixture(scope="session")
+def tmp_dir() -> str:
+    return _tmp
+
+
+@pytest.fixture(scope="session", autouse=True)
+def database():
+    from backend.init_db import init_db
+
+    init_db()
+
+
+@pytest.fixture(scope="session")
+def client() -> TestClient:
+    from backend.main import app
+
+    # 不进入 with：不执行 startup，检索索引等后台同步线程不启动，SQL 计数不受其干扰
+    return TestClient(app)
+
+
+@pytest.fixture
+def run_id() -> str:
+    """本用例数据的 ID 前缀，用例之间共用一个库而互不影响"""
+    return f"T{uuid.uuid4().hex[:8]}"
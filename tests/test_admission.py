@@ -0,0 +1,64 @@
+import asyncio
+
+from backend.admission import AdmissionMiddleware, BULK, CRITICAL, classify
+from backend.config import settings
+
+PRESCRIBE = ("POST", "/api/prescriptions")
+LIST = ("GET", "/api/patients")
+
+
+def test_routes_are_classified():
+    assert classify(*PRESCRIBE) == CRITICAL
+    assert classify("POST", "/api/prescriptions/RX1/dispense") == CRITICAL
+    assert classify(*LIST) == BULK
+    assert classify("GET", "/api/export/patients") == BULK
+    assert classify("GET", "/api/stats") == "normal"
+    assert classify("GET", "/api/events") is None
+    assert classify("OPTIONS", "/api/patients") is None
+
+
+def test_overload_sheds_bulk_first_and_admits_critical_ahead_of_queued_bulk(monkeypatch):
+    # 总并发 4；bulk 最多 2 个并发、1 个排队；critical 可用满总并发
+    monkeypatch.setattr(settings, "ADMISSION_CONTROL", True)
+    monkeypatch.setattr(settings, "ADMISSION_MAX_CONCURRENCY", 4)
+    monkeypatch.setattr(settings, "ADMISSION_CLASSES", "critical=4/8/5,normal=2/2/5,bulk=2/1/5")
+
+    async def scenario():
+        gate = asyncio.Event()
+        entered = []
+
+        async def app(scope, receive, send):
+            entered.append(scope["name"])
+            await gate.wait()
+            await send({"type": "http.response.start", "status": 200, "headers": []})
+            await send({"type": "http.response.body", "body": b"{}"})
+
+        middleware = AdmissionMiddleware(app)
+
+        async def request(name, method, path):
+            sent = []
+
+            async def send(message):
+                sent.append(message)
+
+            await middleware({"type": "http", "method": method, "path": path, "name": name}, None, send)
+            start = sent[0]
+            return start["status"], dict(start["headers"]).get(b"retry-after")
+
+        bulk = [asyncio.create_task(request(f"bulk{i}", *LIST)) for i in range(4)]
+        await asyncio.sleep(0)
+        critical = [asyncio.create_task(request(f"critical{i}", *PRESCRIBE)) for i in range(3)]
+        for _ in range(5):
+            await asyncio.sleep(0)
+        # 满载：2 个 bulk + 2 个 critical 在执行，第 3 个 critical 与第 3 个 bulk 排队，第 4 个 bulk 已被拒
+        assert sorted(entered) == ["bulk0", "bulk1", "critical0", "critical1"]
+        gate.set()
+        return [await t for t in bulk], [await t for t in critical], entered
+
+    bulk, critical, entered = asyncio.run(scenario())
+
+    assert critical == [(200, None)] * 3
+    assert bulk[:3] == [(200, None)] * 3
+    assert bulk[3] == (503, b"5")
+    # 名额空出时先放行排队的 critical
+    assert entered.index("critical2") < entered.index("bulk2")
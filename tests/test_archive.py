@@ -0,0 +1,62 @@
+from datetime import datetime, timedelta
+
+from sqlalchemy import select
+
+from backend import archive
+from backend.database import SessionLocal
+from backend.models import (DoctorDB, PatientArchiveDB, PatientDB, PrescriptionArchiveDB, PrescriptionDB,
+                            PrescriptionItemDB, TombstoneDB)
+
+DAYS = 100
+
+
+def seed(run_id: str):
+    """两名早已结束就诊的患者，各有一张已发药处方；B 挂号更早，先被挑中"""
+    long_ago = datetime.now() - timedelta(days=2 * DAYS)
+    with SessionLocal() as db:
+        db.add(DoctorDB(id=f"{run_id}-D", name="归档医生", department="内科", title="医师"))
+        for i, name in enumerate(("B", "A")):
+            pid = f"{run_id}-{name}"
+            db.add(PatientDB(id=pid, name=f"归档患者{name}", age=50, gender="男", phone="0", status="已完成",
+                             register_time=long_ago + timedelta(minutes=i)))
+            db.flush()
+            db.add(PrescriptionDB(id=f"{pid}-RX", patient_id=pid, doctor_id=f"{run_id}-D", status="已发药",
+                                  created_at=long_ago + timedelta(minutes=i)))
+            db.flush()
+            db.add(PrescriptionItemDB(prescription_id=f"{pid}-RX", medication_id="M001", med_name="阿莫西林胶囊",
+                                      dosage="-", quantity=1))
+        db.commit()
+
+
+def test_patient_with_new_prescription_is_skipped(client, run_id, monkeypatch):
+    seed(run_id)
+    pick = archive.candidates
+    calls = []
+
+    def racing_candidates(db, cutoff, limit):
+        ids = pick(db, cutoff, limit)
+        if not calls:
+            # 挑选之后、加锁复核之前，另一工作站给 B 开了新处方并已提交
+            with SessionLocal() as other:
+                other.add(PrescriptionDB(id=f"{run_id}-B-NEW", patient_id=f"{run_id}-B", doctor_id=f"{run_id}-D",
+                                         status="已开立"))
+                other.commit()
+        calls.append(ids)
+        return ids
+
+    monkeypatch.setattr(archive, "candidates", racing_candidates)
+    # 每批 1 人：第一批只有 B 且复核不通过，归档应继续处理下一批
+    assert archive.run(SessionLocal, DAYS, 1) == 1
+    assert calls[:2] == [[f"{run_id}-B"], [f"{run_id}-A"]]
+
+    with SessionLocal() as db:
+        assert db.get(PatientDB, f"{run_id}-B") is not None
+        assert {rx for (rx,) in db.execute(select(PrescriptionDB.id).where(
+            PrescriptionDB.patient_id == f"{run_id}-B"))} == {f"{run_id}-B-RX", f"{run_id}-B-NEW"}
+        assert db.get(PatientDB, f"{run_id}-A") is None
+        assert db.get(PatientArchiveDB, f"{run_id}-A") is not None
+        assert db.get(PrescriptionArchiveDB, f"{run_id}-A-RX") is not None
+        assert db.execute(select(TombstoneDB.entity).where(TombstoneDB.entity_id == f"{run_id}-A")).scalar() == "patient"
+
+    # 按 ID 查询透明合并归档表
+    assert client.get(f"/api/patients/{run_id}-A").json()["name"] == "归档患者A"
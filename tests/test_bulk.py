@@ -0,0 +1,105 @@
+from typing import Dict
+
+import pytest
+from sqlalchemy import func, select
+from sqlalchemy.exc import OperationalError
+
+from backend import bulk
+from backend.config import settings
+from backend.database import SessionLocal
+from backend.models import (DailyPrescriptionStatDB, DoctorDB, InventoryTxnDB, MedicationDB, PatientDB,
+                            PrescriptionDB, PrescriptionItemDB)
+
+
+def add_medications(run_id: str, stock: Dict[str, int]):
+    with SessionLocal() as db:
+        db.add_all(MedicationDB(id=f"{run_id}-{m}", name=f"批量药{m}", spec="-", stock=s, unit="盒", price=2.0,
+                                category="测试") for m, s in stock.items())
+        db.commit()
+
+
+def stocks(run_id: str) -> Dict[str, int]:
+    with SessionLocal() as db:
+        return {mid.split("-", 1)[1]: s for mid, s in db.execute(
+            select(MedicationDB.id, MedicationDB.stock).where(MedicationDB.id.like(f"{run_id}-%")))}
+
+
+def test_bulk_adjust_reports_rows_and_rolls_back_only_the_failing_chunk(client, run_id, monkeypatch):
+    add_medications(run_id, {"A": 10, "B": 10, "C": 10, "BAD": 10, "E": 10})
+    monkeypatch.setattr(settings, "BULK_CHUNK_SIZE", 2)
+    append_txns = bulk.append_txns
+
+    def failing_append(db, rows):
+        # 模拟写流水时数据库出错：库存计数器已在本块内更新，须随整块回滚
+        if any(r["medication_id"] == f"{run_id}-BAD" for r in rows):
+            raise OperationalError("INSERT INTO inventory_txns", {}, Exception("disk full"))
+        append_txns(db, rows)
+
+    monkeypatch.setattr(bulk, "append_txns", failing_append)
+    csv = "\n".join(["medication_id,change,kind,note",
+                     f"{run_id}-A,5,receipt,到货",
+                     f"{run_id}-B,-20,,盘亏",           # 扣减超过库存截为 0
+                     f"{run_id}-C,7,receipt,",
+                     f"{run_id}-BAD,1,receipt,",        # 与上一行同块，整块失败
+                     f"{run_id}-NOPE,1,receipt,",       # 药品不存在
+                     f"{run_id}-E,x,receipt,"]) + "\n"  # change 不是整数
+    r = client.post("/api/medications/bulk-adjust", content=csv.encode(), headers={"Content-Type": "text/csv"})
+    body = r.json()
+
+    assert r.status_code == 200
+    assert (body["total"], body["succeeded"], body["failed"]) == (6, 2, 4)
+    rows = {row["line"]: row for row in body["results"]}
+    assert rows[1] == {"line": 1, "medicationId": f"{run_id}-A", "ok": True, "applied": 5, "stock": 15}
+    assert rows[2]["applied"] == -10 and rows[2]["stock"] == 0
+    assert not rows[3]["ok"] and "disk full" in rows[3]["error"]
+    assert not rows[4]["ok"] and "disk full" in rows[4]["error"]
+    assert rows[5]["error"] == "medication not found"
+    assert rows[6]["error"] == "change must be an integer"
+    assert stocks(run_id) == {"A": 15, "B": 0, "C": 10, "BAD": 10, "E": 10}
+    with SessionLocal() as db:
+        kinds = db.execute(select(InventoryTxnDB.medication_id, InventoryTxnDB.kind, InventoryTxnDB.quantity)
+                           .where(InventoryTxnDB.medication_id.like(f"{run_id}-%"))
+                           .order_by(InventoryTxnDB.medication_id)).all()
+    assert [tuple(k) for k in kinds] == [(f"{run_id}-A", "receipt", 5), (f"{run_id}-B", "adjustment", -10)]
+
+
+@pytest.fixture
+def prescriptions(run_id):
+    add_medications(run_id, {"A": 10})
+    with SessionLocal() as db:
+        db.add(DoctorDB(id=f"{run_id}-D", name="批量医生", department="内科", title="医师"))
+        db.add(PatientDB(id=f"{run_id}-P", name="批量患者", age=30, gender="女", phone="0", status="已完成"))
+        db.flush()
+        for rx, qty in (("RX1", 3), ("RX2", 3), ("BIG", 50)):
+            db.add(PrescriptionDB(id=f"{run_id}-{rx}", patient_id=f"{run_id}-P", doctor_id=f"{run_id}-D",
+                                  status="已开立"))
+            db.flush()
+            db.add(PrescriptionItemDB(prescription_id=f"{run_id}-{rx}", medication_id=f"{run_id}-A",
+                                      med_name="A", dosage="-", quantity=qty))
+        db.commit()
+        # 库存流水上线前的旧处方没有开立时间
+        db.execute(PrescriptionDB.__table__.update().where(PrescriptionDB.id == f"{run_id}-RX2")
+                   .values(created_at=None))
+        db.commit()
+
+
+def test_bulk_dispense_reports_duplicates_and_handles_legacy_rows(client, run_id, prescriptions):
+    ids = [f"{run_id}-{rx}" for rx in ("RX1", "RX2", "RX1", "BIG", "NOPE")]
+    with SessionLocal() as db:
+        stat_before = db.execute(select(func.coalesce(func.sum(DailyPrescriptionStatDB.count), 0))
+                                 .where(DailyPrescriptionStatDB.status == "已发药")).scalar()
+
+    body = client.post("/api/prescriptions/bulk-dispense", json={"ids": ids}).json()
+
+    assert [(r["id"], r["ok"]) for r in body["results"]] == [
+        (ids[0], True), (ids[1], True), (ids[2], False), (ids[3], False), (ids[4], False)]
+    assert body["results"][2]["error"] == "duplicate id in request"
+    assert "库存不足" in body["results"][3]["error"]
+    assert (body["succeeded"], body["failed"]) == (2, 3)
+    # 重复的 ID 只扣一次库存
+    assert stocks(run_id) == {"A": 4}
+    with SessionLocal() as db:
+        stat_after = db.execute(select(func.coalesce(func.sum(DailyPrescriptionStatDB.count), 0))
+                                .where(DailyPrescriptionStatDB.status == "已发药")).scalar()
+    # 没有开立时间的处方照常发药，只是不计入按日状态汇总
+    assert stat_after - stat_before == 1
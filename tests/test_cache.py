@@ -0,0 +1,27 @@
+from sqlalchemy import select
+
+from backend.database import SessionLocal
+from backend.models import MedicationDB
+from backend.schemas import MedicationSchema
+
+
+def test_medication_dictionary_matches_schema_and_revalidates_after_a_write(client, run_id):
+    with SessionLocal() as db:
+        db.add(MedicationDB(id=f"{run_id}-A", name="缓存药", spec="-", stock=7, unit="盒", price=2.5, category="测试"))
+        db.commit()
+        expected = [MedicationSchema.model_validate(m).model_dump() for m in db.execute(select(MedicationDB)).scalars()]
+
+    r = client.get("/api/medications")
+    assert r.status_code == 200
+    assert r.json() == expected
+    etag = r.headers["ETag"]
+    assert client.get("/api/medications", headers={"If-None-Match": etag}).status_code == 304
+
+    r = client.get("/api/medications", params={"fields": "stock,id"})
+    assert {"id": f"{run_id}-A", "stock": 7} in r.json()
+
+    # 库存调整提升版本号，旧 ETag 失效，新响应体带上新库存
+    assert client.patch(f"/api/medications/{run_id}-A", json={"change": 3}).status_code == 200
+    r = client.get("/api/medications", headers={"If-None-Match": etag})
+    assert r.status_code == 200 and r.headers["ETag"] != etag
+    assert {"id": f"{run_id}-A", "stock": 10} in [{"id": m["id"], "stock": m["stock"]} for m in r.json()]
@@ -0,0 +1,114 @@
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Dict, List
+
+from fastapi import HTTPException
+from sqlalchemy import func, select
+
+from backend.database import SessionLocal
+from backend.main import dispense
+from backend.models import DoctorDB, InventoryTxnDB, MedicationDB, PatientDB, PrescriptionDB, PrescriptionItemDB
+
+# 并发用例的总时限；发药事务互相等待（死锁或锁等待超时）时 wait 到期后判定失败
+DEADLINE = 60
+
+
+def seed(run_id: str, stock: Dict[str, int], prescriptions: Dict[str, List[tuple]]):
+    """stock: 药品后缀 -> 期初库存；prescriptions: 处方后缀 -> [(药品后缀, 数量), ...]，明细按给出的顺序写入"""
+    with SessionLocal() as db:
+        db.add(DoctorDB(id=f"{run_id}-D", name="发药医生", department="内科", title="医师"))
+        db.add(PatientDB(id=f"{run_id}-P", name="发药患者", age=30, gender="女", phone="0", status="已完成"))
+        db.add_all(MedicationDB(id=f"{run_id}-{m}", name=f"测试药{m}", spec="-", stock=s, unit="盒", price=1.0,
+                                category="测试") for m, s in stock.items())
+        db.flush()
+        for rx, lines in prescriptions.items():
+            db.add(PrescriptionDB(id=f"{run_id}-{rx}", patient_id=f"{run_id}-P", doctor_id=f"{run_id}-D",
+                                  status="已开立"))
+            db.flush()
+            for m, q in lines:
+                db.add(PrescriptionItemDB(prescription_id=f"{run_id}-{rx}", medication_id=f"{run_id}-{m}",
+                                          med_name=m, dosage="-", quantity=q))
+        db.commit()
+
+
+def call(rxid: str) -> str:
+    """与路由相同的发药入口，每次调用各用一个会话"""
+    with SessionLocal() as db:
+        try:
+            res = dispense(rxid, db)
+        except HTTPException as e:
+            return str(e.status_code)
+    return "repeated" if res.get("repeated") else "dispensed"
+
+
+def run_concurrently(rxids: List[str], workers: int = 8) -> List[str]:
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(call, rx) for rx in rxids]
+        done, pending = wait(futures, timeout=DEADLINE)
+        assert not pending, "发药事务未在时限内完成（疑似死锁）"
+    return [f.result() for f in futures]
+
+
+def stocks(run_id: str) -> Dict[str, int]:
+    with SessionLocal() as db:
+        return {mid.split("-", 1)[1]: s for mid, s in db.execute(
+            select(MedicationDB.id, MedicationDB.stock).where(MedicationDB.id.like(f"{run_id}-%")))}
+
+
+def status(rxid: str) -> str:
+    with SessionLocal() as db:
+        return db.execute(select(PrescriptionDB.status).where(PrescriptionDB.id == rxid)).scalar_one()
+
+
+def test_concurrent_dispense_of_one_prescription_deducts_once(run_id):
+    seed(run_id, {"A": 100, "B": 100}, {"RX": [("A", 3), ("B", 2), ("A", 1)]})
+    rx = f"{run_id}-RX"
+
+    outcomes = run_concurrently([rx] * 16)
+
+    assert outcomes.count("dispensed") == 1
+    assert outcomes.count("repeated") == 15
+    assert stocks(run_id) == {"A": 96, "B": 98}
+    assert status(rx) == "已发药"
+    with SessionLocal() as db:
+        # 流水同样只记一次，同一药品的多行明细合并为一条
+        assert db.execute(select(func.count()).select_from(InventoryTxnDB)
+                          .where(InventoryTxnDB.prescription_id == rx)).scalar() == 2
+
+
+def test_short_stock_is_rejected_without_going_negative(client, run_id):
+    seed(run_id, {"A": 5, "B": 100}, {"RX1": [("B", 1), ("A", 4)], "RX2": [("A", 4), ("B", 1)]})
+
+    assert client.post(f"/api/prescriptions/{run_id}-RX1/dispense").status_code == 200
+    r = client.post(f"/api/prescriptions/{run_id}-RX2/dispense")
+
+    assert r.status_code == 409
+    assert "库存不足" in r.json()["detail"]
+    # 整单回滚：B 的扣减撤销，处方仍为 已开立，可补货后重试
+    assert stocks(run_id) == {"A": 1, "B": 99}
+    assert status(f"{run_id}-RX2") == "已开立"
+
+
+def test_concurrent_dispenses_never_oversell(run_id):
+    # 20 张处方各需 A 3 盒，库存只够 6 张
+    seed(run_id, {"A": 20}, {f"RX{i:02d}": [("A", 3)] for i in range(20)})
+
+    outcomes = run_concurrently([f"{run_id}-RX{i:02d}" for i in range(20)])
+
+    assert outcomes.count("dispensed") == 6
+    assert outcomes.count("409") == 14
+    assert stocks(run_id) == {"A": 2}
+
+
+def test_overlapping_items_in_opposite_order_do_not_deadlock(run_id):
+    # 成对的处方以相反顺序包含相同药品：若按明细顺序加锁，并发时会交叉等待
+    meds = ["A", "B", "C", "D"]
+    prescriptions = {}
+    for i in range(20):
+        order = meds if i % 2 == 0 else meds[::-1]
+        prescriptions[f"RX{i:02d}"] = [(m, 1) for m in order]
+    seed(run_id, {m: 1000 for m in meds}, prescriptions)
+
+    outcomes = run_concurrently([f"{run_id}-{rx}" for rx in prescriptions], workers=10)
+
+    assert outcomes == ["dispensed"] * 20
+    assert stocks(run_id) == {m: 980 for m in meds}
@@ -0,0 +1,74 @@
+import asyncio
+
+from backend.database import SessionLocal
+from backend.events import RESYNC, hub
+from backend.models import PatientDB
+
+
+def register(pid: str, commit: bool):
+    with SessionLocal() as db:
+        db.add(PatientDB(id=pid, name="推送测试", age=50, gender="男", phone="0", status="待诊"))
+        db.flush()  # flush 时登记事件，提交后才广播
+        if commit:
+            db.commit()
+        else:
+            db.rollback()
+
+
+async def settle():
+    # publish 经 call_soon_threadsafe 投递，让出几轮事件循环使回调执行完
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def drain(sub) -> list:
+    out = []
+    while not sub.queue.empty():
+        out.append(sub.queue.get_nowait())
+    return out
+
+
+def mine(messages: list, run_id: str) -> list:
+    return [m for m in messages if str(m.get("id", "")).startswith(run_id)]
+
+
+def test_committed_change_fans_out_and_rollback_publishes_nothing(run_id):
+    async def scenario():
+        subs = [hub.subscribe(), hub.subscribe(["patient"]), hub.subscribe(["prescription"])]
+        try:
+            # 写入在线程池中执行，与同步路由相同，事件跨线程投递到订阅方循环
+            await asyncio.to_thread(register, f"{run_id}-ROLLBACK", False)
+            await asyncio.to_thread(register, f"{run_id}-COMMIT", True)
+            await settle()
+            return [mine(drain(s), run_id) for s in subs]
+        finally:
+            for s in subs:
+                hub.unsubscribe(s)
+
+    everything, patients, prescriptions = asyncio.run(scenario())
+
+    for received in (everything, patients):
+        assert [(m["topic"], m["id"]) for m in received] == [("patient.registered", f"{run_id}-COMMIT")]
+    assert prescriptions == []
+
+
+def test_slow_subscriber_overflows_without_blocking_others(run_id, monkeypatch):
+    async def scenario():
+        fast = hub.subscribe(["patient"])
+        monkeypatch.setattr(hub, "queue_size", 2)
+        slow = hub.subscribe(["patient"])
+        try:
+            for i in range(5):
+                await asyncio.to_thread(register, f"{run_id}-{i}", True)
+            await settle()
+            return drain(fast), slow, drain(slow)
+        finally:
+            hub.unsubscribe(fast)
+            hub.unsubscribe(slow)
+
+    fast_messages, slow, slow_messages = asyncio.run(scenario())
+
+    # 快的订阅方收到全部事件；慢的积压被丢弃，只留一条要求重新同步的消息
+    assert [m["id"] for m in mine(fast_messages, run_id)] == [f"{run_id}-{i}" for i in range(5)]
+    assert slow_messages == [{"topic": RESYNC}]
+    assert slow.overflowed
@@ -0,0 +1,76 @@
+import os
+
+import pytest
+from sqlalchemy import select
+
+from backend.database import SessionLocal
+from backend.init_db import IMPORTS, import_file
+from backend.models import InventoryTxnDB, MedicationDB
+
+
+def write_csv(tmp_dir: str, run_id: str, stock: dict) -> str:
+    path = os.path.join(tmp_dir, f"formulary-{run_id}.csv")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("id,name,spec,unit,price,category,stock\n")
+        for m, s in stock.items():
+            f.write(f"{run_id}-{m},导入药{m},-,盒,1.5,测试,{s}\n")
+    return path
+
+
+def imported(run_id: str):
+    """{药品后缀: 库存}, {药品后缀: [入库流水数量]}"""
+    with SessionLocal() as db:
+        stocks = {mid.split("-", 1)[1]: s for mid, s in db.execute(
+            select(MedicationDB.id, MedicationDB.stock).where(MedicationDB.id.like(f"{run_id}-%")))}
+        receipts = {}
+        for mid, qty in db.execute(select(InventoryTxnDB.medication_id, InventoryTxnDB.quantity)
+                                   .where(InventoryTxnDB.medication_id.like(f"{run_id}-%"),
+                                          InventoryTxnDB.kind == "receipt")):
+            receipts.setdefault(mid.split("-", 1)[1], []).append(qty)
+    return stocks, receipts
+
+
+def test_interrupted_import_resumes_from_checkpoint_with_one_receipt_per_new_medication(tmp_dir, run_id, monkeypatch):
+    stock = {"A": 10, "B": 20, "C": 0, "D": 40, "E": 50}
+    path = write_csv(tmp_dir, run_id, stock)
+    convert, keys, write = IMPORTS["medications"]
+
+    def crash_on_d(db, rows):
+        # 第二块提交前中断
+        if any(r["id"] == f"{run_id}-D" for r in rows):
+            raise KeyboardInterrupt
+        return write(db, rows)
+
+    monkeypatch.setitem(IMPORTS, "medications", (convert, keys, crash_on_d))
+    with pytest.raises(KeyboardInterrupt):
+        import_file("medications", path, chunk_size=2)
+    assert imported(run_id)[0] == {"A": 10, "B": 20}
+    assert os.path.exists(path + ".progress")
+
+    # 重新执行从断点继续，已提交的块不再写入
+    written = []
+
+    def recording(db, rows):
+        written.extend(r["id"] for r in rows)
+        return write(db, rows)
+
+    monkeypatch.setitem(IMPORTS, "medications", (convert, keys, recording))
+    assert import_file("medications", path, chunk_size=2) == {"rows": 5, "rejected": 0}
+    assert written == [f"{run_id}-{m}" for m in "CDE"]
+    assert not os.path.exists(path + ".progress")
+
+    stocks, receipts = imported(run_id)
+    assert stocks == stock
+    # 期初库存为 0 的药品不记流水
+    assert receipts == {m: [s] for m, s in stock.items() if s}
+
+
+def test_reimport_does_not_touch_stock_or_add_receipts(tmp_dir, run_id):
+    path = write_csv(tmp_dir, run_id, {"A": 10})
+    import_file("medications", path)
+    with SessionLocal() as db:
+        db.execute(MedicationDB.__table__.update().where(MedicationDB.id == f"{run_id}-A").values(stock=3))
+        db.commit()
+
+    import_file("medications", path, restart=True)
+    assert imported(run_id) == ({"A": 3}, {"A": [10]})
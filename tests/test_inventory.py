@@ -0,0 +1,75 @@
+import time
+from datetime import datetime, timedelta
+
+from backend.database import SessionLocal
+from backend.inventory import consumption, stock_at, take_snapshot
+from backend.models import DoctorDB, MedicationDB, PatientDB, PrescriptionDB, PrescriptionItemDB
+
+# MySQL DATETIME 精确到秒，两次操作之间留出超过 1 秒的间隔才能在时间轴上区分
+TICK = 1.1
+
+
+def seed(run_id: str) -> str:
+    """一种期初库存为 0 的药品，以及一张开 30 盒的处方"""
+    mid = f"{run_id}-M"
+    with SessionLocal() as db:
+        db.add(DoctorDB(id=f"{run_id}-D", name="流水医生", department="内科", title="医师"))
+        db.add(PatientDB(id=f"{run_id}-P", name="流水患者", age=30, gender="男", phone="0", status="已完成"))
+        db.add(MedicationDB(id=mid, name="流水测试药", spec="-", stock=0, unit="盒", price=1.0, category="测试"))
+        db.flush()
+        db.add(PrescriptionDB(id=f"{run_id}-RX", patient_id=f"{run_id}-P", doctor_id=f"{run_id}-D", status="已开立"))
+        db.flush()
+        db.add(PrescriptionItemDB(prescription_id=f"{run_id}-RX", medication_id=mid, med_name="流水测试药",
+                                  dosage="-", quantity=30))
+        db.commit()
+    return mid
+
+
+def now() -> datetime:
+    return datetime.now().replace(microsecond=0)
+
+
+def test_ledger_balance_stock_at_and_consumption(client, run_id):
+    mid = seed(run_id)
+    start = now() - timedelta(seconds=1)
+    time.sleep(TICK)
+
+    assert client.patch(f"/api/medications/{mid}", json={"change": 100, "kind": "receipt"}).json()["stock"] == 100
+    time.sleep(TICK)
+    after_receipt = now()
+    time.sleep(TICK)
+    assert client.post(f"/api/prescriptions/{run_id}-RX/dispense").status_code == 200
+    assert client.patch(f"/api/medications/{mid}", json={"change": -5, "note": "盘亏"}).json()["stock"] == 65
+    time.sleep(TICK)
+    end = now()
+
+    r = client.get("/api/inventory/ledger", params={"medication_id": mid})
+    ledger = [(t["kind"], t["quantity"], t["balanceAfter"]) for t in reversed(r.json())]
+    # 每条流水的结存 = 上一条结存 + 变化量，最后一条与计数器一致
+    assert ledger == [("receipt", 100, 100), ("dispense", -30, 70), ("adjustment", -5, 65)]
+    assert r.json()[0]["prescriptionId"] is None and r.json()[1]["prescriptionId"] == f"{run_id}-RX"
+
+    def at(t: datetime) -> int:
+        r = client.get("/api/inventory/stock-at", params={"at": t.isoformat(), "medication_id": mid})
+        return r.json()[0]["stock"]
+
+    assert (at(start), at(after_receipt), at(end)) == (0, 100, 65)
+    with SessionLocal() as db:
+        assert consumption(db, start, end)[mid] == {"received": 100, "dispensed": 30, "adjusted": -5}
+
+
+def test_snapshots_do_not_change_answers(run_id):
+    mid = seed(run_id)
+    with SessionLocal() as db:
+        before = stock_at(db, datetime.now())
+        period = (datetime.now() - timedelta(days=1), datetime.now() + timedelta(minutes=30))
+        totals = consumption(db, *period)
+        # 截止时间在所有流水之后的两期快照：之后的时点库存从快照出发，区间统计直接累加第二期
+        for minutes in (10, 20):
+            take_snapshot(db, now=datetime.now() + timedelta(minutes=minutes))
+        db.flush()
+
+        assert stock_at(db, datetime.now() + timedelta(minutes=6)) == before
+        assert stock_at(db, datetime.now(), [mid]) == {mid: 0}
+        assert consumption(db, *period) == totals
+        db.rollback()  # 未来时刻的快照只在本事务内使用，不留给其他用例
@@ -0,0 +1,80 @@
+from sqlalchemy.exc import OperationalError
+
+from backend import prescribing
+from backend.database import SessionLocal
+from backend.models import DoctorDB, DrugInteractionDB, MedicationDB, PatientDB
+from backend.prescribing import InteractionIndex, interaction_index
+
+
+def seed(run_id: str, stock: dict, interactions=()):
+    """stock: 药品后缀 -> 库存；interactions: [(药品后缀, 药品后缀, 严重程度)]"""
+    with SessionLocal() as db:
+        db.add(DoctorDB(id=f"{run_id}-D", name="开方医生", department="内科", title="医师"))
+        db.add(PatientDB(id=f"{run_id}-P", name="开方患者", age=30, gender="男", phone="0", status="待诊"))
+        db.add_all(MedicationDB(id=f"{run_id}-{m}", name=f"开方药{m}", spec="-", stock=s, unit="盒", price=1.0,
+                                category="测试") for m, s in stock.items())
+        db.flush()
+        db.add_all(DrugInteractionDB(med_a=f"{run_id}-{a}", med_b=f"{run_id}-{b}", severity=sev, note="测试")
+                   for a, b, sev in interactions)
+        db.commit()
+        # 相互作用表变化由后台线程探测，测试中直接重建
+        interaction_index.load(db)
+
+
+def rx(run_id: str, rid: str, lines: dict, patient: str = "P") -> dict:
+    return {"id": f"{run_id}-{rid}", "patientId": f"{run_id}-{patient}", "doctorId": f"{run_id}-D",
+            "createdAt": "", "status": "已开立",
+            "medications": [{"medicationId": f"{run_id}-{m}", "name": f"开方药{m}", "dosage": "-", "quantity": q}
+                            for m, q in lines.items()]}
+
+
+def test_contraindicated_pair_is_rejected_and_caution_is_a_warning(client, run_id):
+    seed(run_id, {"A": 10, "B": 10, "C": 10}, [("A", "B", "禁忌"), ("A", "C", "慎用")])
+
+    r = client.post("/api/prescriptions", json=rx(run_id, "RX1", {"A": 1, "B": 1}))
+    assert r.status_code == 409
+    assert [(e["type"], e["severity"]) for e in r.json()["detail"]["errors"]] == [("interaction", "禁忌")]
+
+    r = client.post("/api/prescriptions", json=rx(run_id, "RX2", {"A": 1, "C": 1}))
+    assert r.status_code == 200
+    assert [(w["medicationIds"], w["severity"]) for w in r.json()["warnings"]] == \
+        [([f"{run_id}-A", f"{run_id}-C"], "慎用")]
+
+
+def test_open_prescriptions_reserve_stock(client, run_id):
+    seed(run_id, {"A": 5})
+    assert client.post("/api/prescriptions", json=rx(run_id, "RX1", {"A": 4})).status_code == 200
+
+    # 库存仍为 5，但 4 盒已被未发药处方占用
+    r = client.post("/api/prescriptions", json=rx(run_id, "RX2", {"A": 2}))
+    assert r.status_code == 409
+    assert r.json()["detail"]["errors"] == [{"type": "stock", "medicationId": f"{run_id}-A", "name": "开方药A",
+                                             "requested": 2, "available": 1}]
+
+
+def test_unknown_patient_is_404_and_duplicate_id_is_409(client, run_id):
+    seed(run_id, {"A": 10})
+    assert client.post("/api/prescriptions", json=rx(run_id, "RX1", {"A": 1}, patient="NOBODY")).status_code == 404
+
+    assert client.post("/api/prescriptions", json=rx(run_id, "RX1", {"A": 1})).status_code == 200
+    r = client.post("/api/prescriptions", json=rx(run_id, "RX1", {"A": 1}))
+    assert r.status_code == 409
+    assert r.json()["detail"] == "Prescription already exists"
+
+
+def test_interaction_check_fails_closed_when_the_table_never_loaded(client, run_id, monkeypatch):
+    seed(run_id, {"A": 10, "B": 10}, [("A", "B", "禁忌")])
+
+    # 从未加载过的索引在首次校验时补加载，禁忌配伍照样拦截
+    monkeypatch.setattr(prescribing, "interaction_index", InteractionIndex())
+    assert client.post("/api/prescriptions", json=rx(run_id, "RX1", {"A": 1, "B": 1})).status_code == 409
+
+    # 加载失败时拒绝开方，而不是按空表放行
+    broken = InteractionIndex()
+
+    def unavailable(db):
+        raise OperationalError("SELECT count(*) FROM drug_interactions", {}, Exception("no such table"))
+
+    monkeypatch.setattr(broken, "load", unavailable)
+    monkeypatch.setattr(prescribing, "interaction_index", broken)
+    assert client.post("/api/prescriptions", json=rx(run_id, "RX2", {"A": 1, "B": 1})).status_code == 503
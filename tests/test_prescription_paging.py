@@ -0,0 +1,75 @@
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import event
+
+from backend.database import SessionLocal, engine
+from backend.models import DoctorDB, PatientDB, PrescriptionDB, PrescriptionItemDB
+
+TOTAL = 30
+
+
+@pytest.fixture
+def doctor(run_id):
+    """一名医生名下 TOTAL 张处方，每张 2 条明细，开立时间各不相同"""
+    start = datetime.now().replace(microsecond=0)
+    with SessionLocal() as db:
+        db.add(DoctorDB(id=f"{run_id}-D", name="分页医生", department="内科", title="医师"))
+        db.add(PatientDB(id=f"{run_id}-P", name="分页患者", age=30, gender="男", phone="0", status="已完成"))
+        db.flush()
+        for i in range(TOTAL):
+            rx = f"{run_id}-RX{i:03d}"
+            db.add(PrescriptionDB(id=rx, patient_id=f"{run_id}-P", doctor_id=f"{run_id}-D", status="已开立",
+                                  created_at=start - timedelta(minutes=i)))
+            db.add_all(PrescriptionItemDB(prescription_id=rx, medication_id=m, med_name=m, dosage="-", quantity=1)
+                       for m in ("M001", "M002"))
+        db.commit()
+    return f"{run_id}-D"
+
+
+@pytest.fixture
+def statements():
+    captured = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        captured.append(statement)
+
+    event.listen(engine, "before_cursor_execute", record)
+    yield captured
+    event.remove(engine, "before_cursor_execute", record)
+
+
+def get_page(client, doctor, limit, cursor=None):
+    params = {"doctor_id": doctor, "limit": limit}
+    if cursor:
+        params["cursor"] = cursor
+    r = client.get("/api/prescriptions", params=params)
+    assert r.status_code == 200
+    return r
+
+
+@pytest.mark.parametrize("limit", [5, 20, 100])
+def test_one_page_costs_two_statements(client, doctor, statements, limit):
+    get_page(client, doctor, 1)  # 预热：首次取连接时方言初始化的语句不计入
+    statements.clear()
+    body = get_page(client, doctor, limit).json()
+
+    assert len(body) == min(limit, TOTAL)
+    assert all(len(rx["medications"]) == 2 for rx in body)
+    # 一条分页查询 + 一条批量取整页明细的 IN 查询，与页大小无关
+    assert len(statements) == 2, statements
+    assert "prescription_items" not in statements[0]
+    assert "prescription_items" in statements[1]
+
+
+def test_next_cursor_round_trip(client, doctor):
+    everything = [rx["id"] for rx in get_page(client, doctor, TOTAL).json()]
+    first = get_page(client, doctor, 12)
+    second = get_page(client, doctor, 12, first.headers["X-Next-Cursor"])
+    third = get_page(client, doctor, 12, second.headers["X-Next-Cursor"])
+
+    pages = [[rx["id"] for rx in r.json()] for r in (first, second, third)]
+    assert [len(p) for p in pages] == [12, 12, 6]
+    # 按开立时间从新到旧连续衔接，无重复、无遗漏
+    assert pages[0] + pages[1] + pages[2] == everything
+    assert "X-Next-Cursor" not in third.headers
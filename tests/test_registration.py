@@ -0,0 +1,64 @@
+import pytest
+from sqlalchemy.exc import IntegrityError
+
+from backend import registration
+from backend.database import SessionLocal
+from backend.models import PatientDB
+from backend.registration import RegistrationBatcher
+from backend.schemas import PatientSchema
+
+TIMEOUT = 30
+
+
+def payload(run_id: str, name: str) -> PatientSchema:
+    return PatientSchema(id="", name=f"{run_id}-{name}", age=30, gender="女", phone="0", registerTime="",
+                         status="待诊", department="内科")
+
+
+def test_cancelled_waiter_does_not_stop_the_writer(run_id):
+    batcher = RegistrationBatcher()
+    gone = batcher.submit(payload(run_id, "gone"))
+    gone.cancel()  # 等待方已断开，写线程取到时 Future 已是取消状态
+    kept = batcher.submit(payload(run_id, "kept"))
+    batcher.start(SessionLocal)
+    try:
+        assert kept.result(timeout=TIMEOUT)["status"] == "ok"
+        # 写线程仍在运行，之后的挂号照常返回
+        later = batcher.submit(payload(run_id, "later")).result(timeout=TIMEOUT)
+        assert later["status"] == "ok"
+    finally:
+        batcher.stop()
+
+    with SessionLocal() as db:
+        names = {n for (n,) in db.query(PatientDB.name).filter(PatientDB.name.like(f"{run_id}-%"))}
+    assert names == {f"{run_id}-kept", f"{run_id}-later"}
+
+
+def test_failing_registration_does_not_fail_the_rest_of_its_batch(run_id, monkeypatch):
+    real = registration.register_patients
+
+    def rejecting(db, payloads, server_ids):
+        patients = real(db, payloads, server_ids)
+        # 模拟数据库拒绝其中一条挂号：整批事务失败
+        if any(p.name.endswith("-bad") for p in payloads):
+            raise IntegrityError("INSERT INTO patients", {}, Exception("rejected"))
+        return patients
+
+    monkeypatch.setattr(registration, "register_patients", rejecting)
+    batcher = RegistrationBatcher()
+    # 写线程启动前入队，三条在同一批内
+    futures = {name: batcher.submit(payload(run_id, name)) for name in ("first", "bad", "last")}
+    batcher.start(SessionLocal)
+    try:
+        first, last = (futures[n].result(timeout=TIMEOUT) for n in ("first", "last"))
+        with pytest.raises(IntegrityError):
+            futures["bad"].result(timeout=TIMEOUT)
+    finally:
+        batcher.stop()
+
+    assert first["id"] != last["id"]
+    # 失败整批的序号预留随回滚撤销，逐条重试后的序号仍然连续
+    assert last["queueNo"] == first["queueNo"] + 1
+    with SessionLocal() as db:
+        names = {n for (n,) in db.query(PatientDB.name).filter(PatientDB.name.like(f"{run_id}-%"))}
+    assert names == {f"{run_id}-first", f"{run_id}-last"}
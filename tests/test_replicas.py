@@ -0,0 +1,72 @@
+import os
+import time
+
+import pytest
+
+from backend import database
+from backend.database import Base, SessionLocal, _sync_engine
+from backend.models import PatientDB
+from backend.replicas import PRIMARY_UNTIL_HEADER, Replica, ReplicaSet, wants_primary
+
+
+@pytest.fixture
+def replica(tmp_dir, run_id, monkeypatch):
+    """第二个 SQLite 文件充当只读副本，与主库各放一名同科室的患者以区分读到的是哪个库"""
+    engine = _sync_engine(f"sqlite:///{os.path.join(tmp_dir, f'replica-{run_id}.db')}")
+    Base.metadata.create_all(bind=engine)
+    dept = f"{run_id}-科"
+    for bind, pid in ((engine, f"{run_id}-ON-REPLICA"), (database.engine, f"{run_id}-ON-PRIMARY")):
+        with SessionLocal(bind=bind) as db:
+            db.add(PatientDB(id=pid, name="副本测试", age=40, gender="男", phone="0", status="待诊", department=dept))
+            db.commit()
+    r = Replica("replica-test", engine)
+    monkeypatch.setattr(database, "replicas", ReplicaSet([r]))
+    yield r, dept
+    engine.dispose()
+
+
+def listed(client, dept, headers=None):
+    r = client.get("/api/patients", params={"department": dept}, headers=headers or {})
+    assert r.status_code == 200
+    return {p["id"] for p in r.json()}
+
+
+def test_reads_go_to_replica(client, run_id, replica):
+    _, dept = replica
+    assert listed(client, dept) == {f"{run_id}-ON-REPLICA"}
+
+
+def test_write_then_read_with_header_uses_primary(client, run_id, replica):
+    _, dept = replica
+    r = client.post("/api/patients", json={
+        "id": f"{run_id}-NEW", "name": "刚挂号", "age": 20, "gender": "女", "phone": "1", "registerTime": "",
+        "status": "待诊", "department": dept})
+    assert r.status_code == 200
+    until = r.headers[PRIMARY_UNTIL_HEADER]
+
+    # 带回响应头的读请求看到刚写入的行；不带时仍读副本（副本尚未复制到这条挂号）
+    assert listed(client, dept, {PRIMARY_UNTIL_HEADER: until}) == {f"{run_id}-ON-PRIMARY", f"{run_id}-NEW"}
+    assert listed(client, dept) == {f"{run_id}-ON-REPLICA"}
+
+
+def test_unhealthy_replica_falls_back_to_primary(client, run_id, replica):
+    r, dept = replica
+    r.mark_down("test")
+    assert listed(client, dept) == {f"{run_id}-ON-PRIMARY"}
+
+
+def test_forged_far_future_header_is_ignored(client, run_id, replica):
+    _, dept = replica
+    far = str(int((time.time() + 365 * 86400) * 1000))
+    assert listed(client, dept, {PRIMARY_UNTIL_HEADER: far}) == {f"{run_id}-ON-REPLICA"}
+
+
+@pytest.mark.parametrize("offset_ms, expected", [
+    (-1000, False),      # 已过期
+    (1000, True),        # 有效期内
+    (10 ** 9, False),    # 超出 REPLICA_STICKY_SECONDS 的远期值
+])
+def test_wants_primary_window(offset_ms, expected):
+    value = str(int(time.time() * 1000 + offset_ms))
+    assert wants_primary({PRIMARY_UNTIL_HEADER.lower(): value}) is expected
+    assert wants_primary({PRIMARY_UNTIL_HEADER.lower(): "not-a-number"}) is False
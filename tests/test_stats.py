@@ -0,0 +1,80 @@
+from datetime import date
+
+from sqlalchemy import select
+
+from backend.database import SessionLocal
+from backend.models import (DailyDispenseStatDB, DailyPatientStatDB, DailyPrescriptionStatDB, DoctorDB, MedicationDB,
+                            PatientDB)
+from backend.stats import rebuild, stats
+
+ROLLUPS = (DailyPatientStatDB, DailyPrescriptionStatDB, DailyDispenseStatDB)
+
+
+def rollups(db) -> dict:
+    """三张汇总表的全部非零行"""
+    out = {}
+    for model in ROLLUPS:
+        table = model.__table__
+        keys = [c for c in table.primary_key.columns]
+        values = [c for c in table.c if c not in keys]
+        for row in db.execute(select(*keys, *values)):
+            key, vals = tuple(row[:len(keys)]), tuple(round(v, 2) for v in row[len(keys):])
+            if any(vals):
+                out[table.name, key] = vals
+    return out
+
+
+def today_stats() -> dict:
+    with SessionLocal() as db:
+        return stats(db, date.today(), date.today(), top=100)
+
+
+def count(s: dict, group: str, status: str) -> int:
+    return s[group]["byStatus"].get(status, 0)
+
+
+def test_rollups_follow_writes_and_match_rebuild(client, run_id):
+    with SessionLocal() as db:
+        rebuild(db)  # 以业务表为准校正基线，之前用例直接写库留下的偏差不影响本用例
+        db.add(DoctorDB(id=f"{run_id}-D", name="看板医生", department="内科", title="医师"))
+        db.add(MedicationDB(id=f"{run_id}-M", name="看板药", spec="-", stock=100, unit="盒", price=2.5,
+                            category=f"{run_id}-类"))
+        db.commit()
+    before = today_stats()
+
+    pid = f"{run_id}-P"
+    assert client.post("/api/patients", json={"id": pid, "name": "看板患者", "age": 30, "gender": "女", "phone": "0",
+                                              "registerTime": "", "status": "待诊"}).status_code == 200
+    registered = today_stats()
+    assert count(registered, "patients", "待诊") == count(before, "patients", "待诊") + 1
+
+    assert client.patch(f"/api/patients/{pid}", json={"status": "就诊中"}).status_code == 200
+    rx = {"id": f"{run_id}-RX", "patientId": pid, "doctorId": f"{run_id}-D", "createdAt": "", "status": "已开立",
+          "medications": [{"medicationId": f"{run_id}-M", "name": "看板药", "dosage": "-", "quantity": 3}]}
+    assert client.post("/api/prescriptions", json=rx).status_code == 200
+    prescribed = today_stats()
+    # 开方时患者随之结束就诊：就诊中 -> 已完成
+    assert count(prescribed, "patients", "待诊") == count(before, "patients", "待诊")
+    assert count(prescribed, "patients", "已完成") == count(before, "patients", "已完成") + 1
+    assert count(prescribed, "prescriptions", "已开立") == count(before, "prescriptions", "已开立") + 1
+
+    assert client.post(f"/api/prescriptions/{run_id}-RX/dispense").status_code == 200
+    dispensed = today_stats()
+    assert count(dispensed, "prescriptions", "已开立") == count(before, "prescriptions", "已开立")
+    assert count(dispensed, "prescriptions", "已发药") == count(before, "prescriptions", "已发药") + 1
+    assert dispensed["dispensed"]["quantity"] == before["dispensed"]["quantity"] + 3
+    assert {"category": f"{run_id}-类", "quantity": 3, "revenue": 7.5} in dispensed["dispensed"]["byCategory"]
+
+    # 没有挂号时间的旧数据（绕过 ORM 直接写入）：改状态不计入汇总，与重建结果一致
+    with SessionLocal() as db:
+        db.execute(PatientDB.__table__.insert().values(id=f"{run_id}-OLD", name="旧患者", age=60, gender="男",
+                                                       phone="0", status="待诊", register_time=None))
+        db.commit()
+        db.get(PatientDB, f"{run_id}-OLD").status = "已完成"
+        db.commit()
+
+    with SessionLocal() as db:
+        incremental = rollups(db)
+        rebuild(db)
+        assert rollups(db) == incremental
+        db.rollback()
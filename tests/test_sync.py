@@ -0,0 +1,93 @@
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, select
+
+from backend import sync
+from backend.database import SessionLocal
+from backend.models import PatientDB, SyncPendingDB
+from backend.sync import current_version, next_version
+
+
+def patient(pid: str) -> PatientDB:
+    return PatientDB(id=pid, name="同步测试", age=30, gender="男", phone="0", status="待诊")
+
+
+def register(*pids: str):
+    with SessionLocal() as db:
+        db.add_all(patient(pid) for pid in pids)
+        db.commit()
+
+
+def baseline(client) -> int:
+    return client.get("/api/sync").json()["version"]
+
+
+def delta(client, since: int, **params) -> dict:
+    r = client.get("/api/sync", params={"since": since, **params})
+    assert r.status_code == 200
+    return r.json()
+
+
+def mine(body: dict, run_id: str) -> list:
+    return sorted(p["id"] for p in body.get("patients", []) if p["id"].startswith(run_id))
+
+
+def test_delta_is_paged_without_splitting_a_version(client, run_id):
+    since = baseline(client)
+    register(f"{run_id}-0")
+    register(f"{run_id}-1")
+    register(f"{run_id}-2a", f"{run_id}-2b", f"{run_id}-2c")  # 一个事务、一个版本
+    register(f"{run_id}-3")
+
+    pages = []
+    while True:
+        body = delta(client, since, limit=2)
+        pages.append(mine(body, run_id))
+        since = body["version"]
+        if not body["more"]:
+            break
+
+    assert pages == [[f"{run_id}-0", f"{run_id}-1"], [f"{run_id}-2a", f"{run_id}-2b", f"{run_id}-2c"],
+                     [f"{run_id}-3"]]
+
+
+def test_high_water_mark_waits_for_in_flight_versions(client, run_id, monkeypatch):
+    # 走独立短事务取号的路径（MySQL 等）；SQLite 只允许一个写事务，先取号再写业务行
+    monkeypatch.setattr(sync, "_IN_TRANSACTION", False)
+    since = baseline(client)
+
+    with SessionLocal() as db:
+        v = next_version(db)
+        db.add(patient(f"{run_id}-SLOW"))
+        db.flush()
+        # 取号已提交但所属事务未结束：高水位停在它之前，本页不含该版本
+        body = delta(client, since)
+        assert body["version"] == v - 1
+        assert mine(body, run_id) == []
+        db.commit()
+
+    body = delta(client, since)
+    assert body["version"] >= v
+    assert mine(body, run_id) == [f"{run_id}-SLOW"]
+
+    with SessionLocal() as db:
+        next_version(db)
+        db.add(patient(f"{run_id}-ROLLBACK"))
+        db.flush()
+        db.rollback()
+        # 回滚后撤销登记，高水位不被卡住
+        assert db.execute(select(func.count()).select_from(SyncPendingDB)).scalar() == 0
+    assert mine(delta(client, since), run_id) == [f"{run_id}-SLOW"]
+
+
+def test_abandoned_pending_version_is_reaped(client, monkeypatch):
+    monkeypatch.setattr(sync, "_last_reap", float("-inf"))
+    with SessionLocal() as db:
+        top = current_version(db)
+        # 进程崩溃遗留的登记：所属事务已不存在
+        db.add(SyncPendingDB(version=top, created_at=datetime.now() - timedelta(hours=1)))
+        db.commit()
+
+        assert current_version(db) == top - 1
+        db.rollback()  # 结束读事务，读到清理后的状态
+        assert current_version(db) == top
@@ -18,6 +18,7 @@ export interface Patient {
   status: '待诊' | '就诊中' | '已完成' | '待缴费';
   symptoms?: string;
   diagnosis?: string;
+  queueNo?: number; // 当日挂号序号，服务端分配
 }
 
 export interface Medication {
@@ -44,7 +45,48 @@ export interface Prescription {
   status: '已开立' | '已缴费' | '已发药';
 }
 
+// 开方校验（POST /api/prescriptions?dry_run=true 或 409 的 detail）
+export interface PrescriptionIssue {
+  type: 'stock' | 'unknown' | 'quantity' | 'interaction';
+  medicationId?: string;
+  medicationIds?: string[];
+  name?: string;
+  requested?: number;
+  available?: number;
+  severity?: '禁忌' | '慎用';
+  note?: string | null;
+}
+
+export interface PrescriptionCheck {
+  ok: boolean;
+  errors: PrescriptionIssue[];
+  warnings: PrescriptionIssue[];
+}
+
 export interface InventoryItem extends Medication {
   minStock: number;
   supplier: string;
 }
+
+// GET /api/stats：按天汇总的挂号 / 处方 / 发药统计与低库存计数
+export interface StatusCount {
+  total: number;
+  byStatus: Record<string, number>;
+}
+
+export interface DispenseStat {
+  medicationId?: string;
+  name?: string;
+  category?: string;
+  quantity: number;
+  revenue: number;
+}
+
+export interface Stats {
+  dateFrom: string;
+  dateTo: string;
+  patients: StatusCount & { completionRate: number };
+  prescriptions: StatusCount;
+  dispensed: { quantity: number; revenue: number; byMedication: DispenseStat[]; byCategory: DispenseStat[] };
+  lowStock: { warning: number; critical: number; warningThreshold: number; criticalThreshold: number };
+}
@@ -1,6 +1,7 @@
 
 import React from 'react';
 import { BarChart, Bar, XAxis, YAxis, CartesianGrid, Tooltip, ResponsiveContainer, LineChart, Line, AreaChart, Area } from 'recharts';
+import { useAppContext } from '../context/AppContext';
 
 const data = [
   { name: '08:00', patients: 12, revenue: 1200 },
@@ -12,13 +13,15 @@ const data = [
 ];
 
 const Dashboard: React.FC = () => {
+  const { stats } = useAppContext();
+
   return (
     <div className="space-y-6 animate-fadeIn">
        <div className="grid grid-cols-1 md:grid-cols-2 lg:grid-cols-4 gap-6">
           {[
-            { label: '今日就诊人数', value: '185', diff: '+12%', color: 'from-blue-600 to-blue-400', icon: 'fa-user-check' },
-            { label: '门诊流水收入', value: '¥ 24,580', diff: '+8%', color: 'from-emerald-600 to-emerald-400', icon: 'fa-hand-holding-dollar' },
-            { label: '药房待领药品', value: '12', diff: '-2', color: 'from-amber-600 to-amber-400', icon: 'fa-pills' },
+            { label: '今日就诊人数', value: String(stats?.patients.total ?? 0), diff: '+12%', color: 'from-blue-600 to-blue-400', icon: 'fa-user-check' },
+            { label: '门诊流水收入', value: `¥ ${(stats?.dispensed.revenue ?? 0).toLocaleString()}`, diff: '+8%', color: 'from-emerald-600 to-emerald-400', icon: 'fa-hand-holding-dollar' },
+            { label: '药房待领药品', value: String(stats?.prescriptions.byStatus['已开立'] ?? 0), diff: '-2', color: 'from-amber-600 to-amber-400', icon: 'fa-pills' },
             { label: '平均接诊时长', value: '14.5 min', diff: '-5%', color: 'from-indigo-600 to-indigo-400', icon: 'fa-hourglass-half' },
           ].map((stat, i) => (
             <div key={i} className={`relative overflow-hidden bg-gradient-to-br ${stat.color} p-6 rounded-3xl shadow-lg shadow-blue-100/50`}>
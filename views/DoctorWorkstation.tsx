@@ -1,8 +1,9 @@
 
-import React, { useState } from 'react';
-import { Patient, Prescription, Medication } from '../types';
+import React, { useEffect, useState } from 'react';
+import { Patient, Prescription, Medication, PrescriptionCheck, PrescriptionIssue } from '../types';
 import { getMedicalAdvice } from '../services/geminiService';
 import { useAppContext } from '../context/AppContext';
+import { api } from '../services/apiService';
 
 const DoctorWorkstation: React.FC = () => {
   const { patients, medications, addPrescription, updatePatient } = useAppContext();
@@ -12,6 +13,38 @@ const DoctorWorkstation: React.FC = () => {
   const [aiLoading, setAiLoading] = useState(false);
   const [aiAdvice, setAiAdvice] = useState<any>(null);
   const [prescriptions, setPrescriptions] = useState<any[]>([]);
+  const [query, setQuery] = useState('');
+  const [searchResults, setSearchResults] = useState<Patient[] | null>(null);
+
+  // 输入停顿后再请求检索接口；清空搜索框恢复候诊队列
+  useEffect(() => {
+    const q = query.trim();
+    if (!q) {
+      setSearchResults(null);
+      return;
+    }
+    let stale = false;
+    const timer = setTimeout(() => {
+      api.searchPatients(q).then(rows => { if (!stale) setSearchResults(rows); }).catch(() => {});
+    }, 200);
+    return () => { stale = true; clearTimeout(timer); };
+  }, [query]);
+
+  const listedPatients = searchResults ?? patients.filter(p => p.status !== '已完成');
+
+  const [medQuery, setMedQuery] = useState('');
+  const [medSuggestions, setMedSuggestions] = useState<Medication[] | null>(null);
+
+  useEffect(() => {
+    const q = medQuery.trim();
+    if (!q) {
+      setMedSuggestions(null);
+      return;
+    }
+    let stale = false;
+    api.suggestMedications(q, 8).then(rows => { if (!stale) setMedSuggestions(rows); }).catch(() => {});
+    return () => { stale = true; };
+  }, [medQuery]);
   
   // Mobile View Tabs: 'patients' | 'record' | 'prescription'
   const [activeTab, setActiveTab] = useState<'patients' | 'record' | 'prescription'>('record');
@@ -41,7 +74,10 @@ const DoctorWorkstation: React.FC = () => {
       alert(`药品 "${medName}" 不在药库清单中，请手动录入或联系药库。`);
       return;
     }
-    
+    addMedication(med);
+  };
+
+  const addMedication = (med: Medication) => {
     // 检查是否已添加
     if (prescriptions.find(p => p.medicationId === med.id)) return;
 
@@ -54,19 +90,47 @@ const DoctorWorkstation: React.FC = () => {
     }]);
   };
 
-  const handleCommit = () => {
-    if (!selectedPatient || prescriptions.length === 0) return;
+  const buildPrescription = (patient: Patient): Prescription => ({
+    id: `RX${Date.now().toString().slice(-6)}`,
+    patientId: patient.id,
+    doctorId: 'DOC001',
+    medications: prescriptions,
+    createdAt: new Date().toLocaleString(),
+    status: '已开立'
+  });
+
+  // 编辑处方时预校验库存与配伍（dry_run，不写入）
+  const [check, setCheck] = useState<PrescriptionCheck | null>(null);
+  useEffect(() => {
+    if (!selectedPatient || prescriptions.length === 0) {
+      setCheck(null);
+      return;
+    }
+    let stale = false;
+    const timer = setTimeout(() => {
+      api.checkPrescription(buildPrescription(selectedPatient)).then(res => { if (!stale) setCheck(res); }).catch(() => {});
+    }, 300);
+    return () => { stale = true; clearTimeout(timer); };
+  }, [prescriptions, selectedPatient]);
 
-    const newPres: Prescription = {
-      id: `RX${Date.now().toString().slice(-6)}`,
-      patientId: selectedPatient.id,
-      doctorId: 'DOC001',
-      medications: prescriptions,
-      createdAt: new Date().toLocaleString(),
-      status: '已开立'
-    };
+  const describeIssue = (issue: PrescriptionIssue) => {
+    if (issue.type === 'stock') return `${issue.name} 库存不足：需 ${issue.requested}，可用 ${issue.available}`;
+    if (issue.type === 'unknown') return `${issue.name} 不在药品字典中`;
+    if (issue.type === 'quantity') return `${issue.name} 数量须大于 0`;
+    const names = (issue.medicationIds || []).map(id => prescriptions.find(p => p.medicationId === id)?.name || id);
+    return `${names.join(' + ')} ${issue.severity}${issue.note ? `：${issue.note}` : ''}`;
+  };
 
-    addPrescription(newPres);
+  const handleCommit = async () => {
+    if (!selectedPatient || prescriptions.length === 0) return;
+
+    try {
+      await addPrescription(buildPrescription(selectedPatient));
+    } catch (e: any) {
+      if (e.check) setCheck(e.check);
+      alert('处方未通过校验，请按提示调整后再开立。');
+      return;
+    }
     updatePatient(selectedPatient.id, { symptoms, diagnosis, status: '已完成' });
     
     // Reset state
@@ -83,11 +147,11 @@ const DoctorWorkstation: React.FC = () => {
       <div className="p-4 border-b border-slate-100 bg-slate-50">
         <div className="relative">
           <i className="fas fa-search absolute left-3 top-1/2 -translate-y-1/2 text-slate-400"></i>
-          <input type="text" placeholder="搜索患者" className="w-full pl-10 pr-4 py-2 rounded-lg border border-slate-200 text-sm focus:ring-2 focus:ring-blue-500" />
+          <input type="text" placeholder="姓名 / 电话尾号 / 拼音首字母" value={query} onChange={e => setQuery(e.target.value)} className="w-full pl-10 pr-4 py-2 rounded-lg border border-slate-200 text-sm focus:ring-2 focus:ring-blue-500" />
         </div>
       </div>
       <div className="flex-1 overflow-y-auto max-h-[60vh] lg:max-h-full">
-        {patients.filter(p => p.status !== '已完成').map(p => (
+        {listedPatients.map(p => (
           <div 
             key={p.id}
             onClick={() => {
@@ -108,8 +172,8 @@ const DoctorWorkstation: React.FC = () => {
             </div>
           </div>
         ))}
-        {patients.filter(p => p.status !== '已完成').length === 0 && (
-          <div className="p-8 text-center text-slate-400 text-sm">暂无待诊患者</div>
+        {listedPatients.length === 0 && (
+          <div className="p-8 text-center text-slate-400 text-sm">{searchResults ? '未找到匹配的患者' : '暂无待诊患者'}</div>
         )}
       </div>
     </div>
@@ -216,16 +280,23 @@ const DoctorWorkstation: React.FC = () => {
             <div className="flex-1 overflow-y-auto overflow-x-hidden">
               <div className="bg-slate-50 p-3 md:p-4 rounded-xl mb-4">
                  <p className="text-xs text-slate-500 uppercase font-bold mb-3 tracking-wider">快捷选药</p>
+                 <input
+                   type="text"
+                   placeholder="药名 / 拼音首字母 / 分类 / 规格"
+                   value={medQuery}
+                   onChange={e => setMedQuery(e.target.value)}
+                   className="w-full mb-2 px-3 py-2 rounded-lg border border-slate-200 text-sm focus:ring-2 focus:ring-emerald-500"
+                 />
                  <div className="grid grid-cols-2 gap-2">
-                    {medications.slice(0, 4).map(m => (
+                    {(medSuggestions ?? medications.slice(0, 4)).map(m => (
                       <button 
                         key={m.id}
-                        onClick={() => addToPrescription(m.name)}
+                        onClick={() => addMedication(m)}
                         disabled={!selectedPatient}
                         className="p-2 bg-white border border-slate-200 rounded-lg text-xs text-slate-700 hover:border-emerald-500 transition-all text-left disabled:opacity-50"
                       >
                         <div className="font-bold truncate">{m.name}</div>
-                        <div className="text-[10px] text-slate-400">{m.spec}</div>
+                        <div className="text-[10px] text-slate-400">{m.spec} · 库存 {m.stock}</div>
                       </button>
                     ))}
                  </div>
@@ -249,12 +320,18 @@ const DoctorWorkstation: React.FC = () => {
                 {prescriptions.length === 0 && (
                   <div className="text-center py-8 text-slate-400 text-sm italic">暂未添加药品</div>
                 )}
+                {check && [...check.errors, ...check.warnings].map((issue, i) => (
+                  <div key={`issue-${i}`} className={`text-xs p-2 rounded-lg ${i < check.errors.length ? 'bg-red-50 text-red-600' : 'bg-amber-50 text-amber-700'}`}>
+                    <i className={`fas ${i < check.errors.length ? 'fa-ban' : 'fa-exclamation-triangle'} mr-1`}></i>
+                    {describeIssue(issue)}
+                  </div>
+                ))}
               </div>
             </div>
             <div className="mt-4 pt-4 border-t border-slate-100">
               <button 
                 onClick={handleCommit}
-                disabled={!selectedPatient || prescriptions.length === 0}
+                disabled={!selectedPatient || prescriptions.length === 0 || (check !== null && !check.ok)}
                 className="w-full py-3 rounded-xl bg-emerald-600 text-white font-bold shadow-lg hover:bg-emerald-700 disabled:opacity-50"
               >
                 完成开立处方
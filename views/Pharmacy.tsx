@@ -3,7 +3,7 @@ import React from 'react';
 import { useAppContext } from '../context/AppContext';
 
 const Pharmacy: React.FC = () => {
-  const { prescriptions, patients, dispenseMedication } = useAppContext();
+  const { prescriptions, patients, stats, truncated, dispenseMedication } = useAppContext();
 
   const getPatientName = (pid: string) => patients.find(p => p.id === pid)?.name || '未知患者';
 
@@ -14,15 +14,21 @@ const Pharmacy: React.FC = () => {
           <div className="flex flex-wrap gap-2 md:gap-4 w-full md:w-auto">
              <div className="flex-1 md:flex-initial bg-white px-4 py-2 rounded-xl border border-slate-200 flex items-center gap-2 md:gap-3">
                 <span className="w-2 h-2 md:w-3 md:h-3 bg-amber-500 rounded-full animate-pulse"></span>
-                <span className="text-[10px] md:text-sm font-bold text-slate-600 whitespace-nowrap">待发: {prescriptions.filter(p => p.status === '已开立').length}</span>
+                <span className="text-[10px] md:text-sm font-bold text-slate-600 whitespace-nowrap">待发: {stats?.prescriptions.byStatus['已开立'] ?? 0}</span>
              </div>
              <div className="flex-1 md:flex-initial bg-white px-4 py-2 rounded-xl border border-slate-200 flex items-center gap-2 md:gap-3">
                 <span className="w-2 h-2 md:w-3 md:h-3 bg-emerald-500 rounded-full"></span>
-                <span className="text-[10px] md:text-sm font-bold text-slate-600 whitespace-nowrap">已完: {prescriptions.filter(p => p.status === '已发药').length}</span>
+                <span className="text-[10px] md:text-sm font-bold text-slate-600 whitespace-nowrap">已完: {stats?.prescriptions.byStatus['已发药'] ?? 0}</span>
              </div>
           </div>
        </div>
 
+       {truncated && (
+          <div className="bg-amber-50 border border-amber-200 text-amber-700 rounded-xl px-4 py-2 text-xs md:text-sm">
+             <i className="fas fa-exclamation-triangle mr-2"></i>处方过多，仅显示部分待处理处方，请先处理后刷新
+          </div>
+       )}
+
        <div className="grid grid-cols-1 sm:grid-cols-2 lg:grid-cols-3 gap-4 md:gap-6">
           {prescriptions.map((item) => (
             <div key={item.id} className={`bg-white rounded-2xl border p-4 md:p-6 shadow-sm transition-all duration-300 ${item.status === '已开立' ? 'border-amber-200 shadow-amber-50' : 'border-slate-100 opacity-60'}`}>
@@ -4,7 +4,7 @@ import { Patient } from '../types';
 import { useAppContext } from '../context/AppContext';
 
 const Registration: React.FC = () => {
-  const { patients, addPatient } = useAppContext();
+  const { patients, stats, addPatient } = useAppContext();
   const [showModal, setShowModal] = useState(false);
   const [newPatient, setNewPatient] = useState({ name: '', gender: '男' as '男' | '女', age: '', phone: '' });
 
@@ -38,10 +38,10 @@ const Registration: React.FC = () => {
 
       <div className="grid grid-cols-1 sm:grid-cols-2 lg:grid-cols-4 gap-4">
         {[
-          { label: '今日挂号', value: patients.length.toString(), icon: 'fa-users', color: 'bg-blue-500' },
-          { label: '待就诊', value: patients.filter(p => p.status === '待诊').length.toString(), icon: 'fa-clock', color: 'bg-amber-500' },
-          { label: '已完成', value: patients.filter(p => p.status === '已完成').length.toString(), icon: 'fa-check-circle', color: 'bg-emerald-500' },
-          { label: '今日就诊率', value: `${Math.round((patients.filter(p => p.status === '已完成').length / (patients.length || 1)) * 100)}%`, icon: 'fa-chart-pie', color: 'bg-indigo-500' },
+          { label: '今日挂号', value: String(stats?.patients.total ?? 0), icon: 'fa-users', color: 'bg-blue-500' },
+          { label: '待就诊', value: String(stats?.patients.byStatus['待诊'] ?? 0), icon: 'fa-clock', color: 'bg-amber-500' },
+          { label: '已完成', value: String(stats?.patients.byStatus['已完成'] ?? 0), icon: 'fa-check-circle', color: 'bg-emerald-500' },
+          { label: '今日就诊率', value: `${Math.round((stats?.patients.completionRate ?? 0) * 100)}%`, icon: 'fa-chart-pie', color: 'bg-indigo-500' },
         ].map((stat, i) => (
           <div key={i} className="bg-white p-4 md:p-6 rounded-2xl shadow-sm border border-slate-100 flex items-center space-x-4">
             <div className={`${stat.color} w-10 h-10 md:w-12 md:h-12 rounded-xl flex items-center justify-center text-white shadow-lg shrink-0`}>
@@ -71,7 +71,10 @@ const Registration: React.FC = () => {
             <tbody className="divide-y divide-slate-100">
               {patients.map((p) => (
                 <tr key={p.id} className="hover:bg-slate-50 transition-colors">
-                  <td className="px-6 py-4 text-sm font-medium text-blue-600">#{p.id}</td>
+                  <td className="px-6 py-4 text-sm font-medium text-blue-600">
+                    #{p.id}
+                    {p.queueNo != null && <span className="ml-2 text-xs text-slate-400">{p.queueNo}号</span>}
+                  </td>
                   <td className="px-6 py-4 text-sm font-bold text-slate-800">{p.name}</td>
                   <td className="px-6 py-4 text-sm text-slate-600">{p.gender} / {p.age}岁</td>
                   <td className="px-6 py-4 text-sm text-slate-50">{p.registerTime}</td>